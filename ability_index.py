@@ -0,0 +1,76 @@
+from base_economics import TurnAction, SpellTurnAction
+import numpy as np
+
+indexed_attrs = ["roll_type", "DC_type", "action_time", "spell_level", "damage_type"]
+
+
+class AbilityIndex:
+    # One boolean mask per (attribute, value) over the abilities in map order,
+    # so a filter is an OR over its values and filters combine with &.
+    # An ability matches a value when its attribute equals it; "all" matches
+    # every ability, and abilities without the attribute (spell_level on a
+    # plain TurnAction) match no other value.
+    def __init__(self, ability_map: dict):
+        self.ability_names = list(ability_map.keys())
+        self.name_array = np.array(self.ability_names, dtype = object)
+        self.n_abilities = len(ability_map)
+        self.all_mask = np.ones(self.n_abilities, dtype = bool)
+        self.none_mask = np.zeros(self.n_abilities, dtype = bool)
+
+        self.masks = {x: {} for x in indexed_attrs}
+        for i, ability in enumerate(ability_map.values()):
+            if type(ability) not in (TurnAction, SpellTurnAction):
+                raise ValueError("action must be of type either TurnAction or SpellTurnAction.")
+            for attr_name in indexed_attrs:
+                if not hasattr(ability, attr_name):
+                    continue
+                attr_masks = self.masks[attr_name]
+                attr_value = getattr(ability, attr_name)
+                if attr_value not in attr_masks:
+                    attr_masks[attr_value] = np.zeros(self.n_abilities, dtype = bool)
+                attr_masks[attr_value][i] = True
+
+    def __len__(self):
+        return self.n_abilities
+
+    def matches(self, ability_map: dict):
+        return len(ability_map) == self.n_abilities and list(ability_map.keys()) == self.ability_names
+
+    def attr_mask(self, attr_name: str, attr_filters: list):
+        if type(attr_filters) is not list:
+            attr_filters = [attr_filters]
+        if "all" in attr_filters:
+            return self.all_mask
+
+        attr_masks = self.masks[attr_name]
+        combined_mask = self.none_mask.copy()
+        for attr_filter in attr_filters:
+            if attr_filter in attr_masks:
+                combined_mask |= attr_masks[attr_filter]
+        return combined_mask
+
+    def filter_mask(self,
+                    roll_filter: str = "all",
+                    action_time_filter: list[str] = ["all"],
+                    spell_level_filter = ["all"],
+                    damage_type_filter: list[str] = ["all"]):
+        if roll_filter == "AC":
+            roll_mask = self.attr_mask("roll_type", "hit")
+        else:
+            roll_mask = self.attr_mask("DC_type", roll_filter)
+
+        return roll_mask & self.attr_mask("action_time", action_time_filter) & \
+            self.attr_mask("spell_level", spell_level_filter) & \
+            self.attr_mask("damage_type", damage_type_filter)
+
+
+def top_k_positions(values: np.ndarray, n_options: int):
+    # Positions of the n_options largest values in ascending order, the same
+    # ordering as sort_values()[-n_options:]
+    if n_options <= 0:
+        return np.zeros(0, dtype = int)
+    if len(values) > n_options:
+        candidate_idx = np.argpartition(values, len(values) - n_options)[-n_options:]
+    else:
+        candidate_idx = np.arange(len(values))
+    return candidate_idx[np.argsort(values[candidate_idx], kind = "stable")]
@@ -0,0 +1,104 @@
+from base_economics import (TurnAction, SpellTurnAction, shared_dice, shared_status_effect)
+from fixed_names import action_times, damage_types, DC_types, roll_types
+import numpy as np
+
+# Columns holding integer codes into the name lists, -1 for None
+coded_columns = {"action_time": action_times,
+                 "roll_type": roll_types,
+                 "DC_type": DC_types,
+                 "damage_type": damage_types}
+# Non-negative counts, -1 for None
+count_columns = ["n_damage_die", "flat_damage", "n_hit_rolls", "n_uses", "damage_die", "spell_level"]
+# Unchecked numbers, NaN for None
+value_columns = ["hit_bonus", "DC", "utility"]
+flag_columns = ["is_combat", "half_damage_on_fail", "is_spell"]
+
+
+class AbilityTable:
+    # Struct-of-arrays view of an ability map: one small array per field in
+    # map order, with damage dice stored by face count and statuses as codes
+    # into status_names. Rows turn back into TurnActions with ability().
+    def __init__(self, ability_map: dict):
+        self.names = list(ability_map.keys())
+        n_abilities = len(self.names)
+
+        self.columns = {x: np.full(n_abilities, -1, dtype = np.int8) for x in coded_columns}
+        self.columns.update({x: np.full(n_abilities, -1, dtype = np.int32) for x in count_columns})
+        self.columns.update({x: np.full(n_abilities, np.nan) for x in value_columns})
+        self.columns.update({x: np.zeros(n_abilities, dtype = bool) for x in flag_columns})
+        self.columns["imposed_status"] = np.full(n_abilities, -1, dtype = np.int16)
+        self.status_names = []
+
+        status_codes = {}
+        for i, ability in enumerate(ability_map.values()):
+            if type(ability) not in (TurnAction, SpellTurnAction):
+                raise ValueError("action must be of type either TurnAction or SpellTurnAction.")
+
+            for attr_name in coded_columns:
+                self.columns[attr_name][i] = getattr(ability, "%s_code" % attr_name)
+            for attr_name in ["n_damage_die", "flat_damage", "n_hit_rolls", "n_uses"]:
+                attr_value = getattr(ability, attr_name)
+                if attr_value is not None:
+                    self.columns[attr_name][i] = attr_value
+            for attr_name in value_columns:
+                attr_value = getattr(ability, attr_name)
+                if attr_value is not None:
+                    self.columns[attr_name][i] = attr_value
+
+            if ability.damage_die is not None:
+                self.columns["damage_die"][i] = ability.damage_die.n
+            if ability.imposed_status is not None:
+                status_name = ability.imposed_status.name
+                if status_name not in status_codes:
+                    status_codes[status_name] = len(self.status_names)
+                    self.status_names.append(status_name)
+                self.columns["imposed_status"][i] = status_codes[status_name]
+
+            self.columns["is_combat"][i] = bool(ability.is_combat)
+            self.columns["half_damage_on_fail"][i] = bool(ability.half_damage_on_fail)
+            if type(ability) is SpellTurnAction:
+                self.columns["is_spell"][i] = True
+                self.columns["spell_level"][i] = ability.spell_level
+
+    def __len__(self):
+        return len(self.names)
+
+    def __getitem__(self, column_name: str):
+        return self.columns[column_name]
+
+    def matches(self, ability_map: dict):
+        return len(ability_map) == len(self.names) and list(ability_map.keys()) == self.names
+
+    def nbytes(self):
+        return sum([x.nbytes for x in self.columns.values()])
+
+    def decoded(self, column_name: str):
+        # Names instead of codes for one coded column
+        names = coded_columns[column_name]
+        return [None if x < 0 else names[x] for x in self.columns[column_name]]
+
+    def decoded_array(self, column_name: str):
+        # decoded() as an object array; code -1 picks the trailing None
+        return np.array(coded_columns[column_name] + [None], dtype = object)[self.columns[column_name]]
+
+    def ability(self, ability_idx: int):
+        row = {x: self.columns[x][ability_idx] for x in self.columns}
+        ability_kwargs = {"name": self.names[ability_idx],
+                          "is_combat": bool(row["is_combat"]),
+                          "half_damage_on_fail": bool(row["half_damage_on_fail"])}
+        for attr_name, names in coded_columns.items():
+            ability_kwargs[attr_name] = None if row[attr_name] < 0 else names[row[attr_name]]
+        for attr_name in ["n_damage_die", "flat_damage", "n_hit_rolls", "n_uses"]:
+            ability_kwargs[attr_name] = None if row[attr_name] < 0 else int(row[attr_name])
+        for attr_name in value_columns:
+            attr_value = row[attr_name]
+            ability_kwargs[attr_name] = None if np.isnan(attr_value) else \
+                int(attr_value) if attr_value == int(attr_value) else float(attr_value)
+        ability_kwargs["damage_die"] = None if row["damage_die"] < 0 else \
+            shared_dice(int(row["damage_die"]))
+        ability_kwargs["imposed_status"] = None if row["imposed_status"] < 0 else \
+            shared_status_effect(self.status_names[row["imposed_status"]])
+
+        if row["is_spell"]:
+            return SpellTurnAction(spell_level = int(row["spell_level"]), **ability_kwargs)
+        return TurnAction(**ability_kwargs)
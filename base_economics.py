@@ -1,10 +1,15 @@
 from abc import ABC
-from errors import BadArgumentFromListErrorCheck, NonNegativeIntegerCheck
-from fixed_names import damage_types, DC_types, roll_types, action_times
+from errors import BadArgumentFromMapErrorCheck, NonNegativeIntegerCheck
+from fixed_names import (damage_types, DC_types, roll_types, action_times, damage_type_codes,
+                         DC_type_codes, roll_type_codes, action_time_codes)
+from functools import lru_cache
+import numpy as np
 from random import randint
 
 
 class BaseResource(ABC):
+    __slots__ = ("used",)
+
     def __init__(self):
         super().__init__()
         self.used = False
@@ -17,6 +22,8 @@ class BaseResource(ABC):
         
 
 class SpellSlot(BaseResource):
+    __slots__ = ("level",)
+
     def __init__(self, level: int):
         super().__init__()
 
@@ -24,8 +31,10 @@ class SpellSlot(BaseResource):
 
 
 class SpellSlotLevel:
+    __slots__ = ("slots",)
+
     def __init__(self, level: int, n_slots: int):
-        self.slots = [SpellSlot(level)] * n_slots
+        self.slots = [SpellSlot(level) for _ in range(n_slots)]
 
     def __repr__(self):
         return "  ".join(["[X]" if x.used else "[ ]" for x in self.slots])
@@ -49,11 +58,15 @@ class SpellSlotLevel:
 
 
 class InventoryItem(BaseResource):
+    __slots__ = ()
+
     def __init__(self):
         super().__init__()
 
 
 class Dice(ABC):
+    __slots__ = ("n", "expected_value", "variance")
+
     def __init__(self, n: int):
         super().__init__()
         self.n = n
@@ -69,8 +82,14 @@ class Dice(ABC):
         else:
             return self.expected_value
 
+    def pmf(self):
+        # Index is the rolled value, so pmf()[0] is always 0
+        return np.concatenate([[0], np.full(self.n, 1/self.n)])
+
 
 class StatusEffect(ABC):
+    __slots__ = ("name",)
+
     def __init__(self, 
                  name: str):
         super().__init__()
@@ -80,7 +99,58 @@ class StatusEffect(ABC):
         return self.name
 
 
+@lru_cache(maxsize = None)
+def shared_dice(n: int):
+    # Dice and StatusEffect never change after construction, so sheet loads
+    # hand every ability the same instance
+    return Dice(n)
+
+
+@lru_cache(maxsize = None)
+def shared_status_effect(name: str):
+    return StatusEffect(name)
+
+
+class CodedAttribute:
+    # A name from a fixed list, stored as its integer code in the
+    # "<attribute>_code" slot (-1 for None when optional)
+    def __init__(self, names: list[str], codes: dict, optional: bool = False):
+        self.names = names
+        self.codes = codes
+        self.optional = optional
+
+    def __set_name__(self, owner, attr_name):
+        self.code_attr = "%s_code" % attr_name
+
+    def __get__(self, instance, owner = None):
+        if instance is None:
+            return self
+        code = getattr(instance, self.code_attr)
+        return None if code < 0 else self.names[code]
+
+    def __set__(self, instance, value):
+        if value is None and self.optional:
+            setattr(instance, self.code_attr, -1)
+        else:
+            setattr(instance, self.code_attr, BadArgumentFromMapErrorCheck(value, self.codes))
+
+
 class TurnAction(BaseResource):
+    __slots__ = ("name", "action_time_code", "n_uses", "is_combat", "roll_type_code",
+                 "hit_bonus", "imposed_status", "half_damage_on_fail", "utility", "DC",
+                 "damage_die", "DC_type_code", "n_damage_die", "flat_damage", "n_hit_rolls",
+                 "damage_type_code")
+
+    field_names = ("name", "action_time", "is_combat", "roll_type", "damage_die",
+                   "n_damage_die", "flat_damage", "half_damage_on_fail", "n_hit_rolls",
+                   "damage_type", "n_uses", "utility", "imposed_status", "hit_bonus",
+                   "DC", "DC_type")
+
+    action_time = CodedAttribute(action_times, action_time_codes)
+    roll_type = CodedAttribute(roll_types, roll_type_codes)
+    DC_type = CodedAttribute(DC_types, DC_type_codes, optional = True)
+    damage_type = CodedAttribute(damage_types, damage_type_codes, optional = True)
+
     def __init__(self,
                  name: str,
                  action_time: str,
@@ -101,15 +171,11 @@ class TurnAction(BaseResource):
         super().__init__()
 
         self.name = name
-
-        BadArgumentFromListErrorCheck(action_time, action_times)
-        self.action_time = action_time
+        self.action_time_code = BadArgumentFromMapErrorCheck(action_time, action_time_codes)
         
         self.n_uses = self.validate_numeric_argument(n_uses)
         self.is_combat = is_combat
-
-        BadArgumentFromListErrorCheck(roll_type, roll_types)
-        self.roll_type = roll_type
+        self.roll_type_code = BadArgumentFromMapErrorCheck(roll_type, roll_type_codes)
         self.hit_bonus = hit_bonus
         self.imposed_status = imposed_status
         self.half_damage_on_fail = half_damage_on_fail
@@ -117,11 +183,13 @@ class TurnAction(BaseResource):
         self.DC = DC
 
         self.damage_die = None if damage_die is None else damage_die
-        self.DC_type = self.validate_alpha_argument(DC_type, DC_types)
+        self.DC_type_code = -1 if DC_type is None else \
+            BadArgumentFromMapErrorCheck(DC_type, DC_type_codes)
         self.n_damage_die = self.validate_numeric_argument(n_damage_die)
         self.flat_damage = self.validate_numeric_argument(flat_damage)
         self.n_hit_rolls = self.validate_numeric_argument(n_hit_rolls)
-        self.damage_type = self.validate_alpha_argument(damage_type, damage_types)
+        self.damage_type_code = -1 if damage_type is None else \
+            BadArgumentFromMapErrorCheck(damage_type, damage_type_codes)
 
 
     def __repr__(self):
@@ -169,12 +237,9 @@ class TurnAction(BaseResource):
             NonNegativeIntegerCheck(passed_argument)
             return passed_argument
 
-    def validate_alpha_argument(self, passed_argument, possible_arguments):
-        if passed_argument is None:
-            return None
-        else:
-            BadArgumentFromListErrorCheck(passed_argument, possible_arguments)
-            return passed_argument
+    def field_items(self):
+        # (field, value) pairs, what vars() listed before the class had slots
+        return [(x, getattr(self, x)) for x in self.field_names]
         
     def execute_action(self, simulated: bool = False):
         if self.damage_die is not None:
@@ -182,6 +247,10 @@ class TurnAction(BaseResource):
 
 
 class SpellTurnAction(TurnAction):
+    __slots__ = ("spell_level",)
+
+    field_names = TurnAction.field_names + ("spell_level",)
+
     def __init__(self,
                  spell_level: int,
                  **kwargs):
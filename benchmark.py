@@ -0,0 +1,317 @@
+from character import Character
+from fixed_names import damage_types, DC_types, action_times
+from hit_calculations import build_hit_stat_table, retrieve_batched_table_maxes, retrieve_table_maxes
+import argparse
+import csv
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import warnings
+
+sheet_columns = ["name", "action_time", "is_combat", "roll_type", "damage_die",
+                 "n_damage_die", "flat_damage", "half_damage_on_fail", "n_hit_rolls",
+                 "damage_type", "n_uses", "utility", "imposed_status", "hit_bonus",
+                 "DC", "DC_type", "spell_level", "IS_SPELL"]
+
+synthetic_character = {
+    "name": "Benchmark",
+    "strength": 10,
+    "dexterity": 14,
+    "constitution": 14,
+    "intelligence": 12,
+    "wisdom": 12,
+    "charisma": 20,
+    "hp": 120,
+    "proficiency_bonus": 6,
+    "ac": 16,
+    "st_proficiencies": ["CON", "CHA"],
+    "spell_slots": {"1": 4, "2": 3, "3": 3, "4": 3, "5": 3, "6": 2, "7": 2, "8": 1, "9": 1}
+}
+
+synthetic_target = {
+    "name": "target",
+    "strength": 18,
+    "dexterity": 12,
+    "constitution": 16,
+    "intelligence": 8,
+    "wisdom": 12,
+    "charisma": 10,
+    "hp": 150,
+    "proficiency_bonus": 4,
+    "ac": 17,
+    "st_proficiencies": ["STR", "CON"],
+    "resistances": ["Fire", "Poison"],
+    "vulnerabilities": ["Radiant"],
+    "immunities": ["Necrotic"]
+}
+
+# Run in a fresh interpreter per repeat, so nothing is imported yet
+startup_script = """
+import sys, time
+start = time.perf_counter()
+sys.path.insert(0, %r)
+import minmax_ui
+imported = time.perf_counter()
+if %r:
+    minmax_ui.prewarm_app()
+prewarmed = time.perf_counter()
+client = minmax_ui.app.test_client()
+client.get("/")
+first_page = time.perf_counter()
+client.post("/load_character_sheet", data = {"chosen_char_sheet": "bench"})
+first_load = time.perf_counter()
+client.get("/")
+second_page = time.perf_counter()
+print(imported - start, prewarmed - imported, first_page - prewarmed, first_load - first_page,
+      second_page - first_load)
+"""
+
+filter_sets = {
+    "all": {},
+    "actions_only": {"action_time_filter": ["A"]},
+    "action_or_bonus": {"action_time_filter": ["A", "B"]},
+    "fire_cold": {"damage_type_filter": ["Fire", "Cold"]},
+    "cantrips_and_first": {"spell_level_filter": [0, 1]},
+}
+
+
+def synthetic_ability_rows(n_abilities: int, seed: int = 0):
+    rng = random.Random(seed)
+    for i in range(n_abilities):
+        roll_type = rng.choice(["hit", "save", "no_roll"])
+        is_spell = rng.random() < 0.6
+        yield {"name": "Ability %s" % i,
+               "action_time": rng.choice(action_times),
+               "is_combat": True,
+               "roll_type": roll_type,
+               "damage_die": rng.choice([4, 6, 8, 10, 12]),
+               "n_damage_die": rng.randint(1, 10),
+               "flat_damage": rng.choice(["", 0, 2, 4, 5]),
+               "half_damage_on_fail": roll_type == "save" and rng.random() < 0.5,
+               "n_hit_rolls": rng.randint(1, 3),
+               "damage_type": rng.choice(damage_types[:-1]),
+               "n_uses": rng.choice(["", "", 1, 3]),
+               "utility": rng.choice(["", 0, 1, 3]),
+               "imposed_status": rng.choice(["", "", "Prone", "Frightened"]),
+               "hit_bonus": rng.randint(3, 14) if roll_type == "hit" else "",
+               "DC": rng.randint(12, 21) if roll_type == "save" else "",
+               "DC_type": rng.choice(DC_types) if roll_type == "save" else "",
+               "spell_level": rng.randint(0, 9) if is_spell else 0,
+               "IS_SPELL": is_spell}
+
+
+def write_synthetic_sheet(file_path: str, n_abilities: int, seed: int = 0):
+    with open(file_path, "w", newline = "") as f:
+        writer = csv.DictWriter(f, sheet_columns)
+        writer.writeheader()
+        writer.writerows(synthetic_ability_rows(n_abilities, seed))
+    return file_path
+
+
+def time_stage(stage_func, repeat: int):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        stage_func()
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    stage_func()
+    _, peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {"min_s": min(timings),
+            "median_s": statistics.median(timings),
+            "mean_s": statistics.mean(timings),
+            "repeat": repeat,
+            "peak_bytes": peak_bytes}
+
+
+def benchmark_size(n_abilities: int,
+                   repeat: int,
+                   work_dir: str,
+                   scalar_limit: int,
+                   seed: int = 0):
+    sheet_path = write_synthetic_sheet(os.path.join(work_dir, "bench_%s.csv" % n_abilities),
+                                       n_abilities, seed = seed)
+    target = Character(**synthetic_target)
+    character = Character(**synthetic_character)
+    character.add_abilities_from_csv(sheet_path)
+    results = []
+
+    def add_result(stage: str, stage_func, units: int):
+        stage_result = time_stage(stage_func, repeat)
+        stage_result.update({"stage": stage,
+                             "size": n_abilities,
+                             "throughput_per_s": units / stage_result["median_s"]
+                             if stage_result["median_s"] > 0 else None})
+        results.append(stage_result)
+        print("%-34s n=%-6s median %9.3f ms  peak %8.1f KiB" % (stage, n_abilities,
+                                                                stage_result["median_s"] * 1000,
+                                                                stage_result["peak_bytes"] / 1024))
+
+    def load_sheet(use_compiled: bool):
+        Character(**synthetic_character).add_abilities_from_csv(sheet_path,
+                                                                use_compiled = use_compiled)
+
+    add_result("csv_load_pandas", lambda: load_sheet(False), n_abilities)
+    add_result("csv_load_compiled", lambda: load_sheet(True), n_abilities)
+
+    n_check_values = 61
+    tables = {}
+    for stat in ["phit", "ehit", "econ"]:
+        add_result("table_build_%s" % stat,
+                   lambda: build_hit_stat_table(target, character, stat),
+                   n_abilities * n_check_values)
+        if n_abilities <= scalar_limit:
+            add_result("table_build_%s_scalar" % stat,
+                       lambda: build_hit_stat_table(target, character, stat, vectorized = False),
+                       n_abilities * n_check_values)
+        tables[stat] = build_hit_stat_table(target, character, stat)
+
+    for filter_name, filter_kwargs in filter_sets.items():
+        def retrieve_all_rolls():
+            for calc_table in tables.values():
+                for roll_filter in ["AC"] + DC_types:
+                    check_value = target.AC if roll_filter == "AC" else target.st_modifiers[roll_filter]
+                    retrieve_table_maxes(calc_table, character.abilities,
+                                         check_value = check_value,
+                                         roll_filter = roll_filter,
+                                         n_options = 3,
+                                         ability_index = character.get_ability_index(),
+                                         **filter_kwargs)
+        add_result("table_maxes_%s" % filter_name, retrieve_all_rolls, 3 * (1 + len(DC_types)))
+
+        roll_check_values = {x: target.st_modifiers[x] for x in DC_types}
+        roll_check_values["AC"] = target.AC
+        add_result("table_maxes_batched_%s" % filter_name,
+                   lambda: retrieve_batched_table_maxes(tables, character.abilities,
+                                                        roll_check_values = roll_check_values,
+                                                        n_options = 3,
+                                                        ability_index = character.get_ability_index(),
+                                                        **filter_kwargs),
+                   3 * (1 + len(DC_types)))
+
+    return results
+
+
+def benchmark_startup(repeat: int,
+                      work_dir: str,
+                      n_abilities: int = 100,
+                      seed: int = 0):
+    # Cold import of minmax_ui, the first and second GET / and the first
+    # character load, against a sheet directory holding one synthetic sheet,
+    # without and with prewarm_app run between import and first request
+    app_dir = os.path.join(work_dir, "startup")
+    for sheet_dir in ["character_details", "character_actionsheets"]:
+        os.makedirs(os.path.join(app_dir, sheet_dir), exist_ok = True)
+    with open(os.path.join(app_dir, "character_details", "bench.json"), "w") as f:
+        json.dump(synthetic_character, f)
+    write_synthetic_sheet(os.path.join(app_dir, "character_actionsheets", "bench.csv"),
+                          n_abilities, seed = seed)
+
+    repo_dir = os.path.dirname(os.path.abspath(__file__))
+    results = []
+    for prewarm in [False, True]:
+        timings = []
+        for _ in range(repeat):
+            script_output = subprocess.run([sys.executable, "-c",
+                                            startup_script % (repo_dir, prewarm)],
+                                           cwd = app_dir, capture_output = True, text = True,
+                                           check = True).stdout
+            timings.append([float(x) for x in script_output.strip().splitlines()[-1].split()])
+
+        for stage_idx, stage in enumerate(["import", "prewarm", "first_page", "first_load",
+                                           "second_page"]):
+            if stage == "prewarm" and not prewarm:
+                continue
+            stage_timings = [x[stage_idx] for x in timings]
+            results.append({"stage": ("startup_prewarmed_%s" if prewarm else "startup_%s") % stage,
+                            "size": n_abilities,
+                            "min_s": min(stage_timings),
+                            "median_s": statistics.median(stage_timings),
+                            "mean_s": statistics.mean(stage_timings),
+                            "repeat": repeat,
+                            "peak_bytes": None,
+                            "throughput_per_s": None})
+            print("%-34s n=%-6s median %9.3f ms" % (results[-1]["stage"], n_abilities,
+                                                   results[-1]["median_s"] * 1000))
+    return results
+
+
+def run_benchmarks(sizes: list[int],
+                   repeat: int = 5,
+                   scalar_limit: int = 200,
+                   seed: int = 0,
+                   startup: bool = False):
+    import numpy as np
+    import pandas as pd
+
+    results = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        if startup:
+            results += benchmark_startup(repeat, work_dir, seed = seed)
+        for n_abilities in sizes:
+            results += benchmark_size(n_abilities, repeat, work_dir, scalar_limit, seed = seed)
+
+    return {"meta": {"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                     "python": sys.version.split()[0],
+                     "numpy": np.__version__,
+                     "pandas": pd.__version__,
+                     "platform": platform.platform(),
+                     "repeat": repeat,
+                     "seed": seed},
+            "results": results}
+
+
+def compare_runs(baseline_path: str, candidate_path: str):
+    with open(baseline_path, "r") as f:
+        baseline = {(x["stage"], x["size"]): x for x in json.load(f)["results"]}
+    with open(candidate_path, "r") as f:
+        candidate = {(x["stage"], x["size"]): x for x in json.load(f)["results"]}
+
+    print("%-34s %-7s %12s %12s %8s" % ("stage", "size", "base ms", "new ms", "speedup"))
+    for key in sorted(set(baseline) & set(candidate), key = lambda x: (x[1], x[0])):
+        base_s, new_s = baseline[key]["median_s"], candidate[key]["median_s"]
+        print("%-34s %-7s %12.3f %12.3f %7.2fx" % (key[0], key[1], base_s * 1000, new_s * 1000,
+                                                   base_s / new_s if new_s > 0 else float("inf")))
+    for key in sorted(set(baseline) ^ set(candidate)):
+        print("%-34s %-7s only in %s" % (key[0], key[1],
+                                         "baseline" if key in baseline else "candidate"))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Benchmark sheet loading, stat table "
+                                                   "building and max retrieval.")
+    parser.add_argument("--sizes", type = int, nargs = "+", default = [10, 100, 1000, 10000],
+                        help = "Ability counts of the synthetic sheets.")
+    parser.add_argument("--repeat", type = int, default = 5)
+    parser.add_argument("--scalar-limit", type = int, default = 200,
+                        help = "Largest sheet also timed on the scalar table path.")
+    parser.add_argument("--seed", type = int, default = 0)
+    parser.add_argument("--startup", action = "store_true",
+                        help = "Also time app import and first page loads in fresh interpreters.")
+    parser.add_argument("--output", help = "Write results as JSON to this path.")
+    parser.add_argument("--compare", nargs = 2, metavar = ("BASELINE", "CANDIDATE"),
+                        help = "Diff two JSON result files instead of running.")
+    args = parser.parse_args()
+
+    # The scalar econ path logs zero damage abilities on every call
+    warnings.simplefilter("ignore", RuntimeWarning)
+
+    if args.compare is not None:
+        compare_runs(*args.compare)
+    else:
+        run_results = run_benchmarks(args.sizes, repeat = args.repeat,
+                                     scalar_limit = args.scalar_limit, seed = args.seed,
+                                     startup = args.startup)
+        if args.output is not None:
+            with open(args.output, "w") as f:
+                json.dump(run_results, f, indent = 2)
@@ -1,12 +1,20 @@
 from abc import ABC
+from ability_index import AbilityIndex
+from ability_table import AbilityTable
 from base_economics import *
-from errors import BadArgumentFromListErrorCheck, NonNegativeIntegerCheck
+from errors import BadArgumentFromMapErrorCheck, NonNegativeIntegerCheck
 from fixed_names import (all_proficiencies, all_resistances, all_conditions, 
                          all_immunities, all_vulnerabilities, DC_types, full_stat_names)
 from math import floor
-import pandas as pd
+from metrics import timed_stage
+from sheet_compiler import compiled_sheet_rows, load_compiled_sheet_columns
 
 class Character(ABC):
+    __slots__ = ("name", "STR", "DEX", "CON", "INT", "WIS", "CHA", "MaxHP", "AC", "Prof_Bonus",
+                 "ability_modifiers", "proficiencies", "st_proficiencies", "st_modifiers",
+                 "resistances", "vulnerablities", "immunities", "conditions", "spellslots",
+                 "abilities", "ability_index", "ability_table", "__weakref__")
+
     def __init__(self,
                  name: str,
                  strength: int,
@@ -69,6 +77,8 @@ class Character(ABC):
         self.add_spellslots(spell_slots)
         
         self.abilities = {}
+        self.ability_index = None
+        self.ability_table = None
         
     def __repr__(self):
         repr_string = """
@@ -110,7 +120,7 @@ class Character(ABC):
             else:
                 stat_value = stat[0]
             for value in value_list:
-                BadArgumentFromListErrorCheck(value, valid_list)
+                BadArgumentFromMapErrorCheck(value, edit_dict)
                 edit_dict[value] = stat_value
         return edit_dict
     
@@ -121,7 +131,7 @@ class Character(ABC):
             fill_value = False
         else:
             fill_value = None
-        all_options_dict = {x: fill_value for x in full_options}
+        all_options_dict = dict.fromkeys(full_options, fill_value)
         return self.pass_to_dict(edit_dict = all_options_dict,
                                  valid_list = full_options,
                                  boolean_value = boolean_value,
@@ -134,35 +144,60 @@ class Character(ABC):
             self.conditions[condition] = condition_state
 
     def add_ability(self, ability_name: str, is_spell: bool, **kwargs):
+        self.ability_index = None
+        self.ability_table = None
         if is_spell:
             self.abilities[ability_name] = SpellTurnAction(**kwargs)
         else: 
             self.abilities[ability_name] = TurnAction(**kwargs)
 
-    def add_abilities_from_csv(self, file_path, silent: bool = True):
-        ability_sheet = pd.read_csv(file_path)
-        column_idx = [x not in ("IS_SPELL") for x in ability_sheet.columns]
-        for _, r in ability_sheet.iterrows():
-            row_sub_dict = r[column_idx].dropna().to_dict()
-            row_sub_dict = {k: int(v) if type(v) is float else v for k, v in row_sub_dict.items()}
+    @timed_stage("add_abilities_from_csv")
+    def add_abilities_from_csv(self, file_path, silent: bool = True,
+                               use_compiled: bool = True):
+        if use_compiled:
+            sheet_rows = compiled_sheet_rows(load_compiled_sheet_columns(file_path))
+        else:
+            sheet_rows = self.read_csv_rows(file_path)
+
+        for row_sub_dict in sheet_rows:
+            is_spell = row_sub_dict.pop("IS_SPELL")
 
             if "damage_die" in row_sub_dict:
-                row_sub_dict["damage_die"] = Dice(row_sub_dict["damage_die"])
+                row_sub_dict["damage_die"] = shared_dice(row_sub_dict["damage_die"])
             
             if "imposed_status" in row_sub_dict:
-                row_sub_dict['imposed_status'] = StatusEffect(row_sub_dict['imposed_status'])
+                row_sub_dict['imposed_status'] = shared_status_effect(row_sub_dict['imposed_status'])
 
-            if not r['IS_SPELL']:
+            if not is_spell:
                 row_sub_dict.pop("spell_level")
 
-            self.add_ability(ability_name = r['name'],
-                             is_spell = r ['IS_SPELL'],
+            self.add_ability(ability_name = row_sub_dict['name'],
+                             is_spell = is_spell,
                              **row_sub_dict)
         
         if silent: 
             return None
         else:
             return self.abilities
+
+    def get_ability_index(self):
+        if self.ability_index is None or not self.ability_index.matches(self.abilities):
+            self.ability_index = AbilityIndex(self.abilities)
+        return self.ability_index
+
+    def get_ability_table(self):
+        if self.ability_table is None or not self.ability_table.matches(self.abilities):
+            self.ability_table = AbilityTable(self.abilities)
+        return self.ability_table
+
+    def read_csv_rows(self, file_path):
+        import pandas as pd
+        ability_sheet = pd.read_csv(file_path)
+        for _, r in ability_sheet.iterrows():
+            row_sub_dict = r.dropna().to_dict()
+            row_sub_dict = {k: int(v) if type(v) is float else v for k, v in row_sub_dict.items()}
+            row_sub_dict["IS_SPELL"] = r["IS_SPELL"]
+            yield row_sub_dict
         
     def set_saving_throw_mods(self):
         st_mods = {}
@@ -0,0 +1,189 @@
+from character import Character
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from simulation import SimulationSpec, sample_damage, seed_sequence
+from table_engine import build_target_stat_row, character_columns
+
+# Per-round budgets in the order they are spent. "L" abilities take longer
+# than a round and never fit.
+turn_budgets = ["A", "B", "R"]
+
+
+class EncounterPlan:
+    # Everything a worker needs to play out encounters, reduced to arrays so
+    # it pickles cheaply and never touches the Character objects again.
+    def __init__(self,
+                 action_character: Character,
+                 target: Character,
+                 max_rounds: int = 10,
+                 scarcity_coeff: float = 0.45):
+        columns = character_columns(action_character)
+        self.ability_names = columns.names
+        self.specs = [SimulationSpec(x, target) for x in columns.actions]
+        self.action_time = np.array([x.action_time for x in columns.actions])
+        self.spell_level = columns.spell_level
+        self.n_uses = np.array([-1 if x.n_uses is None else x.n_uses for x in columns.actions])
+
+        self.expected_hit = build_target_stat_row(target, action_character, "ehit",
+                                                  columns = columns)
+        self.utility = columns.utility
+        self.time_cost = columns.time_cost
+
+        self.slot_levels = np.array(sorted(action_character.spellslots.keys()), dtype=int)
+        self.initial_slots = np.array([action_character.spellslots[x].n_remaining()
+                                       for x in self.slot_levels], dtype=int)
+        # Column into the slot array for each ability, -1 for cantrips and
+        # abilities whose level the character has no slots for
+        level_lookup = {level: i for i, level in enumerate(self.slot_levels)}
+        self.slot_idx = np.array([level_lookup.get(x, -1) if x > 0 else -1
+                                  for x in self.spell_level])
+        self.castable = (self.spell_level == 0) | (self.slot_idx >= 0)
+
+        self.target_hp = target.MaxHP
+        self.max_rounds = max_rounds
+        self.scarcity_coeff = scarcity_coeff
+
+    def economy_scores(self, slots: np.ndarray):
+        # calculate_hit_economy for every encounter's current slot state
+        total_slots = slots.sum(axis = 1, keepdims = True)
+        # Only abilities with a slot column look one up, so a character
+        # without spell slots has no columns to index
+        level_slots = np.ones((len(slots), len(self.slot_idx)))
+        has_slot = self.slot_idx >= 0
+        level_slots[:, has_slot] = slots[:, self.slot_idx[has_slot]]
+        with np.errstate(divide = 'ignore', invalid = 'ignore'):
+            scarcity = np.where(self.spell_level > 0,
+                                (total_slots / level_slots) ** self.scarcity_coeff, 1)
+            total_cost = (self.spell_level + self.time_cost) * scarcity
+            total_cost = np.where(total_cost == 0, 1, total_cost)
+            return np.log((self.expected_hit + self.utility) / total_cost ** (1/2))
+
+
+class EncounterResult:
+    def __init__(self,
+                 ability_names: list[str],
+                 rounds_to_kill: np.ndarray,
+                 round_damage: np.ndarray,
+                 ability_counts: np.ndarray,
+                 slots_spent: np.ndarray):
+        self.ability_names = ability_names
+        self.rounds_to_kill = rounds_to_kill
+        self.round_damage = round_damage
+        self.ability_counts = ability_counts
+        self.slots_spent = slots_spent
+
+    def __len__(self):
+        return len(self.rounds_to_kill)
+
+    def __repr__(self):
+        return "EncounterResult(n=%s, kill_rate=%.3f)" % (len(self), self.kill_rate())
+
+    def kill_rate(self):
+        return np.mean(self.rounds_to_kill > 0)
+
+    def rounds_to_kill_distribution(self):
+        # Index is the round the target dropped, index 0 is "survived"
+        max_rounds = self.round_damage.shape[1]
+        return np.bincount(self.rounds_to_kill, minlength = max_rounds + 1) / len(self)
+
+    def summary(self):
+        killed = self.rounds_to_kill[self.rounds_to_kill > 0]
+        return {"n_encounters": len(self),
+                "kill_rate": self.kill_rate(),
+                "mean_rounds_to_kill": killed.mean() if len(killed) > 0 else np.nan,
+                "median_rounds_to_kill": np.median(killed) if len(killed) > 0 else np.nan,
+                "mean_damage_per_round": self.round_damage.mean(axis = 0),
+                "ability_use_rates": dict(zip(self.ability_names,
+                                              self.ability_counts / len(self)))}
+
+
+def simulate_encounter_chunk(plan: EncounterPlan,
+                             n_encounters: int,
+                             chunk_seed: np.random.SeedSequence):
+    rng = np.random.default_rng(chunk_seed)
+    n_abilities = len(plan.ability_names)
+
+    hp = np.full(n_encounters, plan.target_hp, dtype = np.int64)
+    slots = np.tile(plan.initial_slots, (n_encounters, 1))
+    uses = np.tile(plan.n_uses, (n_encounters, 1))
+    rounds_to_kill = np.zeros(n_encounters, dtype = np.int64)
+    round_damage = np.zeros((n_encounters, plan.max_rounds), dtype = np.int64)
+    ability_counts = np.zeros(n_abilities, dtype = np.int64)
+
+    for round_idx in range(plan.max_rounds):
+        alive = hp > 0
+        if not alive.any():
+            break
+        # One spell with a slot per turn, whichever budget it comes out of
+        leveled_cast = np.zeros(n_encounters, dtype = bool)
+
+        for budget in turn_budgets:
+            slot_available = np.ones((n_encounters, n_abilities), dtype = bool)
+            spell_abilities = plan.slot_idx >= 0
+            slot_available[:, spell_abilities] = slots[:, plan.slot_idx[spell_abilities]] > 0
+
+            available = (plan.action_time == budget) & plan.castable & alive[:, None] & \
+                (uses != 0) & slot_available & \
+                ~((plan.spell_level > 0) & leveled_cast[:, None])
+            if not available.any():
+                continue
+
+            # NaN scores (log of a negative value) would otherwise win argmax
+            economy_scores = plan.economy_scores(slots)
+            scores = np.where(available & np.isfinite(economy_scores), economy_scores, -np.inf)
+            choice = scores.argmax(axis = 1)
+            acting = np.isfinite(scores[np.arange(n_encounters), choice])
+
+            for ability_idx in np.unique(choice[acting]):
+                enc_idx = np.flatnonzero(acting & (choice == ability_idx))
+                damage, _ = sample_damage(rng, plan.specs[ability_idx], len(enc_idx))
+                hp[enc_idx] -= damage
+                round_damage[enc_idx, round_idx] += damage
+                ability_counts[ability_idx] += len(enc_idx)
+
+                if plan.n_uses[ability_idx] >= 0:
+                    uses[enc_idx, ability_idx] -= 1
+                if plan.slot_idx[ability_idx] >= 0:
+                    slots[enc_idx, plan.slot_idx[ability_idx]] -= 1
+                    leveled_cast[enc_idx] = True
+
+            alive = hp > 0
+
+        rounds_to_kill[(rounds_to_kill == 0) & (hp <= 0)] = round_idx + 1
+
+    return rounds_to_kill, round_damage, ability_counts, plan.initial_slots.sum() - slots.sum(axis = 1)
+
+
+def simulate_encounters(action_character: Character,
+                        target: Character,
+                        n_encounters: int,
+                        max_rounds: int = 10,
+                        scarcity_coeff: float = 0.45,
+                        seed = None,
+                        chunk_size: int = 10_000,
+                        n_workers: int = 1):
+    # Plays out n_encounters independent fights from the character's current
+    # spell slot state; the Character itself is left untouched.
+    if n_encounters <= 0:
+        raise ValueError("n_encounters must be a positive integer.")
+
+    plan = EncounterPlan(action_character, target,
+                         max_rounds = max_rounds,
+                         scarcity_coeff = scarcity_coeff)
+
+    chunk_sizes = [min(chunk_size, n_encounters - x) for x in range(0, n_encounters, chunk_size)]
+    chunk_seeds = seed_sequence(seed).spawn(len(chunk_sizes))
+    if n_workers > 1 and len(chunk_sizes) > 1:
+        with ProcessPoolExecutor(max_workers = n_workers) as executor:
+            chunk_results = list(executor.map(simulate_encounter_chunk,
+                                              [plan] * len(chunk_sizes),
+                                              chunk_sizes, chunk_seeds))
+    else:
+        chunk_results = [simulate_encounter_chunk(plan, n, s)
+                         for n, s in zip(chunk_sizes, chunk_seeds)]
+
+    return EncounterResult(plan.ability_names,
+                           rounds_to_kill = np.concatenate([x[0] for x in chunk_results]),
+                           round_damage = np.concatenate([x[1] for x in chunk_results]),
+                           ability_counts = sum([x[2] for x in chunk_results]),
+                           slots_spent = np.concatenate([x[3] for x in chunk_results]))
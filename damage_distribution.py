@@ -0,0 +1,195 @@
+from base_economics import TurnAction, SpellTurnAction, Dice
+from character import Character
+from functools import lru_cache
+import numpy as np
+from table_engine import AbilityColumns, hit_probability_matrix, rvi_column
+
+# Above this many output points a convolution goes through the FFT
+fft_convolution_threshold = 4096
+
+
+def convolve_pmfs(pmf_a: np.ndarray, pmf_b: np.ndarray):
+    if len(pmf_a) * len(pmf_b) <= fft_convolution_threshold:
+        return np.convolve(pmf_a, pmf_b)
+
+    output_len = len(pmf_a) + len(pmf_b) - 1
+    convolved = np.fft.irfft(np.fft.rfft(pmf_a, output_len) *
+                             np.fft.rfft(pmf_b, output_len), output_len)
+    return clean_pmf(convolved)
+
+
+def clean_pmf(pmf: np.ndarray):
+    # FFT round-off leaves tiny negative masses behind
+    pmf = np.clip(pmf, 0, None)
+    return pmf / pmf.sum(axis = -1, keepdims = True)
+
+
+@lru_cache(maxsize = 1024)
+def dice_sum_pmf(n_faces: int, n_dice: int):
+    # pmf[k] is P(sum of n_dice dn == k); arrays are shared, so read-only
+    if n_dice == 0:
+        pmf = np.ones(1)
+    elif n_dice == 1:
+        pmf = Dice(n_faces).pmf()
+    elif n_dice * n_faces <= fft_convolution_threshold ** (1/2):
+        pmf = convolve_pmfs(dice_sum_pmf(n_faces, n_dice - 1), Dice(n_faces).pmf())
+    else:
+        output_len = n_dice * n_faces + 1
+        pmf = clean_pmf(np.fft.irfft(np.fft.rfft(Dice(n_faces).pmf(), output_len) ** n_dice,
+                                     output_len))
+    pmf.flags.writeable = False
+    return pmf
+
+
+def scale_pmf(pmf: np.ndarray, multiplier: float):
+    # Halving rounds down as in the rules, for both RVI and half damage saves
+    if multiplier == 1:
+        return pmf
+    elif multiplier == 0:
+        return np.ones(1)
+
+    scaled_values = np.floor(np.arange(len(pmf)) * multiplier).astype(int)
+    scaled_pmf = np.zeros(scaled_values[-1] + 1)
+    np.add.at(scaled_pmf, scaled_values, pmf)
+    return scaled_pmf
+
+
+def shift_pmf(pmf: np.ndarray, flat_damage: int):
+    if flat_damage == 0:
+        return pmf
+    return np.concatenate([np.zeros(flat_damage), pmf])
+
+
+def pmf_power(pmf: np.ndarray, n: int):
+    powered = np.ones(1)
+    for _ in range(n):
+        powered = convolve_pmfs(powered, pmf)
+    return powered
+
+
+def stack_pmfs(pmfs: list[np.ndarray]):
+    support_len = max([len(x) for x in pmfs])
+    stacked = np.zeros((len(pmfs), support_len))
+    for i, pmf in enumerate(pmfs):
+        stacked[i, :len(pmf)] = pmf
+    return stacked
+
+
+def roll_damage_pmf(action):
+    if action.damage_die is None:
+        dice_pmf = np.ones(1)
+    else:
+        dice_pmf = dice_sum_pmf(action.damage_die.n,
+                                0 if action.n_damage_die is None else action.n_damage_die)
+    return shift_pmf(dice_pmf, 0 if action.flat_damage is None else action.flat_damage)
+
+
+def action_outcome_pmfs(action,
+                        rvi_modifier: float = 1):
+    # Returns one damage pmf per outcome and how many successful rolls each
+    # outcome stands for. Attack rolls are independent per hit roll, so there
+    # are n_hit_rolls + 1 outcomes; a save or no_roll action is decided once
+    # for all of its hit rolls, so it only has fail/success outcomes.
+    n_hit_rolls = 0 if action.n_hit_rolls is None else action.n_hit_rolls
+    roll_pmf = roll_damage_pmf(action)
+
+    if action.roll_type == "hit":
+        hit_pmf = scale_pmf(roll_pmf, rvi_modifier)
+        if action.half_damage_on_fail:
+            miss_pmf = scale_pmf(scale_pmf(roll_pmf, 1/2), rvi_modifier)
+        else:
+            miss_pmf = np.ones(1)
+        outcome_pmfs = [convolve_pmfs(pmf_power(hit_pmf, k), pmf_power(miss_pmf, n_hit_rolls - k))
+                        for k in range(n_hit_rolls + 1)]
+        return stack_pmfs(outcome_pmfs), np.arange(n_hit_rolls + 1)
+    else:
+        total_pmf = pmf_power(roll_pmf, n_hit_rolls)
+        if action.half_damage_on_fail:
+            saved_pmf = scale_pmf(scale_pmf(total_pmf, 1/2), rvi_modifier)
+        else:
+            saved_pmf = np.ones(1)
+        return stack_pmfs([saved_pmf, scale_pmf(total_pmf, rvi_modifier)]), np.array([0, 1])
+
+
+def outcome_weights(hit_probability: np.ndarray,
+                    n_successes: np.ndarray):
+    n_trials = n_successes[-1]
+    hit_probability = np.asarray(hit_probability, dtype = float)[..., None]
+    binomial_coeffs = np.array([np.prod(np.arange(n_trials - k + 1, n_trials + 1)) /
+                                np.prod(np.arange(1, k + 1)) for k in n_successes])
+    return binomial_coeffs * hit_probability ** n_successes * \
+        (1 - hit_probability) ** (n_trials - n_successes)
+
+
+class DamageDistribution:
+    # pmf[..., k] is P(damage == k). Leading axes are kept as is, so one
+    # instance can hold a single distribution or one per check value.
+    def __init__(self, pmf: np.ndarray, check_values: np.ndarray = None):
+        self.pmf = pmf
+        self.check_values = check_values
+        self.damage_values = np.arange(pmf.shape[-1])
+
+    def __repr__(self):
+        return "DamageDistribution(mean=%s, max=%s)" % (np.round(self.mean(), 2),
+                                                        self.pmf.shape[-1] - 1)
+
+    def at(self, check_value: int):
+        row_idx = int(np.flatnonzero(self.check_values == check_value)[0])
+        return DamageDistribution(self.pmf[row_idx])
+
+    def mean(self):
+        return self.pmf @ self.damage_values
+
+    def variance(self):
+        return self.pmf @ self.damage_values ** 2 - self.mean() ** 2
+
+    def std(self):
+        return np.sqrt(np.maximum(self.variance(), 0))
+
+    def cdf(self):
+        return np.cumsum(self.pmf, axis = -1)
+
+    def quantile(self, q: float):
+        return np.argmax(self.cdf() >= q - 1e-12, axis = -1)
+
+    def kill_probability(self, hp: int):
+        if hp <= 0:
+            return np.ones(self.pmf.shape[:-1])
+        return self.pmf[..., hp:].sum(axis = -1)
+
+    def summary(self, hp: int = None):
+        summary_dict = {"mean": self.mean(),
+                        "variance": self.variance(),
+                        "p05": self.quantile(0.05),
+                        "median": self.quantile(0.5),
+                        "p95": self.quantile(0.95)}
+        if hp is not None:
+            summary_dict["kill_probability"] = self.kill_probability(hp)
+        return summary_dict
+
+
+def damage_distribution(action,
+                        target: Character,
+                        check_values = None):
+    # Uses the same hit probability and RVI as character_driven_interaction.
+    # With check_values=None the target's own AC/ST is used, otherwise one
+    # distribution is built per overriding check value.
+    if type(action) not in (TurnAction, SpellTurnAction):
+        raise ValueError("action must be of type either TurnAction or SpellTurnAction.")
+
+    columns = AbilityColumns({action.name: action})
+    if check_values is None:
+        if action.roll_type == "save":
+            check_array = np.array([target.st_modifiers[action.DC_type]])
+        else:
+            check_array = np.array([target.AC])
+    else:
+        check_array = np.atleast_1d(np.asarray(check_values))
+
+    hit_probability = hit_probability_matrix(columns, check_array)[:, 0]
+    outcome_pmfs, n_successes = action_outcome_pmfs(action, rvi_column(columns, target)[0])
+    pmf = outcome_weights(hit_probability, n_successes) @ outcome_pmfs
+
+    if check_values is None or np.ndim(check_values) == 0:
+        return DamageDistribution(pmf[0])
+    return DamageDistribution(pmf, check_values = check_array)
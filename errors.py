@@ -5,6 +5,17 @@ def BadArgumentFromListErrorCheck(passed_value,
                              (accepted_values, passed_value))
     else:
         return True
+
+
+def BadArgumentFromMapErrorCheck(passed_value,
+                                 accepted_map: dict):
+    # BadArgumentFromListErrorCheck as a hash lookup, returning the mapped
+    # value (e.g. an integer code)
+    try:
+        return accepted_map[passed_value]
+    except (KeyError, TypeError):
+        raise ValueError("Argument must be one of %s. Received '%s'." % 
+                             (list(accepted_map), passed_value)) from None
     
 
 def NonNegativeIntegerCheck(passed_value):
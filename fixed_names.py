@@ -11,6 +11,15 @@ roll_types = ['hit', 'save', 'no_roll']
 
 action_times = ["A", "B", "R", "L"]
 
+# Integer codes of the names above, by list position
+damage_type_codes = {x: i for i, x in enumerate(damage_types)}
+
+DC_type_codes = {x: i for i, x in enumerate(DC_types)}
+
+roll_type_codes = {x: i for i, x in enumerate(roll_types)}
+
+action_time_codes = {x: i for i, x in enumerate(action_times)}
+
 all_proficiencies = ['Acrobatics', 'Animal Handling', 'Arcana',
                  'Athletics', 'Deception', 'History',
                  'Insight', 'Intimidation', 'Investigation',
@@ -45,6 +54,12 @@ character_actionsheet_path = "character_actionsheets/"
 
 character_detail_path = "character_details/"
 
+monster_catalog_path = "monster_catalog/monsters.jsonl"
+
+table_store_path = "table_store/"
+
+profile_output_path = "profiles/"
+
 blanked_char_sheet = {
     "name": "",
     "strength": 0,
@@ -1,34 +1,38 @@
+from ability_index import AbilityIndex
 from base_economics import TurnAction, SpellTurnAction
 from character import Character
 from errors import BadArgumentFromListErrorCheck, NonNegativeIntegerCheck
 from fixed_names import action_times, DC_types, damage_types
+from metrics import timed_stage
 import numpy as np
-import pandas as pd
+from roll_kernels import RollKernel, default_kernels
+from stat_table import StatTable
+from table_engine import build_stat_array
 
 def calculate_hit_probability(action,
                               opposing_AC: int = None,
                               opposing_ST: int = None,
+                              attack_kernel: RollKernel = None,
+                              save_kernel: RollKernel = None,
                               **kwargs):
     if action.roll_type == "hit":
         if opposing_AC is None:
             raise ValueError("Hit rolls must be against an integer value.")
         # NonNegativeIntegerCheck(opposing_AC)
-        raw_hit_calculation = (20 - (opposing_AC - action.hit_bonus))/20
-        max_corr_hit_probability = min(1, raw_hit_calculation)
-        min_corr_hit_probability = max(max_corr_hit_probability, 0.05)
+        if attack_kernel is None:
+            attack_kernel = default_kernels["normal"]
 
-        return min_corr_hit_probability
+        return float(attack_kernel.hit_probability(action.hit_bonus - opposing_AC))
         
     elif action.roll_type == "save":
         if opposing_ST is None:
             raise ValueError("Saving throw values must be an integer value.")
         
         # NonNegativeIntegerCheck(opposing_ST)
-        raw_save_calculation = 1 - (20 - (action.DC - opposing_ST))/20
-        max_corr_save_probability = min(1, raw_save_calculation)
-        min_corr_save_probability = max(max_corr_save_probability, 0.05)
+        if save_kernel is None:
+            save_kernel = default_kernels["normal"]
 
-        return min_corr_save_probability
+        return float(save_kernel.save_fail_probability(opposing_ST - action.DC))
 
     else:
         return 1
@@ -39,23 +43,36 @@ def calculate_expected_hit(action,
                            vulnerable: bool = False,
                            immunity: bool = False,
                            resistance: bool = False,
+                           attack_kernel: RollKernel = None,
+                           crits: bool = False,
                            **kwargs):
     if type(action) not in (TurnAction, SpellTurnAction):
         raise ValueError("action must be of type either TurnAction or SpellTurnAction.")
     
-    hit_probability = calculate_hit_probability(action, **kwargs)
+    if attack_kernel is None:
+        attack_kernel = default_kernels["normal"]
+    hit_probability = calculate_hit_probability(action, attack_kernel = attack_kernel, **kwargs)
     if action.damage_die is None: 
         base_die_value = 0
+        crit_die_value = 0
     else:
         if simulated:
             base_die_value = sum([action.damage_die.Roll(True) for _ in range(action.n_damage_die)])
+            crit_die_value = sum([action.damage_die.Roll(True) for _ in range(action.n_damage_die)])
         else:
             base_die_value = action.n_damage_die * action.damage_die.Roll(False)
+            crit_die_value = base_die_value
 
     total_damage_per_hit = base_die_value + \
         (0 if action.flat_damage is None else action.flat_damage)
-    total_damage = (0 if action.n_hit_rolls is None else action.n_hit_rolls) * \
-        total_damage_per_hit
+    n_hit_rolls = 0 if action.n_hit_rolls is None else action.n_hit_rolls
+    total_damage = n_hit_rolls * total_damage_per_hit
+
+    # A natural 20 rolls the damage dice twice
+    if crits and action.roll_type == "hit":
+        crit_damage = n_hit_rolls * crit_die_value * attack_kernel.crit_probability
+    else:
+        crit_damage = 0
 
     if sum([vulnerable, immunity, resistance]) > 1:
         raise ValueError("Can only be weak | immune | resistant.")
@@ -73,7 +90,7 @@ def calculate_expected_hit(action,
         return (total_damage * hit_probability + (1 - hit_probability) 
                 * 1/2 * total_damage) * rvi_modifier
     else:
-        return total_damage * hit_probability * rvi_modifier
+        return (total_damage * hit_probability + crit_damage) * rvi_modifier
     
 
 def calculate_hit_economy(action,
@@ -176,13 +193,40 @@ def character_driven_interaction(action,
                               **kwargs)
     
 
+def stat_array_to_table(stat_array: np.ndarray,
+                        ability_names: list[str],
+                        value_check_min: int = -30,
+                        value_check_max: int = 30):
+    return StatTable(stat_array,
+                     check_values = np.arange(value_check_min, value_check_max + 1),
+                     ability_names = ability_names)
+
+
+@timed_stage("build_hit_stat_table")
 def build_hit_stat_table(target: Character,
                          action_character: Character,
                          stat: str,
                          value_check_min: int = -30,
                          value_check_max: int = 30,
+                         vectorized: bool = True,
                          **kwargs):
     value_range = range(value_check_min, value_check_max + 1)
+
+    # Simulated rolls and any extra calculation kwargs still go through the
+    # scalar functions below.
+    if vectorized and set(kwargs.keys()) <= {"scarcity_coeff", "attack_kernel",
+                                             "save_kernel", "crits"}:
+        stat_array = build_stat_array(target = target,
+                                      action_character = action_character,
+                                      stat = stat,
+                                      value_check_min = value_check_min,
+                                      value_check_max = value_check_max,
+                                      **kwargs)
+        return stat_array_to_table(stat_array,
+                                   ability_names = list(action_character.abilities.keys()),
+                                   value_check_min = value_check_min,
+                                   value_check_max = value_check_max)
+
     all_actions = action_character.abilities
     stat_table_dict = {}
 
@@ -196,43 +240,18 @@ def build_hit_stat_table(target: Character,
                                                         for val in value_range}
         stat_table_dict[action_name] = action_outcomes
 
-    stat_table = pd.DataFrame.from_dict(stat_table_dict)
+    stat_table = stat_array_to_table(np.array([list(x.values()) for x in stat_table_dict.values()],
+                                              dtype = np.float64).reshape(-1, len(value_range)).T,
+                                     ability_names = list(stat_table_dict.keys()),
+                                     value_check_min = value_check_min,
+                                     value_check_max = value_check_max)
 
     return stat_table
 
 
-def filter_abilities_by_attr(ability_map: dict,
-                             attr_name: str,
-                             attr_filter: str):
-    
-    def ability_attr_check(ability, attr_name, attr_filter):
-        if type(ability) not in (TurnAction, SpellTurnAction):
-            raise ValueError("action must be of type either TurnAction or SpellTurnAction.")
-        
-        if hasattr(ability, attr_name):
-            return getattr(ability, attr_name) == attr_filter
-        else:
-            return False
-
-    if attr_filter == "all":
-        return np.array([True] * len(ability_map))
-    else:
-        ability_mask = [ability_attr_check(ability, attr_name, attr_filter) 
-                        for ability in ability_map.values()]
-        return np.array(ability_mask)
-
-
-def retrieve_table_maxes(stat_table: pd.DataFrame,
-                         ability_map: dict,
-                         check_value: int,
-                         roll_filter: str = "all",
-                         action_time_filter: list[str] = ["all"],
-                         spell_level_filter = ["all"],
-                         damage_type_filter: list[str] = ["all"],
-                         n_options: int = 5):
-    BadArgumentFromListErrorCheck(passed_value = roll_filter,
-                                  accepted_values = DC_types + ['all', 'AC'])
-    
+def validate_ability_filters(action_time_filter: list[str] = ["all"],
+                             spell_level_filter = ["all"],
+                             damage_type_filter: list[str] = ["all"]):
     [BadArgumentFromListErrorCheck(passed_value = x,
                                   accepted_values = action_times + ['all'])
         for x in action_time_filter]
@@ -249,34 +268,91 @@ def retrieve_table_maxes(stat_table: pd.DataFrame,
             raise ValueError("spell_level_filter must be a non-negative integer or all.")
         elif type(passed_spell_level_filter) is int:
             NonNegativeIntegerCheck(passed_spell_level_filter)
-    
-    if roll_filter == "AC":
-        roll_mask = filter_abilities_by_attr(ability_map = ability_map,
-                                             attr_name = "roll_type",
-                                             attr_filter = "hit")
-    else:
-        roll_mask = filter_abilities_by_attr(ability_map = ability_map,
-                                             attr_name = "DC_type",
-                                             attr_filter = roll_filter)
-        
-    action_time_masks = [filter_abilities_by_attr(ability_map = ability_map,
-                                                attr_name = "action_time",
-                                                attr_filter = x) for x in action_time_filter]
-    action_time_mask = sum(action_time_masks) > 0
-    
-    spell_level_masks = [filter_abilities_by_attr(ability_map = ability_map,
-                                                attr_name = "spell_level",
-                                                attr_filter = x) for x in spell_level_filter]
-    spell_level_mask = sum(spell_level_masks) > 0
-    
-    damage_type_masks = [filter_abilities_by_attr(ability_map = ability_map,
-                                                attr_name = "damage_type",
-                                                attr_filter = x) for x in damage_type_filter]
-    damage_type_mask = sum(damage_type_masks) > 0
-    
-    final_ability_mask = roll_mask & action_time_mask & spell_level_mask & damage_type_mask
-    masked_stat_table = stat_table.loc[check_value, final_ability_mask]
 
-    return masked_stat_table.sort_values()[-n_options:]
+    return spell_level_filter
 
-    
+
+@timed_stage("retrieve_table_maxes")
+def retrieve_table_maxes(stat_table: StatTable,
+                         ability_map: dict,
+                         check_value: int,
+                         roll_filter: str = "all",
+                         action_time_filter: list[str] = ["all"],
+                         spell_level_filter = ["all"],
+                         damage_type_filter: list[str] = ["all"],
+                         n_options: int = 5,
+                         ability_index: AbilityIndex = None):
+    BadArgumentFromListErrorCheck(passed_value = roll_filter,
+                                  accepted_values = DC_types + ['all', 'AC'])
+    spell_level_filter = validate_ability_filters(action_time_filter = action_time_filter,
+                                                  spell_level_filter = spell_level_filter,
+                                                  damage_type_filter = damage_type_filter)
+
+    if ability_index is None or not ability_index.matches(ability_map):
+        ability_index = AbilityIndex(ability_map)
+
+    final_ability_mask = ability_index.filter_mask(roll_filter = roll_filter,
+                                                   action_time_filter = action_time_filter,
+                                                   spell_level_filter = spell_level_filter,
+                                                   damage_type_filter = damage_type_filter)
+    # {ability_name: value} of the n_options best, in ascending order
+    return {k: v for v, k in stat_table.top_k(check_value, n_options,
+                                              mask = final_ability_mask)[::-1]}
+
+
+@timed_stage("retrieve_batched_table_maxes")
+def retrieve_batched_table_maxes(stat_tables: dict,
+                                 ability_map: dict,
+                                 roll_check_values: dict,
+                                 action_time_filter: list[str] = ["all"],
+                                 spell_level_filter = ["all"],
+                                 damage_type_filter: list[str] = ["all"],
+                                 n_options: int = 5,
+                                 ability_index: AbilityIndex = None):
+    # retrieve_table_maxes for every stat table and every roll filter in
+    # roll_check_values ({"AC": target AC, "STR": STR save mod, ...}) at once.
+    # Returns {stat: {roll_filter: [(value, ability_name), ...]}}, best first.
+    [BadArgumentFromListErrorCheck(passed_value = x,
+                                  accepted_values = DC_types + ['all', 'AC'])
+        for x in roll_check_values.keys()]
+    spell_level_filter = validate_ability_filters(action_time_filter = action_time_filter,
+                                                  spell_level_filter = spell_level_filter,
+                                                  damage_type_filter = damage_type_filter)
+
+    if ability_index is None or not ability_index.matches(ability_map):
+        ability_index = AbilityIndex(ability_map)
+
+    roll_filters = list(roll_check_values.keys())
+    shared_mask = ability_index.filter_mask(action_time_filter = action_time_filter,
+                                            spell_level_filter = spell_level_filter,
+                                            damage_type_filter = damage_type_filter)
+    roll_masks = np.stack([ability_index.filter_mask(roll_filter = x) & shared_mask
+                           for x in roll_filters])
+
+    # (stat, roll filter, ability) values at each roll filter's check value
+    stats = list(stat_tables.keys())
+    stacked_rows = np.stack([stat_tables[x].rows(list(roll_check_values.values()))
+                             for x in stats])
+
+    # Valid -inf scores must still outrank masked out abilities
+    ranking_values = stacked_rows.copy()
+    ranking_values[ranking_values == -np.inf] = np.finfo(float).min
+    ranking_values[:, ~roll_masks] = -np.inf
+
+    n_candidates = min(n_options, ranking_values.shape[-1])
+    if n_candidates <= 0:
+        return {x: {y: [] for y in roll_filters} for x in stats}
+    candidate_idx = np.argpartition(ranking_values, -n_candidates, axis = -1)[..., -n_candidates:]
+    candidate_values = np.take_along_axis(ranking_values, candidate_idx, axis = -1)
+    candidate_idx = np.take_along_axis(candidate_idx,
+                                       np.argsort(-candidate_values, axis = -1, kind = "stable"),
+                                       axis = -1)
+
+    batched_maxes = {}
+    for stat_pos, stat in enumerate(stats):
+        batched_maxes[stat] = {}
+        for roll_pos, roll_filter in enumerate(roll_filters):
+            top_idx = [x for x in candidate_idx[stat_pos, roll_pos] if roll_masks[roll_pos, x]]
+            batched_maxes[stat][roll_filter] = [(stacked_rows[stat_pos, roll_pos, x],
+                                                 ability_index.ability_names[x]) for x in top_idx]
+    return batched_maxes
@@ -0,0 +1,216 @@
+import bisect
+from contextlib import contextmanager
+import functools
+import os
+import threading
+import time
+
+# Upper bounds in seconds, from a cached lookup to a cold catalog export
+default_buckets = [0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0]
+metric_types = ["counter", "gauge", "histogram"]
+profilers = ["cprofile", "pyinstrument"]
+prometheus_content_type = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def label_key(labels: dict):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def format_labels(label_pairs, extra_pairs = ()):
+    label_pairs = list(label_pairs) + list(extra_pairs)
+    if len(label_pairs) == 0:
+        return ""
+    escaped = ['%s="%s"' % (k, v.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"'))
+               for k, v in label_pairs]
+    return "{" + ",".join(escaped) + "}"
+
+
+def format_value(value: float):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    # Cumulative bucket counts, sum and count of observed values, as
+    # Prometheus histograms keep them
+    def __init__(self, buckets: list[float] = default_buckets):
+        self.buckets = sorted(buckets)
+        self.bucket_counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def __repr__(self):
+        return "Histogram(count=%s, sum=%.6f)" % (self.count, self.sum)
+
+    def observe(self, value: float):
+        self.bucket_counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative_counts(self):
+        cumulative, running = [], 0
+        for x in self.bucket_counts:
+            running += x
+            cumulative.append(running)
+        return list(zip(self.buckets + [float("inf")], cumulative))
+
+
+class MetricsRegistry:
+    # Counters, gauges and histograms by name and labels, shared by every
+    # thread of the app. Collectors are called on render for values that are
+    # already counted elsewhere, e.g. StatTableCache.counters().
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.descriptions = {}
+        self.values = {}
+        self.histograms = {}
+        self.collectors = []
+
+    def __repr__(self):
+        return "MetricsRegistry(series=%s, histograms=%s)" % (len(self.values), len(self.histograms))
+
+    def describe(self, name: str, metric_type: str, help_text: str):
+        if metric_type not in metric_types:
+            raise ValueError("metric_type must be one of %s." % metric_types)
+        with self.lock:
+            self.descriptions[name] = (metric_type, help_text)
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = (name, label_key(labels))
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels):
+        with self.lock:
+            self.values[(name, label_key(labels))] = value
+
+    def observe(self, name: str, value: float, **labels):
+        key = (name, label_key(labels))
+        with self.lock:
+            if key not in self.histograms:
+                self.histograms[key] = Histogram()
+            self.histograms[key].observe(value)
+
+    def value(self, name: str, **labels):
+        return self.values.get((name, label_key(labels)), 0)
+
+    def histogram(self, name: str, **labels):
+        return self.histograms.get((name, label_key(labels)))
+
+    def add_collector(self, collector):
+        # collector() returns [(name, labels, value), ...]
+        with self.lock:
+            self.collectors.append(collector)
+
+    @contextmanager
+    def stage(self, stage_name: str):
+        # Timing span, recorded in minmax_stage_seconds even if the stage raises
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe("minmax_stage_seconds", time.perf_counter() - start, stage = stage_name)
+
+    def timed(self, stage_name: str):
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.stage(stage_name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def reset(self):
+        with self.lock:
+            self.values.clear()
+            self.histograms.clear()
+
+    def render(self):
+        # Prometheus text exposition format, one block per metric name
+        collected = {}
+        for collector in list(self.collectors):
+            for name, labels, value in collector():
+                collected[(name, label_key(labels))] = value
+
+        with self.lock:
+            values = dict(self.values)
+            values.update(collected)
+            histograms = {k: (v.cumulative_counts(), v.sum, v.count)
+                          for k, v in self.histograms.items()}
+            descriptions = dict(self.descriptions)
+
+        lines = []
+        names = sorted(set([x[0] for x in values] + [x[0] for x in histograms]))
+        for name in names:
+            metric_type, help_text = descriptions.get(name, ("untyped", ""))
+            if help_text:
+                lines.append("# HELP %s %s" % (name, help_text))
+            lines.append("# TYPE %s %s" % (name, metric_type))
+            for (series_name, label_pairs), value in sorted(values.items()):
+                if series_name == name:
+                    lines.append("%s%s %s" % (name, format_labels(label_pairs), format_value(value)))
+            for (series_name, label_pairs), (cumulative, total, count) in sorted(histograms.items()):
+                if series_name != name:
+                    continue
+                for upper_bound, bucket_count in cumulative:
+                    lines.append("%s_bucket%s %s" %
+                                 (name, format_labels(label_pairs, [("le", format_value(upper_bound))]),
+                                  bucket_count))
+                lines.append("%s_sum%s %s" % (name, format_labels(label_pairs), repr(total)))
+                lines.append("%s_count%s %s" % (name, format_labels(label_pairs), count))
+        return "\n".join(lines) + "\n"
+
+
+# Shared by the app and the modules it times
+metrics = MetricsRegistry()
+metrics.describe("minmax_stage_seconds", "histogram",
+                 "Time spent in each instrumented stage, e.g. table building or rendering.")
+
+
+def timed_stage(stage_name: str):
+    return metrics.timed(stage_name)
+
+
+class RequestProfiler:
+    # Profiles one request with cProfile or pyinstrument and dumps the result
+    # to output_dir: a pstats .prof file for cProfile, an .html page for
+    # pyinstrument
+    def __init__(self, profiler: str = "cprofile", output_dir: str = "profiles/"):
+        if profiler not in profilers:
+            raise ValueError("profiler must be one of %s." % profilers)
+        self.profiler = profiler
+        self.output_dir = output_dir
+        self.profile = None
+
+    def start(self):
+        if self.profiler == "pyinstrument":
+            from pyinstrument import Profiler
+
+            self.profile = Profiler()
+            self.profile.start()
+        else:
+            import cProfile
+
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+        return self
+
+    def stop(self, request_name: str):
+        # Path of the dumped profile
+        if self.profile is None:
+            raise ValueError("The profiler was never started.")
+        os.makedirs(self.output_dir, exist_ok = True)
+        file_stem = os.path.join(self.output_dir, "%s-%s" % (request_name, time.time_ns()))
+        if self.profiler == "pyinstrument":
+            self.profile.stop()
+            output_path = file_stem + ".html"
+            with open(output_path, "w") as f:
+                f.write(self.profile.output_html())
+        else:
+            self.profile.disable()
+            output_path = file_stem + ".prof"
+            self.profile.dump_stats(output_path)
+        self.profile = None
+        return output_path
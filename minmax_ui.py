@@ -1,54 +1,219 @@
 from character import Character
-from fixed_names import (character_actionsheet_path, character_detail_path,
+from fixed_names import (character_detail_path,
                          all_resistances, all_vulnerabilities, all_immunities,
-                         all_conditions, damage_types, DC_types, blanked_char_sheet)
+                         all_conditions, damage_types, DC_types, blanked_char_sheet,
+                         profile_output_path)
 
-from hit_calculations import build_hit_stat_table, retrieve_table_maxes
+from hit_calculations import retrieve_batched_table_maxes, stat_array_to_table
 import io
 import json
-import os
+import logging
+from metrics import metrics, prometheus_content_type, RequestProfiler
+from monster_catalog import MonsterCatalog, parse_cr
+from session_store import SessionState, SessionStore, session_cookie_name
+from sheet_registry import SheetRegistry
 from support_funcs import load_json_from_path
+from table_cache import StatTableCache, stat_table_key
+from table_engine import accepted_stats
+from table_export import export_formats, rechunk_blocks, table_row_blocks, text_chunks
+from table_jobs import TableJob, TableJobRunner
+from table_store import TableStores
+import os
+import threading
+import time
 
-from flask import Flask, render_template, request, redirect, Response
+from flask import (Flask, g, render_template, request, redirect, Response, stream_with_context,
+                   before_render_template, template_rendered)
 
 
+logger = logging.getLogger(__name__)
+
 app = Flask(__name__)
-app.selected_character = None
-app.target = None
-app.target_raw_dict = None
-app.tables = {"econ": None, "ehit": None, "phit": None}
-app.character_ability_filters = {"roll_type": ['all'],
-                                 "spell_level": ['all'],
-                                 "action_type": ['all'],
-                                 "damage_type": ['all']}
+app.session_store = SessionStore(ttl_seconds = 4 * 3600)
+app.table_cache = StatTableCache(max_entries = 128, max_bytes = 64 * 1024 ** 2)
+app.monster_catalog = MonsterCatalog(lazy = True)
+app.table_jobs = TableJobRunner(max_workers = 2)
+app.sheet_registry = SheetRegistry()
+app.table_stores = TableStores(app.sheet_registry)
+app.metrics = metrics
+# Opt-in profiling: with MINMAX_PROFILE=cprofile (or pyinstrument) set, a
+# request with a profile query arg, e.g. /hit_tables_fill?profile=1, has its
+# profile dumped to profile_output_path
+app.config["PROFILER"] = os.environ.get("MINMAX_PROFILE")
+# Scraped without a session cookie, so these must not create sessions
+sessionless_endpoints = ["metrics_page", "static"]
+
+app.metrics.describe("minmax_request_seconds", "histogram",
+                     "Latency of each endpoint until its response is returned.")
+app.metrics.describe("minmax_requests_total", "counter", "Requests by endpoint and status.")
+app.metrics.describe("minmax_table_lookups_total", "counter",
+                     "Session table requests by where the tables came from.")
+app.metrics.describe("minmax_table_builds_total", "counter", "Finished background table builds.")
+app.metrics.describe("minmax_table_cache_total", "counter", "Shared stat table cache lookups.")
+app.metrics.describe("minmax_table_cache_entries", "gauge", "Tables in the shared cache.")
+app.metrics.describe("minmax_table_cache_bytes", "gauge", "Bytes held by the shared cache.")
+app.metrics.describe("minmax_sessions", "gauge", "Live sessions.")
+
+
+def app_collector():
+    cache_counters = app.table_cache.counters()
+    return [("minmax_table_cache_total", {"result": "hit"}, cache_counters["hits"]),
+            ("minmax_table_cache_total", {"result": "miss"}, cache_counters["misses"]),
+            ("minmax_table_cache_total", {"result": "eviction"}, cache_counters["evictions"]),
+            ("minmax_table_cache_entries", {}, cache_counters["entries"]),
+            ("minmax_table_cache_bytes", {}, cache_counters["bytes"]),
+            ("minmax_sessions", {}, len(app.session_store))]
+
+
+app.metrics.add_collector(app_collector)
+
+
+def record_render_start(sender, template, context, **extra):
+    g.render_start = time.perf_counter()
+
+
+def record_render_time(sender, template, context, **extra):
+    if "render_start" in g:
+        app.metrics.observe("minmax_stage_seconds", time.perf_counter() - g.pop("render_start"),
+                            stage = "render:%s" % template.name)
+
+
+before_render_template.connect(record_render_start, app)
+template_rendered.connect(record_render_time, app)
+
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+    if app.config["PROFILER"] and "profile" in request.args:
+        g.request_profiler = RequestProfiler(app.config["PROFILER"],
+                                             output_dir = profile_output_path).start()
+
+
+@app.before_request
+def load_session_state():
+    if request.endpoint in sessionless_endpoints:
+        return
+    g.session_id, g.session_state = app.session_store.get(request.cookies.get(session_cookie_name))
+
+
+@app.after_request
+def record_request_metrics(response):
+    endpoint = request.endpoint or "unmatched"
+    if "request_profiler" in g:
+        logger.info("Profile written to %s.", g.pop("request_profiler").stop(endpoint))
+    app.metrics.observe("minmax_request_seconds", time.perf_counter() - g.request_start,
+                        endpoint = endpoint, method = request.method)
+    app.metrics.inc("minmax_requests_total", endpoint = endpoint, method = request.method,
+                    status = response.status_code)
+    return response
+
+
+@app.teardown_request
+def stop_request_profiler(error = None):
+    # A request that raised skips after_request, so its profiler stops here
+    if "request_profiler" in g:
+        g.pop("request_profiler").stop(request.endpoint or "unmatched")
+
+
+@app.after_request
+def set_session_cookie(response):
+    if "session_id" in g:
+        response.set_cookie(session_cookie_name, g.session_id,
+                            max_age = int(app.session_store.ttl_seconds),
+                            httponly = True, samesite = "Lax")
+    return response
+
+
+def session_state():
+    return g.session_state
+
+
+def build_session_tables(job: TableJob,
+                         session_id: str,
+                         state: SessionState,
+                         target: Character,
+                         action_character: Character,
+                         table_keys: dict,
+                         cached_tables: dict):
+    # Runs on app.table_jobs. The finished tables only replace the session's
+    # if no newer job cancelled this one in the meantime.
+    with app.session_store.build_lock(session_id), app.metrics.stage("build_stat_tables"):
+        job.report(0.1)
+        rebuilt_stats = state.table_builder.update(target = target,
+                                                   action_character = action_character)
+        job.report(0.5)
 
+        for i, (k, cached_table) in enumerate(cached_tables.items()):
+            if cached_table is None:
+                cached_tables[k] = stat_array_to_table(state.table_builder.arrays[k],
+                                                       ability_names = state.table_builder.ability_names)
+                app.table_cache.put(table_keys[k], cached_tables[k])
+            job.report(0.5 + 0.5 * (i + 1) / len(cached_tables))
 
-def table_build_check():
-    if app.selected_character is not None and app.target is not None:
+        if len(rebuilt_stats) > 0:
+            logger.debug("Tables updated: %s.", ", ".join(sorted(rebuilt_stats)))
 
-        for k in app.tables.keys():
-            app.tables[k] = build_hit_stat_table(target = app.target,
-                                                    stat = k,
-                                                    action_character = app.selected_character)
-            
-        print("Tables created.")
-    else:
-        app.tables = {"econ": None, "ehit": None, "phit": None}
+    with app.session_store.submit_lock(session_id):
+        job.check_cancelled()
+        state.tables = cached_tables
+        state.table_character = action_character
+    app.metrics.inc("minmax_table_builds_total")
+    return cached_tables
+
+
+def table_build_check():
+    # Starts a background build when the session's tables are neither cached
+    # nor in the character's table store and returns its job, or None when
+    # there is nothing left to build. Pages keep rendering the last finished
+    # tables until the job is done.
+    state = session_state()
+    if state.selected_character is None or state.target is None:
+        state.clear_tables()
+        return None
+
+    with app.session_store.submit_lock(g.session_id):
+        table_keys = {k: stat_table_key(target = state.target,
+                                        action_character = state.selected_character,
+                                        stat = k) for k in state.tables.keys()}
+        job_key = tuple(table_keys[x] for x in sorted(table_keys))
+        if state.table_job is not None and state.table_job.key == job_key and \
+                state.table_job.status not in ("cancelled", "failed"):
+            return None if state.table_job.done() else state.table_job
+
+        cached_tables = {k: app.table_cache.get(table_key) for k, table_key in table_keys.items()}
+        state.cancel_table_job()
+        if all([x is not None for x in cached_tables.values()]):
+            state.tables = cached_tables
+            state.table_character = state.selected_character
+            app.metrics.inc("minmax_table_lookups_total", source = "cache")
+            return None
+
+        stored_tables = app.table_stores.lookup(state.selected_sheet, state.target)
+        if stored_tables is not None:
+            state.tables = {k: stored_tables[k] for k in table_keys}
+            state.table_character = state.selected_character
+            app.metrics.inc("minmax_table_lookups_total", source = "store")
+            return None
+
+        app.metrics.inc("minmax_table_lookups_total", source = "build")
+        state.table_job = app.table_jobs.submit(job_key, build_session_tables,
+                                                g.session_id, state, state.target,
+                                                state.selected_character, table_keys,
+                                                cached_tables)
+        return state.table_job
 
 
 @app.route("/")
 def minmax_formpage():
-    action_sheet_files = os.listdir(character_actionsheet_path)
-    detail_sheet_files = os.listdir(character_detail_path)
-    action_sheets = [x.split(".")[0] for x in action_sheet_files]
-    detail_sheets = [x.split(".")[0] for x in detail_sheet_files]
-    doubly_available_sheets = [x for x in action_sheets if x in detail_sheets]
+    state = session_state()
+    doubly_available_sheets = app.sheet_registry.available_sheets()
 
     total_immunity_options = all_immunities + all_conditions
 
     action_times_list = ["Action", "Bonus Action", "Reaction", "Longer than 1T"]
 
-    if app.selected_character is None:
+    if state.selected_character is None:
         spell_levels = []
         character_stats = {"AC": "-",
                            "MaxHP": "-",
@@ -60,22 +225,22 @@ def minmax_formpage():
                            "WIS": "-",
                            "CHA": "-"}
     else:
-        spell_levels = [0] + list(app.selected_character.spellslots.keys()) 
-        st_mods = app.selected_character.ability_modifiers
-        character_stats = {"AC": "%s" % (app.selected_character.AC),
-                           "MaxHP": "%s"% (app.selected_character.MaxHP),
-                           "Prof.": "%s" % app.selected_character.Prof_Bonus,
-                           "STR": "%s (%s)" % (app.selected_character.STR,
+        spell_levels = [0] + list(state.selected_character.spellslots.keys()) 
+        st_mods = state.selected_character.ability_modifiers
+        character_stats = {"AC": "%s" % (state.selected_character.AC),
+                           "MaxHP": "%s"% (state.selected_character.MaxHP),
+                           "Prof.": "%s" % state.selected_character.Prof_Bonus,
+                           "STR": "%s (%s)" % (state.selected_character.STR,
                                              "+%s" % st_mods['STR'] if st_mods['STR'] >= 0 else st_mods['STR']),
-                           "DEX": "%s (%s)" % (app.selected_character.DEX,
+                           "DEX": "%s (%s)" % (state.selected_character.DEX,
                                              "+%s" % st_mods['DEX'] if st_mods['DEX'] >= 0 else st_mods['DEX']),
-                           "CON": "%s (%s)" % (app.selected_character.CON,
+                           "CON": "%s (%s)" % (state.selected_character.CON,
                                              "+%s" % st_mods['CON'] if st_mods['CON'] >= 0 else st_mods['CON']),
-                           "INT": "%s (%s)" % (app.selected_character.INT,
+                           "INT": "%s (%s)" % (state.selected_character.INT,
                                              "+%s" % st_mods['INT'] if st_mods['INT'] >= 0 else st_mods['INT']),
-                           "WIS": "%s (%s)" % (app.selected_character.WIS,
+                           "WIS": "%s (%s)" % (state.selected_character.WIS,
                                              "+%s" % st_mods['WIS'] if st_mods['WIS'] >= 0 else st_mods['WIS']),
-                           "CHA": "%s (%s)" % (app.selected_character.CHA,
+                           "CHA": "%s (%s)" % (state.selected_character.CHA,
                                              "+%s" % st_mods['CHA'] if st_mods['CHA'] >= 0 else st_mods['CHA']),}
 
     table_build_check()
@@ -96,28 +261,26 @@ def minmax_formpage():
 
 @app.route("/load_character_sheet", methods=["POST"])
 def load_character_sheet():
+    state = session_state()
     char_sheet_select_data = request.form
     chosen_character = char_sheet_select_data.get("chosen_char_sheet")
-    character_json = load_json_from_path(chosen_character)
-    app.selected_character = Character(**character_json)
-    character_action_filepath = "%s/%s.csv" % (character_actionsheet_path,
-                                           chosen_character)
-    app.selected_character.add_abilities_from_csv(character_action_filepath)
-    st_mods = app.selected_character.ability_modifiers
-    character_stats = {"AC": "%s" % (app.selected_character.AC),
-                        "MaxHP": "%s"% (app.selected_character.MaxHP),
-                        "Prof.": "%s" % app.selected_character.Prof_Bonus,
-                        "STR": "%s (%s)" % (app.selected_character.STR,
+    state.selected_character = app.sheet_registry.character(chosen_character)
+    state.selected_sheet = chosen_character
+    st_mods = state.selected_character.ability_modifiers
+    character_stats = {"AC": "%s" % (state.selected_character.AC),
+                        "MaxHP": "%s"% (state.selected_character.MaxHP),
+                        "Prof.": "%s" % state.selected_character.Prof_Bonus,
+                        "STR": "%s (%s)" % (state.selected_character.STR,
                                             "+%s" % st_mods['STR'] if st_mods['STR'] >= 0 else st_mods['STR']),
-                        "DEX": "%s (%s)" % (app.selected_character.DEX,
+                        "DEX": "%s (%s)" % (state.selected_character.DEX,
                                             "+%s" % st_mods['DEX'] if st_mods['DEX'] >= 0 else st_mods['DEX']),
-                        "CON": "%s (%s)" % (app.selected_character.CON,
+                        "CON": "%s (%s)" % (state.selected_character.CON,
                                             "+%s" % st_mods['CON'] if st_mods['CON'] >= 0 else st_mods['CON']),
-                        "INT": "%s (%s)" % (app.selected_character.INT,
+                        "INT": "%s (%s)" % (state.selected_character.INT,
                                             "+%s" % st_mods['INT'] if st_mods['INT'] >= 0 else st_mods['INT']),
-                        "WIS": "%s (%s)" % (app.selected_character.WIS,
+                        "WIS": "%s (%s)" % (state.selected_character.WIS,
                                             "+%s" % st_mods['WIS'] if st_mods['WIS'] >= 0 else st_mods['WIS']),
-                        "CHA": "%s (%s)" % (app.selected_character.CHA,
+                        "CHA": "%s (%s)" % (state.selected_character.CHA,
                                             "+%s" % st_mods['CHA'] if st_mods['CHA'] >= 0 else st_mods['CHA']),}
 
     table_build_check()
@@ -126,6 +289,7 @@ def load_character_sheet():
 
 @app.route("/input_target_stats", methods=['POST'])
 def input_target_stats():
+    state = session_state()
     target_stat_form_data = request.form
     target_info_dict = {
         "name": "target",
@@ -140,11 +304,11 @@ def input_target_stats():
         "ac": int(target_stat_form_data.get("target_AC")),
     }
 
-    if app.target_raw_dict is None:
-        app.target_raw_dict = target_info_dict
+    if state.target_raw_dict is None:
+        state.target_raw_dict = target_info_dict
     else:
-        app.target_raw_dict.update(target_info_dict)
-    app.target = Character(**target_info_dict)
+        state.target_raw_dict.update(target_info_dict)
+    state.target = Character(**target_info_dict)
 
     table_build_check()
     return redirect("/")
@@ -152,6 +316,7 @@ def input_target_stats():
 
 @app.route("/input_target_st_prof", methods=['POST'])
 def input_target_st_prof():
+    state = session_state()
     # Add in logic here to check that we have basic target stats first
     target_st_proff_form_data = request.form
     form_keys = list(target_st_proff_form_data.keys())
@@ -160,8 +325,8 @@ def input_target_st_prof():
         "st_proficiencies": st_profs
     }
 
-    app.target_raw_dict.update(target_st_info_dict)
-    app.target = Character(**app.target_raw_dict)
+    state.target_raw_dict.update(target_st_info_dict)
+    state.target = Character(**state.target_raw_dict)
 
     table_build_check()
     return redirect("/")
@@ -169,6 +334,7 @@ def input_target_st_prof():
 
 @app.route("/input_target_rvi", methods=['POST'])
 def input_target_rvi():
+    state = session_state()
     target_rvi_form_data = request.form
 
     known_key_map = {'target_resist': 'resistances', 
@@ -183,30 +349,61 @@ def input_target_rvi():
             values.pop(values.index("None"))
         target_rvi_dict[remapped_key] = values
 
-    app.target_raw_dict.update(target_rvi_dict)
-    app.target = Character(**app.target_raw_dict)
+    state.target_raw_dict.update(target_rvi_dict)
+    state.target = Character(**state.target_raw_dict)
+
+    table_build_check()
+    return redirect("/")
+
+
+@app.route("/monster_search", methods=['GET'])
+def monster_search():
+    prefix = request.args.get("prefix", "")
+    if not app.monster_catalog.available() or len(prefix) == 0:
+        return json.dumps([])
+
+    record_idx = app.monster_catalog.prefix_search(prefix, limit = 20)
+    return json.dumps([{"name": name, "cr": float(cr), "ac": int(ac)} for name, cr, ac in
+                       zip(app.monster_catalog.names_of(record_idx),
+                           app.monster_catalog.cr[record_idx],
+                           app.monster_catalog.ac[record_idx])])
+
+
+@app.route("/load_target_monster", methods=['POST'])
+def load_target_monster():
+    state = session_state()
+    monster_name = request.form.get("monster_name", "")
+    try:
+        record_idx = app.monster_catalog.lookup(monster_name)
+    except (KeyError, OSError):
+        logger.info("No catalog monster named '%s'.", monster_name)
+        return redirect("/")
+
+    state.target_raw_dict = app.monster_catalog.character_kwargs(record_idx)
+    state.target = Character(**state.target_raw_dict)
 
     table_build_check()
     return redirect("/")
 
 
 def target_form_fill(variable, rvi_type: str = None):
-    if app.target is None:
+    state = session_state()
+    if state.target is None:
         return ""
     else:
         if variable[:3] == "st_":
             saving_throw_type = variable.strip("st_")
-            if app.target.st_proficiencies[saving_throw_type]:
+            if state.target.st_proficiencies[saving_throw_type]:
                 return 'checked'
             else:
                 return ''
         elif "rvi" in variable and rvi_type is not None:
             if "resist" in variable:
-                rvi_lookup_dict = app.target.resistances
+                rvi_lookup_dict = state.target.resistances
             elif "vulnerability" in variable:
-                rvi_lookup_dict = app.target.vulnerablities
+                rvi_lookup_dict = state.target.vulnerablities
             else:
-                rvi_lookup_dict = app.target.immunities
+                rvi_lookup_dict = state.target.immunities
             
             if rvi_lookup_dict[rvi_type]:
                 return 'selected'
@@ -214,22 +411,24 @@ def target_form_fill(variable, rvi_type: str = None):
                 return ''
         else:
             try:
-                return getattr(app.target, variable)
+                return getattr(state.target, variable)
             except AttributeError:
                 return ''
             
 
 def character_select_form_fill(char_name):
-    if app.selected_character is None and char_name == "placeholder":
+    state = session_state()
+    if state.selected_character is None and char_name == "placeholder":
         return 'selected'
-    elif app.selected_character is not None and app.selected_character.name.lower() == char_name.lower():
+    elif state.selected_character is not None and state.selected_character.name.lower() == char_name.lower():
         return 'selected'
     else:
         return ''
             
 
 def ability_filter_form_fill(filter_type, filter_value):
-    check_list = app.character_ability_filters[filter_type]
+    state = session_state()
+    check_list = state.character_ability_filters[filter_type]
     if filter_type == "action_type":
         filter_value = filter_value[0]
     if filter_value in check_list:
@@ -240,7 +439,8 @@ def ability_filter_form_fill(filter_type, filter_value):
 
 @app.route("/spell_filter_options_refresh", methods=['POST', 'GET'])
 def spell_filter_options_refresh():
-    spell_levels = [0] + list(app.selected_character.spellslots.keys())
+    state = session_state()
+    spell_levels = [0] + list(state.selected_character.spellslots.keys())
     return render_template('spell_filter_options.html',
                            all_spell_levels=spell_levels,
                            ability_filter_form_fill=ability_filter_form_fill)
@@ -248,43 +448,37 @@ def spell_filter_options_refresh():
 
 @app.route("/hit_tables_fill", methods=['POST', 'GET'])
 def hit_tables_fill():
+    state = session_state()
     hit_max_tuples = {"phit": None,
                       "ehit": None,
                       "econ": None}
-    if all([x is None for x in app.tables.values()]):
+    if all([x is None for x in state.tables.values()]) or state.target is None:
         dummy_dict = {x: [] for x in ['AC'] + DC_types}
-        print("No tables found...")
+        logger.debug("No tables found...")
         return render_template('hit_table_row_divs.html', 
                                all_roll_types = ["AC"] + DC_types,
                                phit_items=dummy_dict,
                                ehit_items=dummy_dict,
                                econ_items=dummy_dict)
     else:
-        print("Calculating maxes...")
-        for stat, calc_table in app.tables.items():
-            hit_max_tuple_sub_dict = {}
-            for roll_filter in DC_types + ["AC"]:
-                if roll_filter == "AC":
-                    check_value = app.target.AC
-                else:
-                    check_value = app.target.st_modifiers[roll_filter]
-                table_maxes = retrieve_table_maxes(calc_table,
-                                                app.selected_character.abilities,
-                                                check_value = check_value,
-                                                roll_filter = roll_filter,
-                                                action_time_filter = app.character_ability_filters['action_type'],
-                                                spell_level_filter = app.character_ability_filters['spell_level'],
-                                                damage_type_filter = app.character_ability_filters['damage_type'],
-                                                n_options=3).sort_values(ascending=False)
-                table_max_tuples = [(v, k) for k, v in table_maxes.to_dict().items()]
-                if stat == 'phit':
-                    table_max_tuples = [("%.0f%%" % (x[0] * 100), x[1]) for x in table_max_tuples]
-                else:
-                    table_max_tuples = [("%.1f" % x[0], x[1]) for x in table_max_tuples]
-            
-                hit_max_tuple_sub_dict[roll_filter] = table_max_tuples
-            
-            hit_max_tuples[stat] = hit_max_tuple_sub_dict
+        logger.debug("Calculating maxes...")
+        roll_check_values = {x: state.target.st_modifiers[x] for x in DC_types}
+        roll_check_values["AC"] = state.target.AC
+        batched_maxes = retrieve_batched_table_maxes(state.tables,
+                                                     state.table_character.abilities,
+                                                     roll_check_values = roll_check_values,
+                                                     action_time_filter = state.character_ability_filters['action_type'],
+                                                     spell_level_filter = state.character_ability_filters['spell_level'],
+                                                     damage_type_filter = state.character_ability_filters['damage_type'],
+                                                     n_options=3,
+                                                     ability_index = state.table_character.get_ability_index())
+        for stat, stat_maxes in batched_maxes.items():
+            if stat == 'phit':
+                value_format = lambda x: "%.0f%%" % (x * 100)
+            else:
+                value_format = lambda x: "%.1f" % x
+            hit_max_tuples[stat] = {roll_filter: [(value_format(v), k) for v, k in table_max_tuples]
+                                    for roll_filter, table_max_tuples in stat_maxes.items()}
 
         return render_template('hit_table_row_divs.html', 
                                all_roll_types = ["AC"] + DC_types,
@@ -293,16 +487,72 @@ def hit_tables_fill():
                                econ_items=hit_max_tuples['econ'])
 
 
+@app.route("/table_status", methods=['GET'])
+def table_status():
+    # Polled by the page while a table job runs
+    state = session_state()
+    if state.table_job is None:
+        return json.dumps({"job_id": None, "status": "idle", "progress": 1.0, "error": None})
+    return json.dumps(state.table_job.to_dict())
+
+
+@app.route("/export_tables", methods=['GET'])
+def export_tables_download():
+    # Streams the session character's stat tables as a chunked download,
+    # against the current target or (targets=catalog) every catalog monster
+    # matching prefix/cr_min/cr_max, without holding more than one chunk
+    state = session_state()
+    export_format = request.args.get("format", "csv")
+    if export_format not in export_formats:
+        return "format must be one of %s." % list(export_formats.keys()), 400
+    if state.selected_character is None:
+        return "Load a character sheet first.", 400
+    stats = request.args.getlist("stat") or accepted_stats
+    if any([x not in accepted_stats for x in stats]):
+        return "stat must be one of %s." % accepted_stats, 400
+    # Checked here, as errors inside the stream would cut off a 200 download
+    chunk_rows = request.args.get("chunk_rows", "65536")
+    if not chunk_rows.isdigit() or int(chunk_rows) <= 0:
+        return "chunk_rows must be a positive integer.", 400
+    cr_bounds = {}
+    for cr_arg in ["cr_min", "cr_max"]:
+        try:
+            cr_bounds[cr_arg] = None if request.args.get(cr_arg) in (None, "") \
+                else parse_cr(request.args.get(cr_arg))
+        except (ValueError, ZeroDivisionError):
+            return "%s must be a number or fraction like 1/4." % cr_arg, 400
+
+    if request.args.get("targets", "current") == "catalog":
+        if not app.monster_catalog.available():
+            return "No monster catalog found.", 404
+        record_idx = app.monster_catalog.query(prefix = request.args.get("prefix"),
+                                               cr_min = cr_bounds["cr_min"],
+                                               cr_max = cr_bounds["cr_max"])
+        targets = (Character(**app.monster_catalog.character_kwargs(x)) for x in record_idx)
+    elif state.target is not None:
+        targets = [state.target]
+    else:
+        return "Enter a target first.", 400
+
+    chunks = rechunk_blocks(table_row_blocks({state.selected_character.name: state.selected_character},
+                                             targets, stats = stats),
+                            chunk_rows = int(chunk_rows))
+    return Response(stream_with_context(text_chunks(chunks, export_format)),
+                    mimetype = export_formats[export_format],
+                    headers = {"Content-Disposition": 'attachment; filename="minmax_tables.%s"'
+                                                      % export_format})
+
+
 @app.route("/target_clear")
 def target_clear():
-    app.target = None
-    app.target_raw_dict = None
-    app.tables = {"econ": None, "ehit": None, "phit": None}
+    state = session_state()
+    state.clear_target()
     return redirect("/")
 
 
 @app.route("/input_ability_filters", methods=['POST'])
 def input_ability_filters():
+    state = session_state()
     ability_filters_formdata = request.form
 
     filter_keys = ['roll_type', 'spell_level',
@@ -324,18 +574,13 @@ def input_ability_filters():
 
         action_filter_dict[filter_key] = filter_value
     
-    app.character_ability_filters.update(action_filter_dict)
+    state.character_ability_filters.update(action_filter_dict)
 
     return redirect("/")
 
 
 def retrieve_character_list():
-    character_sheets = os.listdir(character_detail_path)
-    if ".DS_Store" in character_sheets:
-        character_sheets.pop(character_sheets.index(".DS_Store"))
-    character_sheets = [x.strip(".json") for x in character_sheets]
-
-    return character_sheets
+    return app.sheet_registry.detail_sheets()
 
 
 @app.route("/modify_sheets")
@@ -363,6 +608,8 @@ def save_character_json_input():
     f_path = "%s/%s_TEST.json" % (character_detail_path, editing_character.lower())
     with open(f_path, 'w') as wf:
         json.dump(parsed_text_value_dict, wf)
+    # The directory poll may have just run, so rescan to list the new sheet
+    app.sheet_registry.refresh(force = True)
 
     return render_template('char_select_options.html',
                            available_characters = sorted(retrieve_character_list()))
@@ -372,5 +619,25 @@ def save_character_json_input():
 def new_character_json_input():
     return blanked_char_sheet
 
+@app.route("/metrics", methods=['GET'])
+def metrics_page():
+    # Prometheus text format, only served to local scrapers
+    if request.remote_addr not in ("127.0.0.1", "::1"):
+        return Response("Forbidden\n", status = 403, mimetype = "text/plain")
+    return Response(app.metrics.render(), content_type = prometheus_content_type)
+
+
+def prewarm_app():
+    # Compiles the page templates, parses every available character sheet and
+    # maps their table stores ahead of the first requests that need them
+    for template_name in ["minmax_ui.html", "hit_table_row_divs.html",
+                          "spell_filter_options.html"]:
+        app.jinja_env.get_template(template_name)
+    app.sheet_registry.prewarm()
+    app.table_stores.open_all()
+
+
 if __name__ == "__main__":
-    app.run(port=8080, debug = True)
\ No newline at end of file
+    logging.basicConfig(level = logging.INFO, format = "%(asctime)s %(name)s %(levelname)s: %(message)s")
+    threading.Thread(target = prewarm_app, name = "app_prewarm", daemon = True).start()
+    app.run(port=8080, debug = True, threaded = True)
\ No newline at end of file
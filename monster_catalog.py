@@ -0,0 +1,277 @@
+from character import Character
+from errors import BadArgumentFromListErrorCheck
+from fixed_names import damage_types, damage_type_codes, DC_types, monster_catalog_path
+import inspect
+import io
+import json
+from math import floor
+import numpy as np
+import os
+from sheet_compiler import file_sha1, unreadable_npz_errors
+import threading
+
+catalog_index_suffix = ".index.npz"
+
+# Stat block keys Character accepts; anything else (cr, type, ...) is
+# catalog metadata
+character_fields = set(inspect.signature(Character.__init__).parameters) - {"self"}
+
+score_fields = ["strength", "dexterity", "constitution", "intelligence", "wisdom", "charisma"]
+rvi_fields = ["resistances", "vulnerabilities", "immunities"]
+
+
+def parse_cr(cr):
+    if type(cr) is str and "/" in cr:
+        numerator, denominator = cr.split("/")
+        return int(numerator) / int(denominator)
+    return float(cr)
+
+
+def damage_type_bitmask(damage_type_list: list[str]):
+    # One bit per entry of damage_types; non damage entries like
+    # "Bludgeoning (NM)" or conditions have no bit
+    bitmask = 0
+    for damage_type in damage_type_list:
+        if damage_type in damage_type_codes:
+            bitmask |= 1 << damage_type_codes[damage_type]
+    return bitmask
+
+
+def stat_block_record(stat_block: dict):
+    # The compact per-monster values every index is built from
+    scores = [stat_block[x] for x in score_fields]
+    proficiency_bonus = stat_block.get("proficiency_bonus", 0)
+    st_proficiencies = stat_block.get("st_proficiencies", [])
+    st_modifiers = [floor((x - 10)/2) + (proficiency_bonus if y in st_proficiencies else 0)
+                    for x, y in zip(scores, DC_types)]
+    return (stat_block["name"], parse_cr(stat_block.get("cr", 0)), stat_block["ac"],
+            stat_block["hp"], scores, st_modifiers, proficiency_bonus,
+            [damage_type_bitmask(stat_block.get(x, [])) for x in rvi_fields])
+
+
+def read_catalog_blocks(catalog_path: str):
+    # (stat block, byte offset, byte length); JSON arrays have no offsets
+    if catalog_path.endswith(".jsonl"):
+        with open(catalog_path, "rb") as f:
+            offset = 0
+            for line in f:
+                if line.strip():
+                    yield json.loads(line), offset, len(line)
+                offset += len(line)
+    else:
+        with open(catalog_path, "r") as f:
+            for stat_block in json.load(f):
+                yield stat_block, -1, 0
+
+
+def catalog_index_path(catalog_path: str):
+    return os.path.splitext(catalog_path)[0] + catalog_index_suffix
+
+
+def compile_catalog_index(catalog_path: str, output_path: str = None):
+    if output_path is None:
+        output_path = catalog_index_path(catalog_path)
+
+    records, offsets, lengths = [], [], []
+    for stat_block, offset, length in read_catalog_blocks(catalog_path):
+        records.append(stat_block_record(stat_block))
+        offsets.append(offset)
+        lengths.append(length)
+
+    source_stat = os.stat(catalog_path)
+    # Written under a temporary name and then replaced, so readers never load
+    # a half written index
+    write_path = output_path
+    if isinstance(output_path, str):
+        write_path = "%s.%s.%s.tmp.npz" % (output_path, os.getpid(), threading.get_ident())
+    try:
+        np.savez(write_path,
+                 names = np.array([x[0] for x in records], dtype = np.str_),
+                 cr = np.array([x[1] for x in records], dtype = np.float64),
+                 ac = np.array([x[2] for x in records], dtype = np.int16),
+                 hp = np.array([x[3] for x in records], dtype = np.int32),
+                 scores = np.array([x[4] for x in records], dtype = np.int16).reshape(-1, 6),
+                 st_modifiers = np.array([x[5] for x in records], dtype = np.int16).reshape(-1, 6),
+                 proficiency_bonus = np.array([x[6] for x in records], dtype = np.int8),
+                 rvi_bitmasks = np.array([x[7] for x in records], dtype = np.uint32).reshape(-1, 3),
+                 offsets = np.array(offsets, dtype = np.int64),
+                 lengths = np.array(lengths, dtype = np.int32),
+                 __source_mtime_ns__ = np.array(source_stat.st_mtime_ns, dtype = np.int64),
+                 __source_size__ = np.array(source_stat.st_size, dtype = np.int64),
+                 __source_sha1__ = np.array(file_sha1(catalog_path), dtype = np.str_))
+    except BaseException:
+        if write_path is not output_path and os.path.exists(write_path):
+            os.remove(write_path)
+        raise
+    if write_path is not output_path:
+        os.replace(write_path, output_path)
+    return output_path
+
+
+def catalog_index_is_current(catalog_path: str, index_path: str = None):
+    if index_path is None:
+        index_path = catalog_index_path(catalog_path)
+    if not os.path.exists(index_path):
+        return False
+
+    source_stat = os.stat(catalog_path)
+    try:
+        with np.load(index_path) as catalog_index:
+            if int(catalog_index["__source_mtime_ns__"]) == source_stat.st_mtime_ns and \
+                    int(catalog_index["__source_size__"]) == source_stat.st_size:
+                return True
+            return str(catalog_index["__source_sha1__"]) == file_sha1(catalog_path)
+    except unreadable_npz_errors:
+        return False
+
+
+class MonsterCatalog:
+    # Monster stat blocks as parallel arrays (cr, ac, hp, scores, save
+    # modifiers, RVI bitmasks) with sorted indexes for name prefix, CR and AC
+    # lookups. Arrays come from a compiled index next to the catalog, so with
+    # lazy=True nothing is read until the first query, and full stat blocks of
+    # a JSONL catalog are only parsed when a target is built from them.
+    def __init__(self, catalog_path: str = monster_catalog_path, lazy: bool = True):
+        self.catalog_path = catalog_path
+        self.loaded = False
+        self.stat_blocks = {}
+        self.load_lock = threading.Lock()
+        if not lazy:
+            self.load()
+
+    def __len__(self):
+        self.load()
+        return len(self.names)
+
+    def __repr__(self):
+        if not self.loaded:
+            return "MonsterCatalog(%s, not loaded)" % self.catalog_path
+        return "MonsterCatalog(%s, n=%s)" % (self.catalog_path, len(self.names))
+
+    def available(self):
+        return os.path.exists(self.catalog_path)
+
+    def load(self):
+        if self.loaded:
+            return self
+        with self.load_lock:
+            if not self.loaded:
+                self.load_index()
+        return self
+
+    def load_index(self):
+        index_path = catalog_index_path(self.catalog_path)
+        if not catalog_index_is_current(self.catalog_path, index_path):
+            index_path = self.recompile_index(index_path)
+
+        try:
+            self.read_index(index_path)
+        except unreadable_npz_errors:
+            # A truncated or corrupt index is as good as a stale one
+            self.read_index(self.recompile_index(index_path))
+
+        self.name_lookup = {str(x).lower(): i for i, x in enumerate(self.names)}
+        self.name_order = np.argsort(np.char.lower(self.names), kind = "stable")
+        self.sorted_names = np.char.lower(self.names)[self.name_order]
+        self.cr_order = np.argsort(self.cr, kind = "stable")
+        self.ac_order = np.argsort(self.ac, kind = "stable")
+        self.loaded = True
+
+    def recompile_index(self, index_path: str):
+        try:
+            return compile_catalog_index(self.catalog_path, index_path)
+        except OSError:
+            # Read-only catalog directory, compile to memory instead
+            index_buffer = io.BytesIO()
+            compile_catalog_index(self.catalog_path, index_buffer)
+            index_buffer.seek(0)
+            return index_buffer
+
+    def read_index(self, index_path):
+        with np.load(index_path) as catalog_index:
+            for array_name in ["names", "cr", "ac", "hp", "scores", "st_modifiers",
+                               "proficiency_bonus", "rvi_bitmasks", "offsets", "lengths"]:
+                setattr(self, array_name, catalog_index[array_name])
+
+    def lookup(self, name: str):
+        # Record index of an exact (case insensitive) name
+        self.load()
+        if name.lower() not in self.name_lookup:
+            raise KeyError("No monster named '%s' in the catalog." % name)
+        return self.name_lookup[name.lower()]
+
+    def prefix_search(self, prefix: str, limit: int = None):
+        # Record indices whose name starts with prefix, in name order
+        self.load()
+        prefix = prefix.lower()
+        start = np.searchsorted(self.sorted_names, prefix, side = "left")
+        end = np.searchsorted(self.sorted_names, prefix + "\U0010ffff", side = "left")
+        if limit is not None:
+            end = min(end, start + limit)
+        return self.name_order[start:end]
+
+    def range_mask(self, order: np.ndarray, values: np.ndarray, value_min = None, value_max = None):
+        sorted_values = values[order]
+        start = 0 if value_min is None else np.searchsorted(sorted_values, value_min, side = "left")
+        end = len(values) if value_max is None else \
+            np.searchsorted(sorted_values, value_max, side = "right")
+        mask = np.zeros(len(values), dtype = bool)
+        mask[order[start:end]] = True
+        return mask
+
+    def rvi_mask(self, rvi_field: str, damage_type_list: list[str]):
+        # Monsters with every listed damage type in the given RVI field
+        BadArgumentFromListErrorCheck(rvi_field, rvi_fields)
+        [BadArgumentFromListErrorCheck(x, damage_types) for x in damage_type_list]
+        required = damage_type_bitmask(damage_type_list)
+        return (self.rvi_bitmasks[:, rvi_fields.index(rvi_field)] & required) == required
+
+    def query(self,
+              prefix: str = None,
+              cr_min: float = None,
+              cr_max: float = None,
+              ac_min: int = None,
+              ac_max: int = None,
+              resistances: list[str] = [],
+              vulnerabilities: list[str] = [],
+              immunities: list[str] = []):
+        # Record indices matching every given filter, in catalog order
+        self.load()
+        mask = np.ones(len(self.names), dtype = bool)
+        if prefix is not None:
+            mask[:] = False
+            mask[self.prefix_search(prefix)] = True
+        if cr_min is not None or cr_max is not None:
+            mask &= self.range_mask(self.cr_order, self.cr,
+                                    None if cr_min is None else parse_cr(cr_min),
+                                    None if cr_max is None else parse_cr(cr_max))
+        if ac_min is not None or ac_max is not None:
+            mask &= self.range_mask(self.ac_order, self.ac, ac_min, ac_max)
+        for rvi_field, damage_type_list in zip(rvi_fields, [resistances, vulnerabilities,
+                                                            immunities]):
+            if len(damage_type_list) > 0:
+                mask &= self.rvi_mask(rvi_field, damage_type_list)
+        return np.flatnonzero(mask)
+
+    def names_of(self, record_idx: np.ndarray):
+        return [str(x) for x in self.names[record_idx]]
+
+    def stat_block(self, record_idx: int):
+        self.load()
+        record_idx = int(record_idx)
+        if record_idx not in self.stat_blocks:
+            if self.offsets[record_idx] >= 0:
+                with open(self.catalog_path, "rb") as f:
+                    f.seek(self.offsets[record_idx])
+                    self.stat_blocks[record_idx] = json.loads(f.read(self.lengths[record_idx]))
+            else:
+                # JSON arrays have no offsets, so the first read parses them all
+                for i, (stat_block, _, _) in enumerate(read_catalog_blocks(self.catalog_path)):
+                    self.stat_blocks[i] = stat_block
+        return dict(self.stat_blocks[record_idx])
+
+    def character_kwargs(self, record_idx: int):
+        return {k: v for k, v in self.stat_block(record_idx).items() if k in character_fields}
+
+    def target(self, name: str):
+        return Character(**self.character_kwargs(self.lookup(name)))
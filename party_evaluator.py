@@ -0,0 +1,228 @@
+from ability_index import top_k_positions
+from character import Character
+from concurrent.futures import ProcessPoolExecutor
+from fixed_names import character_actionsheet_path, character_detail_path, DC_types
+import json
+from multiprocessing import shared_memory
+import numpy as np
+import os
+from roll_kernels import RollKernel
+from table_engine import (accepted_stats, AbilityColumns, character_columns, crit_damage_column,
+                          economy_cost_column, economy_matrix, expected_hit_matrix,
+                          hit_probability_values, rvi_column, scarcity_column)
+
+# Order of the stat axis in every result
+evaluated_stats = ["phit", "ehit", "econ"]
+
+
+class PartyEvaluation:
+    # values[character, ability, target, stat], abilities padded with NaN up
+    # to the largest sheet; ability_mask marks the real entries.
+    def __init__(self,
+                 values: np.ndarray,
+                 character_names: list[str],
+                 ability_names: list[list[str]],
+                 target_names: list[str]):
+        self.values = values
+        self.character_names = character_names
+        self.ability_names = ability_names
+        self.target_names = target_names
+        self.stats = evaluated_stats
+        self.ability_mask = np.zeros(values.shape[:2], dtype = bool)
+        for i, names in enumerate(ability_names):
+            self.ability_mask[i, :len(names)] = True
+
+    def __repr__(self):
+        return "PartyEvaluation(characters=%s, targets=%s, max_abilities=%s)" % \
+            (len(self.character_names), len(self.target_names), self.values.shape[1])
+
+    def character_stat(self, character_name: str, stat: str):
+        # (ability, target) array of one character's stat, without padding
+        if stat not in self.stats:
+            raise ValueError("stat must be one of %s." % self.stats)
+        char_idx = self.character_names.index(character_name)
+        n_abilities = len(self.ability_names[char_idx])
+        return self.values[char_idx, :n_abilities, :, self.stats.index(stat)]
+
+    def best_options(self, stat: str = "ehit", n_options: int = 3):
+        # {character: {target: [(value, ability_name), ...]}}, best first
+        best = {}
+        for character_name, names in zip(self.character_names, self.ability_names):
+            stat_values = self.character_stat(character_name, stat)
+            best[character_name] = {}
+            for target_idx, target_name in enumerate(self.target_names):
+                top_positions = top_k_positions(stat_values[:, target_idx], n_options)[::-1]
+                best[character_name][target_name] = [(stat_values[x, target_idx], names[x])
+                                                      for x in top_positions]
+        return best
+
+    def to_frame(self):
+        # Long format, one row per character, ability and target
+        import pandas as pd
+
+        rows = []
+        for char_idx, (character_name, names) in enumerate(zip(self.character_names,
+                                                               self.ability_names)):
+            for ability_idx, ability_name in enumerate(names):
+                for target_idx, target_name in enumerate(self.target_names):
+                    rows.append([character_name, ability_name, target_name] +
+                                list(self.values[char_idx, ability_idx, target_idx]))
+        return pd.DataFrame(rows, columns = ["character", "ability", "target"] + self.stats)
+
+
+def available_sheet_names(detail_path: str = character_detail_path,
+                          actionsheet_path: str = character_actionsheet_path):
+    # Characters with both a details JSON and an action sheet CSV
+    action_sheets = [x[:-4] for x in os.listdir(actionsheet_path) if x.endswith(".csv")]
+    detail_sheets = [x[:-5] for x in os.listdir(detail_path) if x.endswith(".json")]
+    return sorted([x for x in action_sheets if x in detail_sheets])
+
+
+def load_party(character_names: list[str] = None,
+               detail_path: str = character_detail_path,
+               actionsheet_path: str = character_actionsheet_path):
+    if character_names is None:
+        character_names = available_sheet_names(detail_path, actionsheet_path)
+
+    party = {}
+    for character_name in character_names:
+        with open(os.path.join(detail_path, "%s.json" % character_name), "r") as f:
+            party_member = Character(**json.load(f))
+        party_member.add_abilities_from_csv(os.path.join(actionsheet_path,
+                                                         "%s.csv" % character_name))
+        party[character_name] = party_member
+    return party
+
+
+def load_targets(targets):
+    # Stat blocks as Characters, from a JSON file holding one block or a list
+    # of blocks, or from a list of blocks/Characters already in memory
+    if type(targets) is str:
+        with open(targets, "r") as f:
+            targets = json.load(f)
+    if type(targets) is dict:
+        targets = [targets]
+    return [x if isinstance(x, Character) else Character(**x) for x in targets]
+
+
+def target_check_matrix(columns: AbilityColumns, targets: list[Character]):
+    # (target, ability) value each ability rolls against, as in
+    # ability_check_values but for every target at once
+    target_ac = np.array([x.AC for x in targets], dtype = float)
+    target_saves = np.array([[x.st_modifiers[y] for y in DC_types] for x in targets], dtype = float)
+    save_idx = np.array([DC_types.index(x) if x in DC_types else 0 for x in columns.DC_type],
+                        dtype = int)
+    return np.where(columns.is_save, target_saves[:, save_idx], target_ac[:, None])
+
+
+def evaluate_character(columns: AbilityColumns,
+                       cost_root: np.ndarray,
+                       check_matrix: np.ndarray,
+                       rvi_matrix: np.ndarray,
+                       attack_kernel: RollKernel = None,
+                       save_kernel: RollKernel = None,
+                       crits: bool = False):
+    # (ability, target, stat) block for one character against every target
+    hit_probability = hit_probability_values(columns, check_matrix,
+                                             attack_kernel = attack_kernel,
+                                             save_kernel = save_kernel)
+    expected_hit = expected_hit_matrix(columns, hit_probability, rvi_matrix,
+                                       crit_damage_column(columns, attack_kernel) if crits else None)
+    economy = economy_matrix(columns, expected_hit, cost_root)
+    return np.stack([hit_probability, expected_hit, economy], axis = -1).transpose(1, 0, 2)
+
+
+def evaluate_into_shared(shared_name: str,
+                         shape: tuple,
+                         char_idx: int,
+                         *evaluate_args):
+    # Worker side: writes one character's block straight into the shared
+    # result array instead of pickling it back
+    shared_block = shared_memory.SharedMemory(name = shared_name)
+    try:
+        results = np.ndarray(shape, dtype = np.float64, buffer = shared_block.buf)
+        block = evaluate_character(*evaluate_args)
+        results[char_idx, :block.shape[0]] = block
+    finally:
+        shared_block.close()
+    return char_idx
+
+
+def evaluate_party(party: dict,
+                   targets: list,
+                   scarcity_coeff: float = 0.45,
+                   attack_kernel: RollKernel = None,
+                   save_kernel: RollKernel = None,
+                   crits: bool = False,
+                   n_workers: int = 1):
+    # Every party member's phit/ehit/econ for every ability against every
+    # target at its own AC/ST, i.e. build_target_stat_row for the whole grid.
+    # With n_workers > 1 characters are spread over processes that fill one
+    # shared memory array.
+    targets = load_targets(targets)
+    if len(party) == 0 or len(targets) == 0:
+        raise ValueError("party and targets must each hold at least one entry.")
+
+    character_names = list(party.keys())
+    character_args = []
+    for party_member in party.values():
+        columns = character_columns(party_member)
+        cost_root = economy_cost_column(columns,
+                                        scarcity_column(columns, party_member, scarcity_coeff))
+        rvi_matrix = np.stack([rvi_column(columns, x) for x in targets])
+        character_args.append((columns, cost_root, target_check_matrix(columns, targets),
+                               rvi_matrix, attack_kernel, save_kernel, crits))
+
+    max_abilities = max([len(x[0]) for x in character_args])
+    shape = (len(character_names), max_abilities, len(targets), len(evaluated_stats))
+    ability_names = [x[0].names for x in character_args]
+    target_names = [x.name for x in targets]
+
+    if n_workers > 1 and len(character_args) > 1:
+        shared_block = shared_memory.SharedMemory(create = True,
+                                                  size = max(int(np.prod(shape)) * 8, 1))
+        try:
+            results = np.ndarray(shape, dtype = np.float64, buffer = shared_block.buf)
+            results[:] = np.nan
+            with ProcessPoolExecutor(max_workers = n_workers) as executor:
+                list(executor.map(evaluate_into_shared,
+                                  [shared_block.name] * len(character_args),
+                                  [shape] * len(character_args),
+                                  range(len(character_args)),
+                                  *zip(*character_args)))
+            values = results.copy()
+            del results
+        finally:
+            shared_block.close()
+            shared_block.unlink()
+    else:
+        values = np.full(shape, np.nan)
+        for char_idx, evaluate_args in enumerate(character_args):
+            block = evaluate_character(*evaluate_args)
+            values[char_idx, :block.shape[0]] = block
+
+    return PartyEvaluation(values, character_names, ability_names, target_names)
+
+
+if __name__ == "__main__":
+    import argparse
+    import warnings
+
+    parser = argparse.ArgumentParser(description = "Evaluate every party member against every "
+                                                   "target stat block.")
+    parser.add_argument("targets", help = "JSON file with one target stat block or a list.")
+    parser.add_argument("--characters", nargs = "+",
+                        help = "Character sheet names, default every available sheet.")
+    parser.add_argument("--stat", default = "ehit", choices = accepted_stats)
+    parser.add_argument("--n-options", type = int, default = 3)
+    parser.add_argument("--workers", type = int, default = 1)
+    args = parser.parse_args()
+
+    warnings.simplefilter("ignore", RuntimeWarning)
+    evaluation = evaluate_party(load_party(args.characters), args.targets,
+                                n_workers = args.workers)
+    for character_name, target_options in evaluation.best_options(args.stat,
+                                                                   args.n_options).items():
+        for target_name, options in target_options.items():
+            print("%s vs %s: %s" % (character_name, target_name,
+                                    ", ".join(["%s (%.2f)" % (x[1], x[0]) for x in options])))
@@ -0,0 +1,165 @@
+from character import Character
+from combat_simulator import turn_budgets
+from functools import lru_cache
+from itertools import product
+import numpy as np
+from table_engine import build_target_stat_row, character_columns
+
+
+class TurnOption:
+    def __init__(self, ability_idx: int, value: float, uses_idx: int = -1):
+        self.ability_idx = ability_idx
+        self.value = value
+        self.uses_idx = uses_idx
+
+
+class ScheduleResult:
+    def __init__(self, value: float, schedule: list[dict], n_states: int):
+        self.value = value
+        self.schedule = schedule
+        self.n_states = n_states
+
+    def __repr__(self):
+        return "ScheduleResult(value=%.2f, rounds=%s, states=%s)" % (self.value,
+                                                                     len(self.schedule),
+                                                                     self.n_states)
+
+
+def optimize_resource_schedule(action_character: Character,
+                               target: Character,
+                               n_rounds: int = 5,
+                               allow_upcast: bool = True):
+    # Maximises total expected hit over n_rounds by DP over (rounds left,
+    # remaining slots per level, remaining uses of limited abilities). Each
+    # round is one Action, Bonus Action and Reaction with at most one slotted
+    # spell. Upcasting lets a spell use any higher slot, with no extra damage
+    # since sheets don't describe upcast scaling.
+    #
+    # To keep a level 20 slot table interactive:
+    # - slot and use counts are capped at n_rounds, since no more can be spent
+    # - slot levels no spell can use are dropped from the state
+    # - within a budget, only the best unlimited ability is kept, plus any
+    #   limited ability or slotted spell that beats it
+    # - a spell always takes the lowest slot it fits, as any spell a low slot
+    #   can power a higher slot can too
+    # - states with nothing left to spend are closed-form
+    if n_rounds < 0:
+        raise ValueError("n_rounds must be a non-negative integer.")
+
+    columns = character_columns(action_character)
+    values = build_target_stat_row(target, action_character, "ehit", columns = columns)
+    action_time = np.array([x.action_time for x in columns.actions])
+    n_uses = [x.n_uses for x in columns.actions]
+    usable = np.isfinite(values) & np.array([x is None or x > 0 for x in n_uses], dtype = bool)
+
+    limited_caps = []
+    free_options = {}
+    spell_options = {}
+    for budget in turn_budgets:
+        budget_idx = np.flatnonzero(usable & (action_time == budget))
+        unlimited_free = [i for i in budget_idx if columns.spell_level[i] == 0 and n_uses[i] is None]
+        best_free = max(unlimited_free, key = lambda i: values[i], default = -1)
+        best_free_value = max(values[best_free], 0) if best_free >= 0 else 0
+        if best_free_value == 0:
+            best_free = -1
+        budget_free = [TurnOption(best_free, best_free_value)]
+        budget_spells = []
+
+        for i in budget_idx:
+            if columns.spell_level[i] == 0 and n_uses[i] is not None and values[i] > best_free_value:
+                limited_caps.append(min(n_uses[i], n_rounds))
+                budget_free.append(TurnOption(i, values[i], len(limited_caps) - 1))
+
+        for level in sorted(set(columns.spell_level[budget_idx]) - {0}):
+            level_idx = [i for i in budget_idx if columns.spell_level[i] == level]
+            unlimited_spells = [i for i in level_idx if n_uses[i] is None]
+            best_spell = max(unlimited_spells, key = lambda i: values[i], default = -1)
+            best_spell_value = values[best_spell] if best_spell >= 0 else -np.inf
+            if best_spell_value > best_free_value:
+                budget_spells.append(TurnOption(best_spell, best_spell_value))
+            for i in level_idx:
+                if n_uses[i] is not None and values[i] > max(best_spell_value, best_free_value):
+                    limited_caps.append(min(n_uses[i], n_rounds))
+                    budget_spells.append(TurnOption(i, values[i], len(limited_caps) - 1))
+
+        free_options[budget] = budget_free
+        spell_options[budget] = budget_spells
+
+    spell_levels = sorted(set([columns.spell_level[x.ability_idx] for b in turn_budgets
+                               for x in spell_options[b]]))
+    slot_levels = [x for x in sorted(action_character.spellslots.keys())
+                   if (allow_upcast and len(spell_levels) > 0 and x >= spell_levels[0]) or
+                   x in spell_levels]
+    initial_slots = tuple(min(action_character.spellslots[x].n_remaining(), n_rounds)
+                          for x in slot_levels)
+    initial_uses = tuple(limited_caps)
+    base_turn_value = sum([free_options[b][0].value for b in turn_budgets])
+
+    def fitting_slot(slots: tuple, spell_level: int):
+        for slot_pos, slot_level in enumerate(slot_levels):
+            if slots[slot_pos] > 0 and (slot_level == spell_level or
+                                        (allow_upcast and slot_level > spell_level)):
+                return slot_pos
+        return -1
+
+    def turn_choices(slots: tuple, uses: tuple):
+        # (turn value, options per budget, slot position spent or -1)
+        for spell_budget in [None] + turn_budgets:
+            if spell_budget is None:
+                spell_choices = [(None, -1)]
+            else:
+                spell_choices = []
+                for spell in spell_options[spell_budget]:
+                    if spell.uses_idx >= 0 and uses[spell.uses_idx] == 0:
+                        continue
+                    slot_pos = fitting_slot(slots, columns.spell_level[spell.ability_idx])
+                    if slot_pos >= 0:
+                        spell_choices.append((spell, slot_pos))
+
+            budget_choices = [[x for x in free_options[b] if x.uses_idx < 0 or uses[x.uses_idx] > 0]
+                              if b != spell_budget else [None] for b in turn_budgets]
+            for spell, slot_pos in spell_choices:
+                for free_choice in product(*budget_choices):
+                    turn_options = [spell if x is None else x for x in free_choice]
+                    yield sum([x.value for x in turn_options]), turn_options, slot_pos
+
+    def spend(slots: tuple, uses: tuple, turn_options: list, slot_pos: int):
+        if slot_pos >= 0:
+            slots = slots[:slot_pos] + (slots[slot_pos] - 1,) + slots[slot_pos + 1:]
+        spent_uses = [x.uses_idx for x in turn_options if x.uses_idx >= 0]
+        if len(spent_uses) > 0:
+            uses = tuple(x - spent_uses.count(i) for i, x in enumerate(uses))
+        return slots, uses
+
+    @lru_cache(maxsize = None)
+    def best_value(rounds_left: int, slots: tuple, uses: tuple):
+        if rounds_left == 0:
+            return 0, None
+        if sum(uses) == 0 and all([fitting_slot(slots, x) < 0 for x in spell_levels]):
+            return rounds_left * base_turn_value, None
+
+        best = (-np.inf, None)
+        for turn_value, turn_options, slot_pos in turn_choices(slots, uses):
+            next_slots, next_uses = spend(slots, uses, turn_options, slot_pos)
+            total_value = turn_value + best_value(rounds_left - 1, next_slots, next_uses)[0]
+            if total_value > best[0]:
+                best = (total_value, (turn_options, slot_pos, next_slots, next_uses))
+        return best
+
+    total_value, _ = best_value(n_rounds, initial_slots, initial_uses)
+
+    schedule = []
+    slots, uses = initial_slots, initial_uses
+    for rounds_left in range(n_rounds, 0, -1):
+        _, choice = best_value(rounds_left, slots, uses)
+        if choice is None:
+            turn_options, slot_pos = [free_options[b][0] for b in turn_budgets], -1
+        else:
+            turn_options, slot_pos, slots, uses = choice
+        round_plan = {b: None if x.ability_idx < 0 else columns.names[x.ability_idx]
+                      for b, x in zip(turn_budgets, turn_options)}
+        round_plan["value"] = sum([x.value for x in turn_options])
+        round_plan["slot_level"] = None if slot_pos < 0 else slot_levels[slot_pos]
+        schedule.append(round_plan)
+
+    return ScheduleResult(total_value, schedule, best_value.cache_info().currsize)
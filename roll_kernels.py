@@ -0,0 +1,86 @@
+from functools import lru_cache
+import numpy as np
+
+# Number of d20s rolled and whether the highest (True) or lowest is kept
+roll_modes = {"normal": (1, True),
+              "advantage": (2, True),
+              "disadvantage": (2, False),
+              "elven_accuracy": (3, True)}
+
+
+def d20_face_weights(roll_mode: str = "normal"):
+    # Integer count of the 20**n_dice outcomes that keep each natural face 1-20
+    if roll_mode not in roll_modes:
+        raise ValueError("roll_mode must be one of %s." % list(roll_modes.keys()))
+
+    n_dice, keep_highest = roll_modes[roll_mode]
+    faces = np.arange(1, 21, dtype = np.int64)
+    if keep_highest:
+        return faces ** n_dice - (faces - 1) ** n_dice
+    return (21 - faces) ** n_dice - (20 - faces) ** n_dice
+
+
+def bonus_die_offsets(bonus_die: int = 0):
+    # Signed die added to the d20, e.g. 4 for Bless and -4 for Bane
+    if type(bonus_die) is not int:
+        raise ValueError("bonus_die must be an integer number of faces.")
+    if bonus_die == 0:
+        return np.zeros(1, dtype = np.int64)
+    return np.arange(1, abs(bonus_die) + 1, dtype = np.int64) * np.sign(bonus_die)
+
+
+class RollKernel:
+    # Outcome probabilities of one d20 roll, tabulated by margin: the roller's
+    # bonus minus the value it rolls against (hit_bonus - AC for attacks,
+    # ST - DC for saves). A roll beats its margin when d20 (+ bonus die) +
+    # margin > 0. As in calculate_hit_probability, a natural 20 always hits
+    # and a natural 1 always fails a save.
+    #
+    # Weights are integer outcome counts divided once, so normal rolls give
+    # exactly the old (20 - (AC - hit_bonus))/20 style values.
+    def __init__(self, roll_mode: str = "normal", bonus_die: int = 0):
+        self.roll_mode = roll_mode
+        self.bonus_die = bonus_die
+
+        face_weights = d20_face_weights(roll_mode)
+        die_offsets = bonus_die_offsets(bonus_die)
+        total_weight = face_weights.sum() * len(die_offsets)
+
+        # Outside this range every roll beats its margin or none does
+        self.margin_min = -20 - abs(bonus_die)
+        self.margin_max = abs(bonus_die)
+        self.margins = np.arange(self.margin_min, self.margin_max + 1)
+
+        roll_totals = np.arange(1, 21)[:, None] + die_offsets[None, :]
+        beat_weight = np.array([(face_weights[:, None] * (roll_totals + x > 0)).sum()
+                                for x in self.margins], dtype = np.int64)
+        self.beat_probability = beat_weight / total_weight
+        self.crit_probability = face_weights[-1] * len(die_offsets) / total_weight
+        self.fumble_probability = face_weights[0] * len(die_offsets) / total_weight
+
+        self.hit_table = np.maximum(self.beat_probability, self.crit_probability)
+        self.save_fail_table = np.maximum(1 - self.beat_probability, self.fumble_probability)
+        for table in (self.beat_probability, self.hit_table, self.save_fail_table):
+            table.flags.writeable = False
+
+    def __repr__(self):
+        return "RollKernel(%s, bonus_die=%s)" % (self.roll_mode, self.bonus_die)
+
+    def margin_index(self, margins):
+        return np.clip(np.asarray(margins), self.margin_min, self.margin_max).astype(int) - \
+            self.margin_min
+
+    def hit_probability(self, margins):
+        return self.hit_table[self.margin_index(margins)]
+
+    def save_fail_probability(self, margins):
+        return self.save_fail_table[self.margin_index(margins)]
+
+
+@lru_cache(maxsize = 64)
+def roll_kernel(roll_mode: str = "normal", bonus_die: int = 0):
+    return RollKernel(roll_mode, bonus_die)
+
+
+# Tables for every roll mode without a bonus die are built up front
+default_kernels = {x: roll_kernel(x) for x in roll_modes}
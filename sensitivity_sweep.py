@@ -0,0 +1,247 @@
+from character import Character
+from concurrent.futures import ProcessPoolExecutor
+import copy
+from errors import BadArgumentFromListErrorCheck
+from fixed_names import (all_immunities, all_conditions, all_resistances,
+                         all_vulnerabilities, DC_types)
+from itertools import product
+import numpy as np
+from roll_kernels import RollKernel, default_kernels, roll_kernel
+from table_engine import (accepted_stats, AbilityColumns, character_columns, crit_damage_column,
+                          economy_cost_column, economy_matrix, expected_hit_matrix, rvi_column,
+                          scarcity_column)
+
+# Axes swept inside one numpy block. Target values replace the target's own,
+# ability values are offsets added to every swept ability.
+target_value_axes = ["AC"] + DC_types
+ability_offset_axes = ["hit_bonus_offset", "DC_offset", "flat_damage_offset"]
+numeric_axes = target_value_axes + ability_offset_axes
+
+# Axes that change the target or the roll kernels; each combination of these
+# is one block, and blocks are what get spread over worker processes.
+# RVI axes take lists of damage types like a stat block, kernel axes take a
+# RollKernel or a roll mode name.
+rvi_axes = {"resistances": ("resistances", all_resistances),
+            "vulnerabilities": ("vulnerablities", all_vulnerabilities),
+            "immunities": ("immunities", all_immunities + all_conditions)}
+kernel_axes = ["attack_kernel", "save_kernel"]
+block_axes = list(rvi_axes.keys()) + kernel_axes
+
+sweep_axes = numeric_axes + block_axes
+
+
+class SweepResult:
+    # Labeled ndarray: values has one dimension per swept axis, in the order
+    # the axes were passed, plus a trailing "ability" dimension.
+    def __init__(self, values: np.ndarray, dims: list[str], coords: dict):
+        self.values = values
+        self.dims = dims
+        self.coords = coords
+
+    def __repr__(self):
+        return "SweepResult(%s)" % ", ".join(["%s: %s" % (x, len(self.coords[x]))
+                                               for x in self.dims])
+
+    @property
+    def shape(self):
+        return self.values.shape
+
+    def sel(self, **selectors):
+        # Picks one coordinate per given dimension and drops that dimension
+        for dim in selectors.keys():
+            BadArgumentFromListErrorCheck(passed_value = dim, accepted_values = self.dims)
+
+        index = []
+        for dim in self.dims:
+            if dim not in selectors:
+                index.append(slice(None))
+                continue
+            dim_coords = self.coords[dim]
+            matches = [i for i, x in enumerate(dim_coords) if x == selectors[dim]]
+            if len(matches) == 0:
+                raise ValueError("%s is not a coordinate of %s." % (selectors[dim], dim))
+            index.append(matches[0])
+
+        kept_dims = [x for x in self.dims if x not in selectors]
+        return SweepResult(self.values[tuple(index)],
+                           kept_dims,
+                           {x: self.coords[x] for x in kept_dims})
+
+    def to_series(self):
+        import pandas as pd
+
+        labels = [[coord_label(x) for x in self.coords[dim]] for dim in self.dims]
+        return pd.Series(self.values.ravel(),
+                         index = pd.MultiIndex.from_product(labels, names = self.dims))
+
+    def to_xarray(self):
+        import xarray as xr
+
+        return xr.DataArray(self.values,
+                            dims = self.dims,
+                            coords = {x: [coord_label(y) for y in self.coords[x]]
+                                      for x in self.dims})
+
+
+def coord_label(coord):
+    if type(coord) is list:
+        return ",".join(coord) if len(coord) > 0 else "None"
+    if isinstance(coord, RollKernel):
+        return "%s%+d" % (coord.roll_mode, coord.bonus_die) if coord.bonus_die != 0 \
+            else coord.roll_mode
+    return coord
+
+
+def swept_target(target: Character, block_values: dict):
+    if not any([x in block_values for x in rvi_axes]):
+        return target
+
+    swept_types = {}
+    for axis_name in rvi_axes:
+        for damage_type in block_values.get(axis_name, []):
+            if damage_type in swept_types:
+                raise ValueError("%s cannot be swept as both %s and %s." %
+                                 (damage_type, swept_types[damage_type], axis_name))
+            swept_types[damage_type] = axis_name
+
+    # A swept type is cleared from the target's unswept RVI, so sweeping
+    # resistances against a target vulnerable to the same type resists it
+    target = copy.copy(target)
+    for axis_name, (attr_name, full_options) in rvi_axes.items():
+        if axis_name in block_values:
+            setattr(target, attr_name, {x: x in block_values[axis_name] for x in full_options})
+        else:
+            setattr(target, attr_name, {k: v and k not in swept_types
+                                        for k, v in getattr(target, attr_name).items()})
+    return target
+
+
+def as_kernel(kernel):
+    if isinstance(kernel, RollKernel):
+        return kernel
+    return roll_kernel(kernel)
+
+
+def sweep_block(columns: AbilityColumns,
+                stat: str,
+                numeric_values: dict,
+                base_values: dict,
+                rvi_modifier: np.ndarray,
+                cost_root: np.ndarray,
+                attack_kernel: RollKernel,
+                save_kernel: RollKernel,
+                crits: bool = False):
+    # numeric_values holds the swept numeric axes in block order; every axis
+    # gets its own dimension ahead of the ability dimension.
+    n_dims = len(numeric_values)
+
+    def grid(axis_name: str):
+        if axis_name not in numeric_values:
+            return base_values[axis_name]
+        axis_shape = [1] * (n_dims + 1)
+        axis_shape[list(numeric_values.keys()).index(axis_name)] = -1
+        return np.asarray(numeric_values[axis_name], dtype = float).reshape(axis_shape)
+
+    hit_margin = columns.hit_bonus + grid("hit_bonus_offset") - grid("AC")
+    save_check = np.zeros(1)
+    for save_type in DC_types:
+        save_check = np.where(columns.DC_type == save_type, grid(save_type), save_check)
+    save_margin = save_check - (columns.DC + grid("DC_offset"))
+
+    hit_probability = np.where(columns.is_hit, attack_kernel.hit_probability(hit_margin),
+                               np.where(columns.is_save,
+                                        save_kernel.save_fail_probability(save_margin), 1.0))
+    block_shape = np.broadcast_shapes(hit_probability.shape,
+                                      *[np.shape(grid(x)) for x in numeric_values],
+                                      (len(columns),))
+    hit_probability = np.broadcast_to(hit_probability, block_shape)
+    if stat == "phit":
+        return np.array(hit_probability)
+
+    if "flat_damage_offset" in numeric_values:
+        total_damage = columns.n_hit_rolls * (columns.n_damage_die * columns.die_expectation +
+                                              columns.flat_damage + grid("flat_damage_offset"))
+    else:
+        total_damage = columns.total_damage
+    expected_hit = expected_hit_matrix(columns, hit_probability, rvi_modifier,
+                                       crit_damage_column(columns, attack_kernel) if crits else None,
+                                       total_damage = total_damage)
+    expected_hit = np.broadcast_to(expected_hit, block_shape)
+    if stat == "ehit":
+        return np.array(expected_hit)
+
+    return economy_matrix(columns, expected_hit, cost_root)
+
+
+def sensitivity_sweep(target: Character,
+                      action_character: Character,
+                      stat: str,
+                      axes: dict,
+                      abilities: list[str] = None,
+                      scarcity_coeff: float = 0.45,
+                      attack_kernel: RollKernel = None,
+                      save_kernel: RollKernel = None,
+                      crits: bool = False,
+                      n_workers: int = 1):
+    # stat over the Cartesian product of axes ({axis name: values}) for each
+    # ability, or only the named abilities. Axes left out keep the target's
+    # own values, zero offsets and the given kernels. e.g.
+    #   sensitivity_sweep(target, pc, "ehit", {"AC": range(10, 25),
+    #                                          "hit_bonus_offset": [0, 1, 2, 3]},
+    #                     abilities = ["Longsword"])
+    if stat not in accepted_stats:
+        raise ValueError("stat must be one of %s." % accepted_stats)
+    if len(axes) == 0:
+        raise ValueError("axes must hold at least one axis to sweep.")
+    for axis_name, axis_values in axes.items():
+        BadArgumentFromListErrorCheck(passed_value = axis_name, accepted_values = sweep_axes)
+        if len(axis_values) == 0:
+            raise ValueError("Axis %s has no values." % axis_name)
+        if axis_name in rvi_axes:
+            [[BadArgumentFromListErrorCheck(passed_value = x,
+                                            accepted_values = rvi_axes[axis_name][1])
+              for x in y] for y in axis_values]
+
+    columns = character_columns(action_character)
+    if abilities is not None:
+        [BadArgumentFromListErrorCheck(passed_value = x, accepted_values = columns.names)
+         for x in abilities]
+        columns = columns.take([columns.names.index(x) for x in abilities])
+
+    cost_root = economy_cost_column(columns,
+                                    scarcity_column(columns, action_character, scarcity_coeff))
+    base_values = {"AC": target.AC, "hit_bonus_offset": 0, "DC_offset": 0, "flat_damage_offset": 0}
+    base_values.update(target.st_modifiers)
+    base_kernels = {"attack_kernel": default_kernels["normal"] if attack_kernel is None
+                    else attack_kernel,
+                    "save_kernel": default_kernels["normal"] if save_kernel is None
+                    else save_kernel}
+
+    block_dims = [x for x in axes.keys() if x in block_axes]
+    numeric_values = {x: list(y) for x, y in axes.items() if x in numeric_axes}
+
+    block_args = []
+    for block_combo in product(*[axes[x] for x in block_dims]):
+        block_values = dict(zip(block_dims, block_combo))
+        block_kernels = {x: as_kernel(block_values.get(x, base_kernels[x])) for x in kernel_axes}
+        block_args.append((columns, stat, numeric_values, base_values,
+                           rvi_column(columns, swept_target(target, block_values)),
+                           cost_root, block_kernels["attack_kernel"],
+                           block_kernels["save_kernel"], crits))
+
+    if n_workers > 1 and len(block_args) > 1:
+        with ProcessPoolExecutor(max_workers = n_workers) as executor:
+            blocks = list(executor.map(sweep_block, *zip(*block_args)))
+    else:
+        blocks = [sweep_block(*x) for x in block_args]
+
+    # Blocks come back as (block dims..., numeric dims..., ability); put the
+    # dimensions back in the order the axes were passed
+    block_order = block_dims + list(numeric_values.keys())
+    values = np.stack(blocks).reshape([len(axes[x]) for x in block_dims] + list(blocks[0].shape))
+    dims = list(axes.keys())
+    values = np.transpose(values, [block_order.index(x) for x in dims] + [len(dims)])
+
+    coords = {x: list(y) for x, y in axes.items()}
+    coords["ability"] = columns.names
+    return SweepResult(np.ascontiguousarray(values), dims + ["ability"], coords)
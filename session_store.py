@@ -0,0 +1,137 @@
+import threading
+import time
+import uuid
+from table_engine import IncrementalStatTables
+
+session_cookie_name = "minmax_session"
+
+
+def empty_tables():
+    return {"econ": None, "ehit": None, "phit": None}
+
+
+def default_ability_filters():
+    return {"roll_type": ['all'],
+            "spell_level": ['all'],
+            "action_type": ['all'],
+            "damage_type": ['all']}
+
+
+class SessionState:
+    # What one browser session used to keep on the global app: the chosen
+    # character, the target, its built tables and the ability filters. The
+    # table builder is per session as it holds arrays for one character.
+    # tables are the last finished build, made for table_character, while
+    # table_job may still be building newer ones. Jobs and the builder live
+    # in this process, so states are shared by reference and never copied.
+    def __init__(self):
+        self.selected_character = None
+        self.selected_sheet = None
+        self.target = None
+        self.target_raw_dict = None
+        self.tables = empty_tables()
+        self.table_character = None
+        self.table_job = None
+        self.character_ability_filters = default_ability_filters()
+        self.table_builder = IncrementalStatTables()
+        self.last_access = time.monotonic()
+
+    def __repr__(self):
+        return "SessionState(character=%s, target=%s)" % \
+            (None if self.selected_character is None else self.selected_character.name,
+             None if self.target is None else self.target.name)
+
+    def cancel_table_job(self):
+        if self.table_job is not None:
+            self.table_job.cancel()
+            self.table_job = None
+
+    def clear_tables(self):
+        self.cancel_table_job()
+        self.tables = empty_tables()
+        self.table_character = None
+
+    def clear_target(self):
+        self.target = None
+        self.target_raw_dict = None
+        self.clear_tables()
+
+
+class SessionStore:
+    # SessionStates by session id, dropped once unused for ttl_seconds.
+    # Expired sessions are swept at most once per sweep_interval, on access.
+    # In process only: callers mutate the returned state in place, and a
+    # multi process deployment needs sticky sessions.
+    def __init__(self,
+                 ttl_seconds: float = 3600,
+                 sweep_interval: float = 60):
+        if ttl_seconds <= 0:
+            raise ValueError("ttl_seconds must be positive.")
+
+        self.ttl_seconds = ttl_seconds
+        self.sessions = {}
+        self.sweep_interval = sweep_interval
+        self.lock = threading.Lock()
+        self.session_locks = {}
+        self.last_sweep = time.monotonic()
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def __contains__(self, session_id):
+        return session_id in self.sessions
+
+    def expired(self, state: SessionState, now: float):
+        return now - state.last_access > self.ttl_seconds
+
+    def get(self, session_id: str = None):
+        # (session_id, state); unknown or expired ids get a new session under
+        # a new id rather than the one the client sent
+        now = time.monotonic()
+        with self.lock:
+            if now - self.last_sweep > self.sweep_interval:
+                self.sweep(now)
+
+            state = None if session_id is None else self.sessions.get(session_id)
+            if state is not None and self.expired(state, now):
+                self.drop(session_id)
+                state = None
+            if state is None:
+                session_id = uuid.uuid4().hex
+                state = SessionState()
+                self.sessions[session_id] = state
+
+            state.last_access = now
+            return session_id, state
+
+    def session_lock(self, session_id: str, lock_name: str):
+        with self.lock:
+            if (session_id, lock_name) not in self.session_locks:
+                self.session_locks[(session_id, lock_name)] = threading.Lock()
+            return self.session_locks[(session_id, lock_name)]
+
+    def build_lock(self, session_id: str):
+        # Held while a session's table builder runs
+        return self.session_lock(session_id, "build")
+
+    def submit_lock(self, session_id: str):
+        # Concurrent requests of one session check for and start table builds
+        # one at a time, so they share one build instead of each starting one
+        return self.session_lock(session_id, "submit")
+
+    def drop(self, session_id: str):
+        state = self.sessions.get(session_id)
+        if state is not None:
+            state.cancel_table_job()
+        self.sessions.pop(session_id, None)
+        for lock_key in [x for x in self.session_locks if x[0] == session_id]:
+            self.session_locks.pop(lock_key)
+
+    def sweep(self, now: float = None):
+        if now is None:
+            now = time.monotonic()
+        for session_id in list(self.sessions.keys()):
+            state = self.sessions.get(session_id)
+            if state is not None and self.expired(state, now):
+                self.drop(session_id)
+        self.last_sweep = now
@@ -0,0 +1,214 @@
+from fixed_names import character_actionsheet_path
+import csv
+import hashlib
+import io
+import numpy as np
+import os
+import sys
+import threading
+import zipfile
+
+compiled_sheet_suffix = ".npz"
+# What np.load raises on a missing, truncated or foreign .npz file
+unreadable_npz_errors = (OSError, ValueError, KeyError, EOFError, zipfile.BadZipFile)
+
+# Same defaults pandas.read_csv uses, so compiled sheets parse identically
+missing_values = {'', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan',
+                  '1.#IND', '1.#QNAN', '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None',
+                  'n/a', 'nan', 'null'}
+true_values = {'True', 'TRUE', 'true'}
+false_values = {'False', 'FALSE', 'false'}
+
+
+def compiled_sheet_path(csv_file_path: str):
+    return os.path.splitext(csv_file_path)[0] + compiled_sheet_suffix
+
+
+def file_sha1(file_path: str):
+    with open(file_path, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def parse_float(raw_value: str):
+    try:
+        return float(raw_value)
+    except ValueError:
+        return None
+
+
+def classify_column(raw_values: list[str]):
+    present_values = [x for x in raw_values if x not in missing_values]
+    if all([x in true_values or x in false_values for x in present_values]) and \
+            len(present_values) > 0:
+        return "bool"
+    elif all([parse_float(x) is not None for x in present_values]):
+        return "num"
+    else:
+        return "str"
+
+
+def compile_action_sheet(csv_file_path: str,
+                         output_path: str = None):
+    if output_path is None:
+        output_path = compiled_sheet_path(csv_file_path)
+
+    with open(csv_file_path, "r", newline = "") as f:
+        csv_rows = list(csv.reader(f))
+    header, body = csv_rows[0], [x for x in csv_rows[1:] if len(x) > 0]
+
+    compiled_arrays = {}
+    column_kinds = []
+    for col_idx, column_name in enumerate(header):
+        raw_values = [row[col_idx] if col_idx < len(row) else '' for row in body]
+        column_kind = classify_column(raw_values)
+        column_kinds.append(column_kind)
+
+        if column_kind == "num":
+            compiled_arrays["num__%s" % column_name] = np.array(
+                [np.nan if x in missing_values else float(x) for x in raw_values],
+                dtype = np.float64)
+        elif column_kind == "bool":
+            compiled_arrays["bool__%s" % column_name] = np.array(
+                [-1 if x in missing_values else int(x in true_values) for x in raw_values],
+                dtype = np.int8)
+        else:
+            compiled_arrays["str__%s" % column_name] = np.array(
+                ['' if x in missing_values else x for x in raw_values], dtype = np.str_)
+            compiled_arrays["mask__%s" % column_name] = np.array(
+                [x not in missing_values for x in raw_values], dtype = bool)
+
+    source_stat = os.stat(csv_file_path)
+    # Files are written under a temporary name and then replaced, so readers
+    # never load a half written sheet
+    write_path = output_path
+    if isinstance(output_path, str):
+        write_path = "%s.%s.%s.tmp.npz" % (output_path, os.getpid(), threading.get_ident())
+    try:
+        np.savez(write_path,
+                 __columns__ = np.array(header, dtype = np.str_),
+                 __kinds__ = np.array(column_kinds, dtype = np.str_),
+                 __source_mtime_ns__ = np.array(source_stat.st_mtime_ns, dtype = np.int64),
+                 __source_size__ = np.array(source_stat.st_size, dtype = np.int64),
+                 __source_sha1__ = np.array(file_sha1(csv_file_path), dtype = np.str_),
+                 **compiled_arrays)
+    except BaseException:
+        if write_path is not output_path and os.path.exists(write_path):
+            os.remove(write_path)
+        raise
+    if write_path is not output_path:
+        os.replace(write_path, output_path)
+
+    return output_path
+
+
+def compiled_sheet_is_current(csv_file_path: str,
+                              compiled_path: str = None):
+    if compiled_path is None:
+        compiled_path = compiled_sheet_path(csv_file_path)
+    if not os.path.exists(compiled_path):
+        return False
+
+    source_stat = os.stat(csv_file_path)
+    try:
+        with np.load(compiled_path) as compiled_sheet:
+            if int(compiled_sheet["__source_mtime_ns__"]) == source_stat.st_mtime_ns and \
+                    int(compiled_sheet["__source_size__"]) == source_stat.st_size:
+                return True
+            # A touched but unchanged file does not need recompiling
+            return str(compiled_sheet["__source_sha1__"]) == file_sha1(csv_file_path)
+    except unreadable_npz_errors:
+        return False
+
+
+def load_compiled_sheet_columns(csv_file_path: str,
+                                recompile: bool = True):
+    compiled_path = compiled_sheet_path(csv_file_path)
+    if not compiled_sheet_is_current(csv_file_path, compiled_path):
+        if not recompile:
+            raise FileNotFoundError("No current compiled sheet for %s." % csv_file_path)
+        compiled_path = recompile_action_sheet(csv_file_path, compiled_path)
+
+    try:
+        return read_compiled_sheet_columns(compiled_path)
+    except unreadable_npz_errors:
+        # A truncated or corrupt compiled sheet is as good as a stale one
+        if not recompile:
+            raise FileNotFoundError("No readable compiled sheet for %s." % csv_file_path)
+        return read_compiled_sheet_columns(recompile_action_sheet(csv_file_path, compiled_path))
+
+
+def recompile_action_sheet(csv_file_path: str,
+                           compiled_path: str):
+    try:
+        return compile_action_sheet(csv_file_path, compiled_path)
+    except OSError:
+        # Read-only sheet directory, compile to memory instead
+        return io_compiled_sheet(csv_file_path)
+
+
+def read_compiled_sheet_columns(compiled_path):
+    with np.load(compiled_path) as compiled_sheet:
+        column_names = [str(x) for x in compiled_sheet["__columns__"]]
+        column_kinds = [str(x) for x in compiled_sheet["__kinds__"]]
+        sheet_columns = {}
+        for column_name, column_kind in zip(column_names, column_kinds):
+            if column_kind == "str":
+                sheet_columns[column_name] = (column_kind,
+                                              compiled_sheet["str__%s" % column_name],
+                                              compiled_sheet["mask__%s" % column_name])
+            else:
+                sheet_columns[column_name] = (column_kind,
+                                              compiled_sheet["%s__%s" % (column_kind, column_name)],
+                                              None)
+
+    return sheet_columns
+
+
+def io_compiled_sheet(csv_file_path: str):
+    compiled_buffer = io.BytesIO()
+    compile_action_sheet(csv_file_path, compiled_buffer)
+    compiled_buffer.seek(0)
+    return compiled_buffer
+
+
+def compiled_sheet_rows(sheet_columns: dict):
+    # Yields one kwargs dict per row with the same values pandas + dropna()
+    # would have produced: missing cells left out, numbers as ints, booleans
+    # as bools and everything else as strings.
+    column_values = []
+    for column_name, (column_kind, values, mask) in sheet_columns.items():
+        if column_kind == "num":
+            present = ~np.isnan(values)
+            converted = [int(x) for x in values[present]]
+        elif column_kind == "bool":
+            present = values >= 0
+            converted = [bool(x) for x in values[present]]
+        else:
+            present = mask
+            converted = [str(x) for x in values[present]]
+        column_values.append((column_name, present.tolist(), iter(converted)))
+
+    n_rows = len(column_values[0][1]) if len(column_values) > 0 else 0
+    for row_idx in range(n_rows):
+        yield {column_name: next(converted) for column_name, present, converted
+               in column_values if present[row_idx]}
+
+
+def compile_all_action_sheets(sheet_dir: str = character_actionsheet_path,
+                              force: bool = False):
+    compiled_paths = []
+    for file_name in sorted(os.listdir(sheet_dir)):
+        if not file_name.endswith(".csv"):
+            continue
+        csv_file_path = os.path.join(sheet_dir, file_name)
+        if force or not compiled_sheet_is_current(csv_file_path):
+            compiled_paths.append(compile_action_sheet(csv_file_path))
+
+    return compiled_paths
+
+
+if __name__ == "__main__":
+    passed_dirs = [x for x in sys.argv[1:] if not x.startswith("--")]
+    sheet_dir = passed_dirs[0] if len(passed_dirs) > 0 else character_actionsheet_path
+    compiled = compile_all_action_sheets(sheet_dir, force = "--force" in sys.argv)
+    print("Compiled %s action sheet(s) in %s." % (len(compiled), sheet_dir))
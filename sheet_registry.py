@@ -0,0 +1,130 @@
+from character import Character
+from fixed_names import character_actionsheet_path, character_detail_path
+import json
+import logging
+from metrics import metrics
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def sheet_file_state(file_path: str):
+    # (mtime_ns, size), or None once the file is gone
+    try:
+        file_stat = os.stat(file_path)
+    except OSError:
+        return None
+    return (file_stat.st_mtime_ns, file_stat.st_size)
+
+
+class SheetRegistry:
+    # The character details JSONs and action sheet CSVs on disk, scanned once
+    # and rescanned only when a directory's mtime changes, checked at most
+    # every poll_interval seconds. Parsed Characters are kept until their JSON
+    # or CSV changes, and are shared between sessions, so callers must not
+    # modify them.
+    def __init__(self,
+                 detail_path: str = character_detail_path,
+                 actionsheet_path: str = character_actionsheet_path,
+                 poll_interval: float = 2.0):
+        self.detail_path = detail_path
+        self.actionsheet_path = actionsheet_path
+        self.poll_interval = poll_interval
+        self.lock = threading.RLock()
+        self.dir_states = None
+        self.last_poll = None
+        self.detail_files = {}
+        self.actionsheet_files = {}
+        self.characters = {}
+        self.scans = 0
+
+    def __repr__(self):
+        return "SheetRegistry(%s, %s, sheets=%s, parsed=%s)" % \
+            (self.detail_path, self.actionsheet_path, len(self.detail_files), len(self.characters))
+
+    def __contains__(self, sheet_name: str):
+        return sheet_name in self.available_sheets()
+
+    def current_dir_states(self):
+        return (sheet_file_state(self.detail_path), sheet_file_state(self.actionsheet_path))
+
+    def scan(self):
+        with self.lock:
+            self.dir_states = self.current_dir_states()
+            self.detail_files = {x[:-5]: os.path.join(self.detail_path, x)
+                                 for x in self.listdir(self.detail_path) if x.endswith(".json")}
+            self.actionsheet_files = {x[:-4]: os.path.join(self.actionsheet_path, x)
+                                      for x in self.listdir(self.actionsheet_path)
+                                      if x.endswith(".csv")}
+            self.characters = {k: v for k, v in self.characters.items()
+                               if k in self.detail_files and k in self.actionsheet_files}
+            self.last_poll = time.monotonic()
+            self.scans += 1
+
+    def listdir(self, dir_path: str):
+        try:
+            return os.listdir(dir_path)
+        except FileNotFoundError:
+            return []
+
+    def refresh(self, force: bool = False):
+        # Cheap poll: two directory stats, at most every poll_interval
+        with self.lock:
+            now = time.monotonic()
+            if not force and self.last_poll is not None and \
+                    now - self.last_poll < self.poll_interval:
+                return False
+            self.last_poll = now
+            if force or self.dir_states != self.current_dir_states():
+                self.scan()
+                return True
+            return False
+
+    def detail_sheets(self):
+        self.refresh()
+        return sorted(self.detail_files.keys())
+
+    def available_sheets(self):
+        # Characters with both a details JSON and an action sheet CSV
+        self.refresh()
+        return sorted([x for x in self.actionsheet_files if x in self.detail_files])
+
+    def character(self, sheet_name: str):
+        self.refresh()
+        with self.lock:
+            if sheet_name not in self.detail_files or sheet_name not in self.actionsheet_files:
+                raise KeyError("No character sheet named '%s'." % sheet_name)
+            detail_file = self.detail_files[sheet_name]
+            actionsheet_file = self.actionsheet_files[sheet_name]
+            cached = self.characters.get(sheet_name)
+
+        file_states = (sheet_file_state(detail_file), sheet_file_state(actionsheet_file))
+        if cached is not None and cached[0] == file_states:
+            return cached[1]
+
+        with open(detail_file, "r") as f, metrics.stage("load_character_json"):
+            sheet_character = Character(**json.load(f))
+        sheet_character.add_abilities_from_csv(actionsheet_file)
+        with self.lock:
+            self.characters[sheet_name] = (file_states, sheet_character)
+        return sheet_character
+
+    def prewarm(self, sheet_names: list[str] = None, background: bool = False):
+        # Parses the given (default every available) character ahead of its
+        # first request
+        if background:
+            prewarm_thread = threading.Thread(target = self.prewarm, args = (sheet_names,),
+                                              name = "sheet_prewarm", daemon = True)
+            prewarm_thread.start()
+            return prewarm_thread
+
+        if sheet_names is None:
+            sheet_names = self.available_sheets()
+        for sheet_name in sheet_names:
+            try:
+                self.character(sheet_name)
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                logger.warning("Could not prewarm %s: %s", sheet_name, e)
+        return None
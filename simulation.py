@@ -0,0 +1,168 @@
+from base_economics import TurnAction, SpellTurnAction
+from character import Character
+from concurrent.futures import ProcessPoolExecutor
+from damage_distribution import DamageDistribution
+import numpy as np
+from table_engine import AbilityColumns, rvi_column
+
+default_chunk_size = 250_000
+
+
+class SimulationSpec:
+    # Plain numbers only, so specs are cheap to send to worker processes
+    def __init__(self, action, target: Character, override_target_checkval: int = None):
+        if type(action) not in (TurnAction, SpellTurnAction):
+            raise ValueError("action must be of type either TurnAction or SpellTurnAction.")
+
+        self.roll_type = action.roll_type
+        self.hit_bonus = 0 if action.hit_bonus is None else action.hit_bonus
+        self.DC = 0 if action.DC is None else action.DC
+        if override_target_checkval is not None:
+            self.check_value = override_target_checkval
+        elif action.roll_type == "save":
+            self.check_value = target.st_modifiers[action.DC_type]
+        else:
+            self.check_value = target.AC
+
+        self.n_faces = 0 if action.damage_die is None else action.damage_die.n
+        self.n_damage_die = 0 if action.damage_die is None or action.n_damage_die is None \
+            else action.n_damage_die
+        self.flat_damage = 0 if action.flat_damage is None else action.flat_damage
+        self.n_hit_rolls = 0 if action.n_hit_rolls is None else action.n_hit_rolls
+        self.half_damage_on_fail = bool(action.half_damage_on_fail)
+        self.rvi_modifier = float(rvi_column(AbilityColumns({action.name: action}), target)[0])
+
+
+class SimulationResult:
+    def __init__(self, samples: np.ndarray, successes: np.ndarray):
+        self.samples = samples
+        self.successes = successes
+
+    def __len__(self):
+        return len(self.samples)
+
+    def __repr__(self):
+        return "SimulationResult(n=%s, mean=%.2f)" % (len(self.samples), self.samples.mean())
+
+    def distribution(self):
+        return DamageDistribution(np.bincount(self.samples) / len(self.samples))
+
+    def summary(self, hp: int = None):
+        summary_dict = {"n_samples": len(self.samples),
+                        "mean": self.samples.mean(),
+                        "std": self.samples.std(),
+                        "success_rate": self.successes.mean()}
+        summary_dict.update(self.distribution().summary(hp = hp))
+        return summary_dict
+
+
+def scale_damage(damage: np.ndarray, multiplier: float):
+    # Rounds down like the rules and damage_distribution.scale_pmf
+    if multiplier == 1:
+        return damage
+    return np.floor(damage * multiplier).astype(damage.dtype)
+
+
+def roll_damage(rng: np.random.Generator, spec: SimulationSpec, shape: tuple):
+    if spec.n_damage_die == 0:
+        return np.full(shape, spec.flat_damage, dtype = np.int64)
+    dice = rng.integers(1, spec.n_faces + 1, size = shape + (spec.n_damage_die,), dtype = np.int16)
+    return dice.sum(axis = -1, dtype = np.int64) + spec.flat_damage
+
+
+def sample_damage(rng: np.random.Generator,
+                  spec: SimulationSpec,
+                  n_samples: int):
+    # Same hit/save thresholds as calculate_hit_probability, including the
+    # 5% floor: a natural 20 always hits and a natural 1 always fails a save.
+    damage_shape = (n_samples, spec.n_hit_rolls)
+    per_roll_damage = roll_damage(rng, spec, damage_shape)
+
+    if spec.roll_type == "hit":
+        d20 = rng.integers(1, 21, size = damage_shape, dtype = np.int16)
+        roll_success = (d20 + spec.hit_bonus > spec.check_value) | (d20 == 20)
+        if spec.half_damage_on_fail:
+            miss_damage = scale_damage(per_roll_damage // 2, spec.rvi_modifier)
+        else:
+            miss_damage = 0
+        damage = np.where(roll_success, scale_damage(per_roll_damage, spec.rvi_modifier),
+                          miss_damage).sum(axis = 1)
+        return damage, roll_success.sum(axis = 1)
+
+    total_damage = per_roll_damage.sum(axis = 1)
+    if spec.roll_type == "save":
+        d20 = rng.integers(1, 21, size = n_samples, dtype = np.int16)
+        roll_success = (d20 + spec.check_value <= spec.DC) | (d20 == 1)
+    else:
+        roll_success = np.ones(n_samples, dtype = bool)
+
+    if spec.half_damage_on_fail:
+        saved_damage = scale_damage(total_damage // 2, spec.rvi_modifier)
+    else:
+        saved_damage = 0
+    damage = np.where(roll_success, scale_damage(total_damage, spec.rvi_modifier), saved_damage)
+    return damage, roll_success.astype(np.int64)
+
+
+def seed_sequence(seed = None):
+    # Seeds may be None, an int or an existing SeedSequence whose children
+    # are then spawned from it
+    if isinstance(seed, np.random.SeedSequence):
+        return seed
+    return np.random.SeedSequence(seed)
+
+
+def simulate_chunk(spec: SimulationSpec,
+                   n_samples: int,
+                   chunk_seed: np.random.SeedSequence):
+    return sample_damage(np.random.default_rng(chunk_seed), spec, n_samples)
+
+
+def simulate_spec(spec: SimulationSpec,
+                  n_samples: int,
+                  seed = None,
+                  chunk_size: int = default_chunk_size,
+                  n_workers: int = 1):
+    # Chunks get their own child seed, so a given seed and chunk_size give
+    # the same samples however many workers are used.
+    chunk_sizes = [min(chunk_size, n_samples - x) for x in range(0, n_samples, chunk_size)]
+    chunk_seeds = seed_sequence(seed).spawn(len(chunk_sizes))
+
+    if n_workers > 1 and len(chunk_sizes) > 1:
+        with ProcessPoolExecutor(max_workers = n_workers) as executor:
+            chunk_results = list(executor.map(simulate_chunk,
+                                              [spec] * len(chunk_sizes),
+                                              chunk_sizes, chunk_seeds))
+    else:
+        chunk_results = [simulate_chunk(spec, n, s) for n, s in zip(chunk_sizes, chunk_seeds)]
+
+    if len(chunk_results) == 0:
+        return SimulationResult(np.zeros(0, dtype = np.int64), np.zeros(0, dtype = np.int64))
+    return SimulationResult(np.concatenate([x[0] for x in chunk_results]),
+                            np.concatenate([x[1] for x in chunk_results]))
+
+
+def simulate_action(action,
+                    target: Character,
+                    n_samples: int,
+                    seed = None,
+                    override_target_checkval: int = None,
+                    chunk_size: int = default_chunk_size,
+                    n_workers: int = 1):
+    spec = SimulationSpec(action, target, override_target_checkval)
+    return simulate_spec(spec, n_samples, seed = seed,
+                         chunk_size = chunk_size, n_workers = n_workers)
+
+
+def simulate_abilities(ability_map: dict,
+                       target: Character,
+                       n_samples: int,
+                       seed = None,
+                       chunk_size: int = default_chunk_size,
+                       n_workers: int = 1):
+    ability_seeds = seed_sequence(seed).spawn(len(ability_map))
+    return {ability_name: simulate_action(action, target, n_samples,
+                                          seed = ability_seed,
+                                          chunk_size = chunk_size,
+                                          n_workers = n_workers)
+            for (ability_name, action), ability_seed in zip(ability_map.items(), ability_seeds)}
@@ -0,0 +1,88 @@
+from ability_index import top_k_positions
+import numpy as np
+
+
+class StatTable:
+    # One stat (phit, ehit or econ) of every ability at every check value, as
+    # a read-only C-contiguous float64 array of shape (check value, ability).
+    # Check values are a consecutive integer range, so a row is found by
+    # subtracting the first one. With copy=False a contiguous float64 array,
+    # e.g. a memory-mapped one, is wrapped as a read-only view.
+    def __init__(self,
+                 values: np.ndarray,
+                 check_values,
+                 ability_names: list[str],
+                 copy: bool = True):
+        if copy:
+            self.values = np.array(values, dtype = np.float64, order = "C")
+        else:
+            self.values = np.ascontiguousarray(values, dtype = np.float64).view()
+        self.values.flags.writeable = False
+        self.check_values = np.asarray(check_values, dtype = np.int64)
+        self.ability_names = list(ability_names)
+
+        if self.values.shape != (len(self.check_values), len(self.ability_names)):
+            raise ValueError("values must have shape (check values, abilities), got %s for "
+                             "%s check values and %s abilities." %
+                             (self.values.shape, len(self.check_values), len(self.ability_names)))
+        if len(self.check_values) == 0 or \
+                (np.diff(self.check_values) != 1).any():
+            raise ValueError("check_values must be a non-empty consecutive integer range.")
+
+        self.check_min = int(self.check_values[0])
+        self.ability_positions = {x: i for i, x in enumerate(self.ability_names)}
+
+    def __repr__(self):
+        return "StatTable(check values %s to %s, abilities=%s)" % \
+            (self.check_min, self.check_values[-1], len(self.ability_names))
+
+    def __len__(self):
+        return len(self.check_values)
+
+    @property
+    def shape(self):
+        return self.values.shape
+
+    @property
+    def nbytes(self):
+        return self.values.nbytes + self.check_values.nbytes
+
+    def row_positions(self, check_values):
+        row_positions = np.asarray(check_values, dtype = np.int64) - self.check_min
+        missing = (row_positions < 0) | (row_positions >= len(self.check_values))
+        if missing.any():
+            raise KeyError("Check values %s are not in the stat table." %
+                           np.atleast_1d(np.asarray(check_values))[np.atleast_1d(missing)].tolist())
+        return row_positions
+
+    def row(self, check_value: int):
+        return self.values[self.row_positions(int(check_value))]
+
+    def rows(self, check_values: list[int]):
+        return self.values[self.row_positions(check_values)]
+
+    def column(self, ability_name: str):
+        if ability_name not in self.ability_positions:
+            raise KeyError("No ability named '%s' in the stat table." % ability_name)
+        return self.values[:, self.ability_positions[ability_name]]
+
+    def value(self, check_value: int, ability_name: str):
+        return float(self.row(check_value)[self.ability_positions[ability_name]])
+
+    def top_k(self, check_value: int, n_options: int, mask: np.ndarray = None):
+        # [(value, ability_name), ...] of the n_options best abilities at a
+        # check value, only among mask if given, best first
+        check_row = self.row(check_value)
+        ability_positions = np.arange(len(self.ability_names)) if mask is None \
+            else np.flatnonzero(mask)
+        top_positions = ability_positions[top_k_positions(check_row[ability_positions],
+                                                          n_options)][::-1]
+        return [(check_row[x], self.ability_names[x]) for x in top_positions]
+
+    def to_pandas(self):
+        import pandas as pd
+
+        return pd.DataFrame(self.values,
+                            index = self.check_values,
+                            columns = self.ability_names,
+                            copy = True)
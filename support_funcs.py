@@ -1,7 +1,8 @@
 from fixed_names import character_actionsheet_path, character_detail_path
 import json
-import pandas as pd
+from metrics import timed_stage
 
+@timed_stage("load_json_from_path")
 def load_json_from_path(file_name, json_file_path: str = character_detail_path):
     with open("%s/%s.json" % (json_file_path, file_name), "r") as f:
         json_file = f.read()
@@ -11,4 +12,5 @@ def load_json_from_path(file_name, json_file_path: str = character_detail_path):
     return json_to_dict
 
 def load_csv_from_path(csv_file_path: str = character_actionsheet_path):
+    import pandas as pd
     return pd.read_csv(csv_file_path)
\ No newline at end of file
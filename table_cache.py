@@ -0,0 +1,129 @@
+from character import Character
+from collections import OrderedDict
+from fixed_names import damage_types
+import hashlib
+import threading
+from table_engine import accepted_stats, spellslot_state
+from weakref import WeakKeyDictionary
+
+ability_fingerprint_memo = WeakKeyDictionary()
+
+
+def stable_hash(*parts):
+    return hashlib.sha1(repr(parts).encode("utf-8")).hexdigest()
+
+
+def ability_fingerprint(action_character: Character):
+    # Hashing every ability on every request would cost more than the lookup
+    # it saves, so the digest is memoised per Character until its ability set
+    # changes size or names.
+    ability_names = tuple(action_character.abilities.keys())
+    memo = ability_fingerprint_memo.get(action_character)
+    if memo is not None and memo[0] == ability_names:
+        return memo[1]
+
+    ability_parts = []
+    for ability_name, ability in action_character.abilities.items():
+        ability_attrs = tuple(sorted((k, repr(v)) for k, v in ability.field_items()))
+        ability_parts.append((ability_name, type(ability).__name__, ability_attrs))
+    fingerprint = stable_hash(*ability_parts)
+
+    ability_fingerprint_memo[action_character] = (ability_names, fingerprint)
+    return fingerprint
+
+
+def target_fingerprint(target: Character):
+    # Only RVI against real damage types reaches build_hit_stat_table; AC and
+    # saving throw modifiers just select the row that is read out.
+    return stable_hash(*[(x,
+                          target.vulnerablities.get(x, False),
+                          target.resistances.get(x, False),
+                          target.immunities.get(x, False)) for x in damage_types])
+
+
+def stat_table_key(target: Character,
+                   action_character: Character,
+                   stat: str,
+                   value_check_min: int = -30,
+                   value_check_max: int = 30,
+                   scarcity_coeff: float = 0.45):
+    if stat not in accepted_stats:
+        raise ValueError("stat must be one of %s." % accepted_stats)
+
+    key_parts = [stat, ability_fingerprint(action_character),
+                 value_check_min, value_check_max]
+    if stat in ("ehit", "econ"):
+        key_parts.append(target_fingerprint(target))
+    if stat == "econ":
+        key_parts += [spellslot_state(action_character), scarcity_coeff]
+
+    return stable_hash(*key_parts)
+
+
+def table_nbytes(table):
+    return int(getattr(table, "nbytes", 0))
+
+
+class StatTableCache:
+    def __init__(self,
+                 max_entries: int = 128,
+                 max_bytes: int = None):
+        if max_entries is not None and max_entries <= 0:
+            raise ValueError("max_entries must be a positive integer or None.")
+
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Shared by every session of a threaded server
+        self.lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def get(self, key):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key][0]
+            else:
+                self.misses += 1
+                return None
+
+    def put(self, key, table):
+        entry_bytes = table_nbytes(table)
+        with self.lock:
+            if key in self.entries:
+                self.total_bytes -= self.entries.pop(key)[1]
+
+            self.entries[key] = (table, entry_bytes)
+            self.total_bytes += entry_bytes
+            self.evict()
+
+    def evict(self):
+        # The newest entry is always kept, even if it alone exceeds max_bytes
+        while len(self.entries) > 1 and \
+                ((self.max_entries is not None and len(self.entries) > self.max_entries) or
+                 (self.max_bytes is not None and self.total_bytes > self.max_bytes)):
+            _, (_, entry_bytes) = self.entries.popitem(last = False)
+            self.total_bytes -= entry_bytes
+            self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.total_bytes = 0
+
+    def counters(self):
+        return {"hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self.entries),
+                "bytes": self.total_bytes}
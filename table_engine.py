@@ -0,0 +1,342 @@
+from ability_table import AbilityTable
+from character import Character
+from fixed_names import action_times, roll_type_codes
+import numpy as np
+from roll_kernels import RollKernel, default_kernels
+
+accepted_stats = ['ehit', 'phit', 'econ']
+
+action_time_costs = {"A": 1, "B": 0.5, "R": 0, "L": 2}
+# Indexed by action time code
+action_time_cost_codes = np.array([action_time_costs[x] for x in action_times], dtype=float)
+
+
+class AbilityColumns:
+    def __init__(self, abilities: dict, ability_table: AbilityTable = None):
+        # Everything here only depends on the abilities themselves, so it can be
+        # reused across targets and spell slot changes. Derived from the
+        # abilities' AbilityTable, which a Character caches (character_columns).
+        if ability_table is None or not ability_table.matches(abilities):
+            ability_table = AbilityTable(abilities)
+        self.names = list(abilities.keys())
+        self.actions = list(abilities.values())
+
+        roll_type = ability_table["roll_type"]
+        self.is_hit = roll_type == roll_type_codes["hit"]
+        self.is_save = roll_type == roll_type_codes["save"]
+        self.hit_bonus = np.nan_to_num(ability_table["hit_bonus"], nan = 0)
+        self.DC = np.nan_to_num(ability_table["DC"], nan = 0)
+        self.DC_type = ability_table.decoded_array("DC_type")
+        has_die = ability_table["damage_die"] >= 0
+        self.die_expectation = np.where(has_die, (ability_table["damage_die"] + 1) / 2, 0.)
+        self.n_damage_die = np.where(has_die, np.maximum(ability_table["n_damage_die"], 0),
+                                     0).astype(float)
+        self.flat_damage = np.maximum(ability_table["flat_damage"], 0).astype(float)
+        self.n_hit_rolls = np.maximum(ability_table["n_hit_rolls"], 0).astype(float)
+        self.half_damage_on_fail = ability_table["half_damage_on_fail"].copy()
+        self.damage_type = ability_table.decoded_array("damage_type")
+        self.time_cost = action_time_cost_codes[ability_table["action_time"]]
+        self.spell_level = np.maximum(ability_table["spell_level"], 0).astype(int)
+        self.utility = np.nan_to_num(ability_table["utility"], nan = 0)
+
+        # Mirrors calculate_expected_hit before hit probability and RVI are applied
+        self.total_damage = self.n_hit_rolls * \
+            (self.n_damage_die * self.die_expectation + self.flat_damage)
+
+    def __len__(self):
+        return len(self.names)
+
+    def take(self, ability_idx: np.ndarray):
+        column_subset = object.__new__(AbilityColumns)
+        for attr_name, attr_value in self.__dict__.items():
+            if isinstance(attr_value, np.ndarray):
+                setattr(column_subset, attr_name, attr_value[ability_idx])
+            else:
+                setattr(column_subset, attr_name, [attr_value[i] for i in ability_idx])
+        return column_subset
+
+
+def character_columns(action_character: Character):
+    return AbilityColumns(action_character.abilities,
+                          ability_table = action_character.get_ability_table())
+
+
+def rvi_column(columns: AbilityColumns,
+               target: Character):
+    rvi_modifier = np.ones(len(columns))
+    for action_hit_type in set(columns.damage_type):
+        if action_hit_type is None:
+            continue
+
+        hit_vuln = target.vulnerablities.get(action_hit_type, False)
+        hit_resist = target.resistances.get(action_hit_type, False)
+        hit_immune = target.immunities.get(action_hit_type, False)
+
+        if sum([hit_vuln, hit_resist, hit_immune]) > 1:
+            raise ValueError("target cannot be vulnerable | resistant | immune simultaneously")
+
+        type_mask = columns.damage_type == action_hit_type
+        if hit_vuln:
+            rvi_modifier[type_mask] = 2
+        elif hit_immune:
+            rvi_modifier[type_mask] = 0
+        elif hit_resist:
+            rvi_modifier[type_mask] = 1/2
+
+    return rvi_modifier
+
+
+def scarcity_column(columns: AbilityColumns,
+                    action_character: Character,
+                    scarcity_coeff: float = 0.45):
+    scarcity = np.ones(len(columns))
+    if not (columns.spell_level > 0).any():
+        return scarcity
+
+    total_spellslots = sum([v.n_remaining() for k, v in
+                            action_character.spellslots.items()])
+    for spell_level in np.unique(columns.spell_level):
+        if spell_level == 0:
+            continue
+        # An exhausted level is infinitely scarce (econ -inf) rather than the
+        # ZeroDivisionError calculate_hit_economy raises
+        level_slots = action_character.spellslots[spell_level].n_remaining()
+        with np.errstate(divide='ignore'):
+            scarcity[columns.spell_level == spell_level] = \
+                (np.float64(total_spellslots)/level_slots) ** scarcity_coeff
+
+    return scarcity
+
+
+def economy_cost_column(columns: AbilityColumns,
+                        scarcity: np.ndarray):
+    total_cost = (columns.spell_level + columns.time_cost) * scarcity
+    total_cost[total_cost == 0] = 1
+
+    return total_cost ** (1/2)
+
+
+def ability_check_values(columns: AbilityColumns,
+                         target: Character):
+    # The value each ability actually rolls against: AC for hit and no_roll,
+    # the matching saving throw modifier for saves
+    check_values = np.full(len(columns), target.AC, dtype=float)
+    for i in np.flatnonzero(columns.is_save):
+        check_values[i] = target.st_modifiers[columns.DC_type[i]]
+    return check_values
+
+
+def hit_probability_matrix(columns: AbilityColumns,
+                           check_values: np.ndarray,
+                           attack_kernel: RollKernel = None,
+                           save_kernel: RollKernel = None):
+    return hit_probability_values(columns,
+                                  np.asarray(check_values, dtype=float)[:, None],
+                                  attack_kernel = attack_kernel,
+                                  save_kernel = save_kernel)
+
+
+def hit_probability_values(columns: AbilityColumns,
+                           check_values: np.ndarray,
+                           attack_kernel: RollKernel = None,
+                           save_kernel: RollKernel = None):
+    # check_values broadcasts against the ability axis, e.g. one value per
+    # ability or a column of check values per row. The attack kernel is the
+    # attacker's roll, the save kernel the target's.
+    if attack_kernel is None:
+        attack_kernel = default_kernels["normal"]
+    if save_kernel is None:
+        save_kernel = default_kernels["normal"]
+
+    hit_probability = attack_kernel.hit_probability(columns.hit_bonus - check_values)
+    save_fail_probability = save_kernel.save_fail_probability(check_values - columns.DC)
+
+    return np.where(columns.is_hit, hit_probability,
+                    np.where(columns.is_save, save_fail_probability, 1.0))
+
+
+def crit_damage_column(columns: AbilityColumns,
+                       attack_kernel: RollKernel = None):
+    # Extra expected damage from natural 20s doubling the damage dice
+    if attack_kernel is None:
+        attack_kernel = default_kernels["normal"]
+    return np.where(columns.is_hit,
+                    columns.n_hit_rolls * (columns.n_damage_die * columns.die_expectation) *
+                    attack_kernel.crit_probability, 0)
+
+
+def expected_hit_matrix(columns: AbilityColumns,
+                        hit_probability: np.ndarray,
+                        rvi_modifier: np.ndarray,
+                        crit_damage: np.ndarray = None,
+                        total_damage: np.ndarray = None):
+    if total_damage is None:
+        total_damage = columns.total_damage
+    full_damage = total_damage * hit_probability
+    half_damage = full_damage + (1 - hit_probability) * 1/2 * total_damage
+    if crit_damage is not None:
+        full_damage = full_damage + crit_damage
+    expected_damage = np.where(columns.half_damage_on_fail, half_damage, full_damage)
+
+    return expected_damage * rvi_modifier
+
+
+def economy_matrix(columns: AbilityColumns,
+                   expected_hit: np.ndarray,
+                   cost_root: np.ndarray):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.log((expected_hit + columns.utility)/cost_root)
+
+
+def build_stat_array(target: Character,
+                     action_character: Character,
+                     stat: str,
+                     value_check_min: int = -30,
+                     value_check_max: int = 30,
+                     scarcity_coeff: float = 0.45,
+                     columns: AbilityColumns = None,
+                     attack_kernel: RollKernel = None,
+                     save_kernel: RollKernel = None,
+                     crits: bool = False):
+    if stat not in accepted_stats:
+        raise ValueError("stat must be one of %s." % accepted_stats)
+
+    if columns is None:
+        columns = character_columns(action_character)
+    check_values = np.arange(value_check_min, value_check_max + 1)
+
+    hit_probability = hit_probability_matrix(columns, check_values,
+                                             attack_kernel = attack_kernel,
+                                             save_kernel = save_kernel)
+    if stat == "phit":
+        return hit_probability
+
+    expected_hit = expected_hit_matrix(columns, hit_probability,
+                                       rvi_column(columns, target),
+                                       crit_damage_column(columns, attack_kernel) if crits else None)
+    if stat == "ehit":
+        return expected_hit
+
+    cost_root = economy_cost_column(columns,
+                                    scarcity_column(columns, action_character,
+                                                    scarcity_coeff))
+    return economy_matrix(columns, expected_hit, cost_root)
+
+
+def build_target_stat_row(target: Character,
+                          action_character: Character,
+                          stat: str,
+                          scarcity_coeff: float = 0.45,
+                          columns: AbilityColumns = None,
+                          attack_kernel: RollKernel = None,
+                          save_kernel: RollKernel = None,
+                          crits: bool = False):
+    # One value per ability at the target's own AC/ST rather than a sweep
+    # over check values, i.e. what character_driven_interaction returns
+    if stat not in accepted_stats:
+        raise ValueError("stat must be one of %s." % accepted_stats)
+
+    if columns is None:
+        columns = character_columns(action_character)
+
+    hit_probability = hit_probability_values(columns, ability_check_values(columns, target),
+                                             attack_kernel = attack_kernel,
+                                             save_kernel = save_kernel)
+    if stat == "phit":
+        return hit_probability
+
+    expected_hit = expected_hit_matrix(columns, hit_probability, rvi_column(columns, target),
+                                       crit_damage_column(columns, attack_kernel) if crits else None)
+    if stat == "ehit":
+        return expected_hit
+
+    cost_root = economy_cost_column(columns,
+                                    scarcity_column(columns, action_character,
+                                                    scarcity_coeff))
+    return economy_matrix(columns, expected_hit, cost_root)
+
+
+def spellslot_state(action_character: Character):
+    return tuple((level, slot_level.n_remaining()) for level, slot_level
+                 in action_character.spellslots.items())
+
+
+class IncrementalStatTables:
+    # Keeps the three stat arrays for one character and only recomputes the
+    # slices invalidated by a change. AC and ST modifiers never enter the
+    # arrays (they only pick the row looked up), RVI only touches ehit/econ
+    # columns whose damage type changed, and spell slots only touch econ.
+    def __init__(self,
+                 value_check_min: int = -30,
+                 value_check_max: int = 30,
+                 scarcity_coeff: float = 0.45):
+        self.check_values = np.arange(value_check_min, value_check_max + 1)
+        self.scarcity_coeff = scarcity_coeff
+        self.clear()
+
+    def clear(self):
+        self.character = None
+        self.ability_names = None
+        self.columns = None
+        self.rvi_modifier = None
+        self.slot_state = None
+        self.cost_root = None
+        self.arrays = {stat: None for stat in accepted_stats}
+
+    def full_rebuild(self, target, action_character):
+        self.character = action_character
+        self.ability_names = list(action_character.abilities.keys())
+        self.columns = character_columns(action_character)
+        self.rvi_modifier = rvi_column(self.columns, target)
+        self.slot_state = spellslot_state(action_character)
+        self.cost_root = economy_cost_column(self.columns,
+                                             scarcity_column(self.columns, action_character,
+                                                             self.scarcity_coeff))
+
+        hit_probability = hit_probability_matrix(self.columns, self.check_values)
+        expected_hit = expected_hit_matrix(self.columns, hit_probability, self.rvi_modifier)
+        self.arrays = {"phit": hit_probability,
+                       "ehit": expected_hit,
+                       "econ": economy_matrix(self.columns, expected_hit, self.cost_root)}
+
+        return set(accepted_stats)
+
+    def update(self,
+               target: Character,
+               action_character: Character):
+        if action_character is not self.character or \
+                self.ability_names != list(action_character.abilities.keys()):
+            return self.full_rebuild(target, action_character)
+
+        rebuilt_stats = set()
+
+        rvi_modifier = rvi_column(self.columns, target)
+        ehit_idx = np.flatnonzero(rvi_modifier != self.rvi_modifier)
+        if len(ehit_idx) > 0:
+            self.rvi_modifier = rvi_modifier
+            column_subset = self.columns.take(ehit_idx)
+            self.arrays["ehit"][:, ehit_idx] = expected_hit_matrix(column_subset,
+                                                                   self.arrays["phit"][:, ehit_idx],
+                                                                   rvi_modifier[ehit_idx])
+            rebuilt_stats.add("ehit")
+
+        econ_mask = np.zeros(len(self.columns), dtype=bool)
+        econ_mask[ehit_idx] = True
+
+        slot_state = spellslot_state(action_character)
+        if slot_state != self.slot_state:
+            self.slot_state = slot_state
+            cost_root = economy_cost_column(self.columns,
+                                            scarcity_column(self.columns, action_character,
+                                                            self.scarcity_coeff))
+            econ_mask |= cost_root != self.cost_root
+            self.cost_root = cost_root
+
+        econ_idx = np.flatnonzero(econ_mask)
+        if len(econ_idx) > 0:
+            self.arrays["econ"][:, econ_idx] = economy_matrix(self.columns.take(econ_idx),
+                                                              self.arrays["ehit"][:, econ_idx],
+                                                              self.cost_root[econ_idx])
+            rebuilt_stats.add("econ")
+
+        return rebuilt_stats
@@ -0,0 +1,182 @@
+import csv
+import io
+import json
+import math
+import numpy as np
+from table_engine import accepted_stats, IncrementalStatTables
+
+# One row per character, target, stat, check value and ability, i.e. one
+# cell of a build_hit_stat_table result
+export_columns = ["character", "target", "stat", "check_value", "ability", "value"]
+export_formats = {"csv": "text/csv", "jsonl": "application/x-ndjson"}
+
+
+def table_row_blocks(characters: dict,
+                     targets,
+                     stats: list[str] = accepted_stats,
+                     value_check_min: int = -30,
+                     value_check_max: int = 30,
+                     scarcity_coeff: float = 0.45):
+    # Blocks of rows ({column: array}), one per (target, character, stat)
+    # table, built lazily from {name: Character} and an iterable of target
+    # Characters that is only read once. Each character keeps one
+    # IncrementalStatTables, so a new target only rebuilds the columns its RVI
+    # changes.
+    for stat in stats:
+        if stat not in accepted_stats:
+            raise ValueError("stat must be one of %s." % accepted_stats)
+
+    builders = {x: IncrementalStatTables(value_check_min = value_check_min,
+                                         value_check_max = value_check_max,
+                                         scarcity_coeff = scarcity_coeff) for x in characters}
+    for target in targets:
+        for character_name, action_character in characters.items():
+            builder = builders[character_name]
+            builder.update(target = target, action_character = action_character)
+            n_checks, n_abilities = len(builder.check_values), len(builder.ability_names)
+            check_column = np.repeat(builder.check_values, n_abilities)
+            ability_column = np.tile(np.array(builder.ability_names, dtype = object), n_checks)
+            for stat in stats:
+                n_rows = n_checks * n_abilities
+                # Copied, as the builder updates its arrays in place
+                yield {"character": np.full(n_rows, character_name, dtype = object),
+                       "target": np.full(n_rows, target.name, dtype = object),
+                       "stat": np.full(n_rows, stat, dtype = object),
+                       "check_value": check_column,
+                       "ability": ability_column,
+                       "value": np.array(builder.arrays[stat], dtype = np.float64).ravel()}
+
+
+def block_length(block: dict):
+    return len(block["value"])
+
+
+def rechunk_blocks(blocks, chunk_rows: int = 65536):
+    # Regroups blocks into chunks of exactly chunk_rows rows (the last may be
+    # shorter), so at most about two chunks are held at any time
+    if chunk_rows <= 0:
+        raise ValueError("chunk_rows must be a positive integer.")
+
+    pending, pending_rows = [], 0
+    for block in blocks:
+        start = 0
+        while start < block_length(block):
+            take = min(chunk_rows - pending_rows, block_length(block) - start)
+            pending.append({k: v[start:start + take] for k, v in block.items()})
+            pending_rows += take
+            start += take
+            if pending_rows == chunk_rows:
+                yield concat_blocks(pending)
+                pending, pending_rows = [], 0
+    if pending_rows > 0:
+        yield concat_blocks(pending)
+
+
+def concat_blocks(blocks: list[dict]):
+    if len(blocks) == 1:
+        return blocks[0]
+    return {k: np.concatenate([x[k] for x in blocks]) for k in blocks[0]}
+
+
+def csv_chunks(chunks, header: bool = True):
+    # CSV text, one string per chunk
+    for i, chunk in enumerate(chunks):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator = "\n")
+        if header and i == 0:
+            writer.writerow(export_columns)
+        writer.writerows(zip(*[chunk[x].tolist() for x in export_columns]))
+        yield buffer.getvalue()
+
+
+def jsonl_chunks(chunks):
+    # One JSON object per row, one string per chunk. Names repeat on every
+    # row, so each is JSON encoded once; NaN and inf values are not valid
+    # JSON and become null.
+    encoded_names = {}
+
+    def encode_name(name: str):
+        if name not in encoded_names:
+            encoded_names[name] = json.dumps(name)
+        return encoded_names[name]
+
+    row_format = "{" + ", ".join(['"%s": %%s' % x for x in export_columns]) + "}\n"
+    for chunk in chunks:
+        columns = [[encode_name(x) for x in chunk[column_name].tolist()]
+                   for column_name in ["character", "target", "stat"]]
+        columns.append(chunk["check_value"].tolist())
+        columns.append([encode_name(x) for x in chunk["ability"].tolist()])
+        columns.append([repr(x) if math.isfinite(x) else "null" for x in chunk["value"].tolist()])
+        yield "".join([row_format % row for row in zip(*columns)])
+
+
+def text_chunks(chunks, export_format: str):
+    if export_format == "csv":
+        return csv_chunks(chunks)
+    elif export_format == "jsonl":
+        return jsonl_chunks(chunks)
+    raise ValueError("export_format must be one of %s." % list(export_formats.keys()))
+
+
+def write_parquet(chunks, output_path: str):
+    # Columnar output, one row group per chunk
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([("character", pa.string()), ("target", pa.string()),
+                        ("stat", pa.string()), ("check_value", pa.int64()),
+                        ("ability", pa.string()), ("value", pa.float64())])
+    with pq.ParquetWriter(output_path, schema) as writer:
+        for chunk in chunks:
+            writer.write_table(pa.Table.from_pydict({x: chunk[x] for x in export_columns},
+                                                    schema = schema))
+    return output_path
+
+
+def export_tables(characters: dict,
+                  targets,
+                  output_path: str,
+                  export_format: str = None,
+                  chunk_rows: int = 65536,
+                  **kwargs):
+    # Streams every table of table_row_blocks to output_path as csv, jsonl or
+    # parquet (default from the file extension). Returns the rows written.
+    if export_format is None:
+        export_format = output_path.rsplit(".", 1)[-1].lower()
+
+    n_rows = [0]
+
+    def counted(chunks):
+        for chunk in chunks:
+            n_rows[0] += block_length(chunk)
+            yield chunk
+
+    chunks = counted(rechunk_blocks(table_row_blocks(characters, targets, **kwargs), chunk_rows))
+    if export_format == "parquet":
+        write_parquet(chunks, output_path)
+    else:
+        with open(output_path, "w", newline = "") as f:
+            for text_chunk in text_chunks(chunks, export_format):
+                f.write(text_chunk)
+    return n_rows[0]
+
+
+if __name__ == "__main__":
+    import argparse
+    from party_evaluator import load_party, load_targets
+    import warnings
+
+    parser = argparse.ArgumentParser(description = "Export stat tables of characters against "
+                                                   "targets as csv, jsonl or parquet.")
+    parser.add_argument("targets", help = "JSON file with one target stat block or a list.")
+    parser.add_argument("output", help = "Output file, format taken from its extension.")
+    parser.add_argument("--characters", nargs = "+",
+                        help = "Character sheet names, default every available sheet.")
+    parser.add_argument("--stats", nargs = "+", default = accepted_stats, choices = accepted_stats)
+    parser.add_argument("--chunk-rows", type = int, default = 65536)
+    args = parser.parse_args()
+
+    warnings.simplefilter("ignore", RuntimeWarning)
+    n_written = export_tables(load_party(args.characters), load_targets(args.targets),
+                              args.output, chunk_rows = args.chunk_rows, stats = args.stats)
+    print("Wrote %s rows to %s." % (n_written, args.output))
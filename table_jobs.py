@@ -0,0 +1,107 @@
+from concurrent.futures import ThreadPoolExecutor
+import itertools
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+job_statuses = ["queued", "running", "done", "cancelled", "failed"]
+finished_statuses = ["done", "cancelled", "failed"]
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class TableJob:
+    # Handle on one background table build. The build function reports
+    # progress through report(), which is also where a cancelled job stops,
+    # so cancellation takes effect between build steps.
+    def __init__(self, job_id: int, key):
+        self.job_id = job_id
+        self.key = key
+        self.status = "queued"
+        self.progress = 0.0
+        self.result = None
+        self.error = None
+        self.future = None
+        self.cancel_event = threading.Event()
+        self.submitted = time.monotonic()
+        self.finished = None
+
+    def __repr__(self):
+        return "TableJob(%s, %s, %.0f%%)" % (self.job_id, self.status, self.progress * 100)
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    def done(self):
+        return self.status in finished_statuses
+
+    def cancel(self):
+        self.cancel_event.set()
+        if self.future is not None and self.future.cancel():
+            self.finish("cancelled")
+
+    def check_cancelled(self):
+        if self.cancelled:
+            raise JobCancelled()
+
+    def report(self, progress: float):
+        self.check_cancelled()
+        self.progress = progress
+
+    def finish(self, status: str):
+        self.status = status
+        self.finished = time.monotonic()
+
+    def wait(self, timeout: float = None):
+        # Blocks until the job finishes; returns its status
+        if self.future is not None:
+            self.future.exception(timeout = timeout)
+        return self.status
+
+    def to_dict(self):
+        return {"job_id": self.job_id,
+                "status": self.status,
+                "progress": round(self.progress, 3),
+                "error": self.error}
+
+
+class TableJobRunner:
+    # Runs build functions on a thread pool. Threads rather than processes
+    # since builds update session state in place, and the numpy work in them
+    # releases the GIL.
+    def __init__(self, max_workers: int = 2):
+        self.executor = ThreadPoolExecutor(max_workers = max_workers,
+                                           thread_name_prefix = "table_job")
+        self.job_ids = itertools.count(1)
+
+    def submit(self, key, build, *args, **kwargs):
+        # build is called as build(job, *args, **kwargs)
+        job = TableJob(next(self.job_ids), key)
+        job.future = self.executor.submit(self.run, job, build, args, kwargs)
+        return job
+
+    def run(self, job: TableJob, build, args: tuple, kwargs: dict):
+        if job.cancelled:
+            job.finish("cancelled")
+            return None
+
+        job.status = "running"
+        try:
+            job.result = build(job, *args, **kwargs)
+            job.progress = 1.0
+            job.finish("done")
+        except JobCancelled:
+            job.finish("cancelled")
+        except Exception as e:
+            job.error = "%s: %s" % (type(e).__name__, e)
+            job.finish("failed")
+            logger.warning("Table job %s failed: %s", job.job_id, job.error)
+        return job.result
+
+    def shutdown(self, wait: bool = True):
+        self.executor.shutdown(wait = wait, cancel_futures = True)
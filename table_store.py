@@ -0,0 +1,227 @@
+from character import Character
+from fixed_names import table_store_path
+import numpy as np
+import os
+from sheet_compiler import file_sha1
+from stat_table import StatTable
+from table_cache import target_fingerprint
+from table_engine import IncrementalStatTables
+import threading
+
+table_store_suffix = ".tables.npy"
+table_index_suffix = ".tables.index.npz"
+
+# Order of the stat axis in every store
+stored_stats = ["phit", "ehit", "econ"]
+
+
+def table_store_paths(store_dir: str, sheet_name: str):
+    return (os.path.join(store_dir, sheet_name + table_store_suffix),
+            os.path.join(store_dir, sheet_name + table_index_suffix))
+
+
+def source_file_states(source_paths: list[str]):
+    # (mtime_ns, size) of each source file
+    source_stats = [os.stat(x) for x in source_paths]
+    return np.array([[x.st_mtime_ns, x.st_size] for x in source_stats], dtype = np.int64)
+
+
+def build_table_store(action_character: Character,
+                      targets,
+                      sheet_name: str,
+                      source_paths: list[str],
+                      store_dir: str = table_store_path,
+                      value_check_min: int = -30,
+                      value_check_max: int = 30,
+                      scarcity_coeff: float = 0.45):
+    # Stacks the phit/ehit/econ tables of action_character against every
+    # distinct target into one (entry, stat, check value, ability) .npy file,
+    # and writes an index of target fingerprint -> entry next to it. Targets
+    # only differ by RVI, so a catalog collapses to a few entries.
+    # Both files are written under temporary names and then replaced, so
+    # readers never see a half written store.
+    distinct_targets = {}
+    for target in targets:
+        distinct_targets.setdefault(target_fingerprint(target), target)
+    if len(distinct_targets) == 0:
+        raise ValueError("targets must hold at least one target.")
+
+    os.makedirs(store_dir, exist_ok = True)
+    data_path, index_path = table_store_paths(store_dir, sheet_name)
+    builder = IncrementalStatTables(value_check_min = value_check_min,
+                                    value_check_max = value_check_max,
+                                    scarcity_coeff = scarcity_coeff)
+    ability_names = list(action_character.abilities.keys())
+    shape = (len(distinct_targets), len(stored_stats), len(builder.check_values),
+             len(ability_names))
+
+    data_tmp_path = data_path + ".tmp"
+    stored_tables = np.lib.format.open_memmap(data_tmp_path, mode = "w+",
+                                              dtype = np.float64, shape = shape)
+    for entry_idx, target in enumerate(distinct_targets.values()):
+        builder.update(target = target, action_character = action_character)
+        for stat_idx, stat in enumerate(stored_stats):
+            stored_tables[entry_idx, stat_idx] = builder.arrays[stat]
+    stored_tables.flush()
+    del stored_tables
+
+    index_tmp_path = index_path + ".tmp.npz"
+    np.savez(index_tmp_path,
+             target_keys = np.array(list(distinct_targets.keys()), dtype = np.str_),
+             ability_names = np.array(ability_names, dtype = np.str_),
+             check_values = builder.check_values,
+             stats = np.array(stored_stats, dtype = np.str_),
+             value_check_min = np.array(value_check_min, dtype = np.int64),
+             value_check_max = np.array(value_check_max, dtype = np.int64),
+             scarcity_coeff = np.array(scarcity_coeff, dtype = np.float64),
+             __source_states__ = source_file_states(source_paths),
+             __source_sha1s__ = np.array([file_sha1(x) for x in source_paths], dtype = np.str_))
+    os.replace(data_tmp_path, data_path)
+    os.replace(index_tmp_path, index_path)
+    return data_path, index_path
+
+
+class TableStore:
+    # Read side of one character's store. The index is parsed once on open
+    # and the stacked tables are memory mapped, so lookups hand out
+    # StatTables that are views into the file: nothing is recomputed, copied
+    # or parsed.
+    def __init__(self, data_path: str, index_path: str):
+        self.data_path = data_path
+        self.index_path = index_path
+        with np.load(index_path) as table_index:
+            self.entry_lookup = {str(x): i for i, x in enumerate(table_index["target_keys"])}
+            self.ability_names = [str(x) for x in table_index["ability_names"]]
+            self.check_values = table_index["check_values"]
+            self.settings = (int(table_index["value_check_min"]),
+                             int(table_index["value_check_max"]),
+                             float(table_index["scarcity_coeff"]))
+            self.source_states = table_index["__source_states__"]
+            self.source_sha1s = [str(x) for x in table_index["__source_sha1s__"]]
+        self.tables = np.load(data_path, mmap_mode = "r")
+        if self.tables.shape != (len(self.entry_lookup), len(stored_stats),
+                                 len(self.check_values), len(self.ability_names)):
+            raise ValueError("Table store %s does not match its index." % data_path)
+        self.entry_tables = {}
+        # Source file states last checked, and whether the store was current
+        # for them, so unchanged files are never re-hashed
+        self.checked_states = None
+        self.checked_current = False
+
+    def __repr__(self):
+        return "TableStore(%s, entries=%s, abilities=%s)" % \
+            (self.data_path, len(self.entry_lookup), len(self.ability_names))
+
+    def __len__(self):
+        return len(self.entry_lookup)
+
+    def is_current(self,
+                   source_paths: list[str],
+                   value_check_min: int = -30,
+                   value_check_max: int = 30,
+                   scarcity_coeff: float = 0.45):
+        # Current when built with the same settings from the same character
+        # JSON and action sheet CSV, by mtime and size or else by content.
+        # Only stats the sources unless their states changed since last time.
+        if self.settings != (value_check_min, value_check_max, scarcity_coeff):
+            return False
+        try:
+            file_states = source_file_states(source_paths)
+            if self.checked_states is None or not np.array_equal(file_states, self.checked_states):
+                self.checked_current = np.array_equal(file_states, self.source_states) or \
+                    [file_sha1(x) for x in source_paths] == self.source_sha1s
+                self.checked_states = file_states
+        except OSError:
+            return False
+        return self.checked_current
+
+    def lookup(self, target: Character):
+        # {stat: StatTable} against target, or None if its RVI was never stored
+        entry_idx = self.entry_lookup.get(target_fingerprint(target))
+        if entry_idx is None:
+            return None
+        if entry_idx not in self.entry_tables:
+            self.entry_tables[entry_idx] = {x: StatTable(self.tables[entry_idx, i],
+                                                         check_values = self.check_values,
+                                                         ability_names = self.ability_names,
+                                                         copy = False)
+                                            for i, x in enumerate(stored_stats)}
+        return dict(self.entry_tables[entry_idx])
+
+
+class TableStores:
+    # Opened TableStores by sheet name, reopened when the store is rebuilt and
+    # ignored while its character JSON or CSV differs from what it was built
+    # from
+    def __init__(self, sheet_registry, store_dir: str = table_store_path):
+        self.sheet_registry = sheet_registry
+        self.store_dir = store_dir
+        self.lock = threading.Lock()
+        self.stores = {}
+
+    def source_paths(self, sheet_name: str):
+        self.sheet_registry.refresh()
+        return [self.sheet_registry.detail_files[sheet_name],
+                self.sheet_registry.actionsheet_files[sheet_name]]
+
+    def get(self, sheet_name: str):
+        # Opened once per index file; later calls only stat the index and the
+        # sources
+        try:
+            source_paths = self.source_paths(sheet_name)
+        except KeyError:
+            return None
+        data_path, index_path = table_store_paths(self.store_dir, sheet_name)
+        with self.lock:
+            try:
+                index_mtime = os.stat(index_path).st_mtime_ns
+            except OSError:
+                self.stores.pop(sheet_name, None)
+                return None
+            opened = self.stores.get(sheet_name)
+            if opened is None or opened[0] != index_mtime:
+                try:
+                    opened = (index_mtime, TableStore(data_path, index_path))
+                except (OSError, ValueError, KeyError):
+                    self.stores.pop(sheet_name, None)
+                    return None
+                self.stores[sheet_name] = opened
+        return opened[1] if opened[1].is_current(source_paths) else None
+
+    def lookup(self, sheet_name: str, target: Character):
+        store = self.get(sheet_name)
+        return None if store is None else store.lookup(target)
+
+    def open_all(self):
+        return {x: self.get(x) for x in self.sheet_registry.available_sheets()}
+
+    def build(self, sheet_name: str, targets):
+        action_character = self.sheet_registry.character(sheet_name)
+        paths = build_table_store(action_character, targets, sheet_name,
+                                  self.source_paths(sheet_name), store_dir = self.store_dir)
+        with self.lock:
+            self.stores.pop(sheet_name, None)
+        return paths
+
+
+if __name__ == "__main__":
+    import argparse
+    from monster_catalog import MonsterCatalog
+    from sheet_registry import SheetRegistry
+    import warnings
+
+    parser = argparse.ArgumentParser(description = "Precompute every character's stat tables "
+                                                   "against the monster catalog.")
+    parser.add_argument("--characters", nargs = "+",
+                        help = "Character sheet names, default every available sheet.")
+    parser.add_argument("--catalog", default = None, help = "Monster catalog path.")
+    parser.add_argument("--store-dir", default = table_store_path)
+    args = parser.parse_args()
+
+    warnings.simplefilter("ignore", RuntimeWarning)
+    catalog = MonsterCatalog() if args.catalog is None else MonsterCatalog(args.catalog)
+    stores = TableStores(SheetRegistry(), store_dir = args.store_dir)
+    for sheet_name in args.characters or stores.sheet_registry.available_sheets():
+        targets = (Character(**catalog.character_kwargs(x)) for x in range(len(catalog)))
+        data_path, _ = stores.build(sheet_name, targets)
+        print("%s: %s entries in %s" % (sheet_name, len(stores.get(sheet_name)), data_path))
@@ -0,0 +1,106 @@
+from ability_index import top_k_positions
+from character import Character
+from fixed_names import damage_type_codes, DC_types
+from monster_catalog import MonsterCatalog, rvi_fields
+import numpy as np
+from roll_kernels import RollKernel
+from table_engine import (accepted_stats, AbilityColumns, crit_damage_column, economy_cost_column,
+                          economy_matrix, expected_hit_matrix, hit_probability_values,
+                          scarcity_column)
+
+
+def catalog_check_matrix(columns: AbilityColumns, catalog: MonsterCatalog, record_idx: np.ndarray):
+    # (target, ability) AC or saving throw modifier each ability rolls against
+    target_ac = catalog.ac[record_idx].astype(float)
+    target_saves = catalog.st_modifiers[record_idx].astype(float)
+    save_idx = np.array([DC_types.index(x) if x in DC_types else 0 for x in columns.DC_type],
+                        dtype = int)
+    return np.where(columns.is_save, target_saves[:, save_idx], target_ac[:, None])
+
+
+def catalog_rvi_matrix(columns: AbilityColumns, catalog: MonsterCatalog, record_idx: np.ndarray):
+    # rvi_column for every target, read off the catalog's RVI bitmasks
+    rvi_modifier = np.ones((len(record_idx), len(columns)))
+    rvi_bitmasks = catalog.rvi_bitmasks[record_idx]
+    for ability_idx, damage_type in enumerate(columns.damage_type):
+        if damage_type is None:
+            continue
+        damage_bit = np.uint32(1 << damage_type_codes[damage_type])
+        resist, vuln, immune = [(rvi_bitmasks[:, rvi_fields.index(x)] & damage_bit) > 0
+                                for x in rvi_fields]
+        conflicts = (resist.astype(int) + vuln + immune) > 1
+        if conflicts.any():
+            raise ValueError("target cannot be vulnerable | resistant | immune simultaneously: %s"
+                             % catalog.names_of(record_idx[conflicts][:5]))
+        rvi_modifier[:, ability_idx] = np.where(vuln, 2, np.where(immune, 0,
+                                                                  np.where(resist, 1/2, 1)))
+    return rvi_modifier
+
+
+def target_scores(actions,
+                  catalog: MonsterCatalog,
+                  stat: str = "ehit",
+                  record_idx: np.ndarray = None,
+                  action_character: Character = None,
+                  scarcity_coeff: float = 0.45,
+                  attack_kernel: RollKernel = None,
+                  save_kernel: RollKernel = None,
+                  crits: bool = False):
+    # stat of one ability, or the summed stat of a loadout of abilities,
+    # against every catalog record in record_idx (default all), with the same
+    # values character_driven_interaction gives against each built target.
+    if stat not in accepted_stats:
+        raise ValueError("stat must be one of %s." % accepted_stats)
+    if type(actions) not in (list, tuple):
+        actions = [actions]
+    if stat == "phit" and len(actions) > 1:
+        raise ValueError("phit can only be ranked for a single ability.")
+
+    catalog.load()
+    if record_idx is None:
+        record_idx = np.arange(len(catalog))
+
+    columns = AbilityColumns({i: x for i, x in enumerate(actions)})
+    hit_probability = hit_probability_values(columns,
+                                             catalog_check_matrix(columns, catalog, record_idx),
+                                             attack_kernel = attack_kernel,
+                                             save_kernel = save_kernel)
+    if stat == "phit":
+        return hit_probability[:, 0]
+
+    expected_hit = expected_hit_matrix(columns, hit_probability,
+                                       catalog_rvi_matrix(columns, catalog, record_idx),
+                                       crit_damage_column(columns, attack_kernel) if crits else None)
+    if stat == "ehit":
+        return expected_hit.sum(axis = 1)
+
+    if action_character is None:
+        if (columns.spell_level > 0).any():
+            raise ValueError("econ of a leveled spell needs the action_character's spell slots.")
+        scarcity = np.ones(len(columns))
+    else:
+        scarcity = scarcity_column(columns, action_character, scarcity_coeff)
+    return economy_matrix(columns, expected_hit, economy_cost_column(columns, scarcity)).sum(axis = 1)
+
+
+def rank_targets(actions,
+                 catalog: MonsterCatalog,
+                 stat: str = "ehit",
+                 k: int = 10,
+                 cr_min: float = None,
+                 cr_max: float = None,
+                 action_character: Character = None,
+                 **kwargs):
+    # The k catalog targets an ability (or loadout) does best against, best
+    # first, optionally only within a CR range
+    catalog.load()
+    record_idx = catalog.query(cr_min = cr_min, cr_max = cr_max)
+    scores = target_scores(actions, catalog, stat,
+                           record_idx = record_idx,
+                           action_character = action_character,
+                           **kwargs)
+
+    top_positions = top_k_positions(scores, k)[::-1]
+    return [{"name": str(catalog.names[record_idx[x]]),
+             "cr": float(catalog.cr[record_idx[x]]),
+             "value": scores[x]} for x in top_positions]
@@ -0,0 +1,26 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmark import synthetic_character, synthetic_target, write_synthetic_sheet
+from character import Character
+
+
+@pytest.fixture
+def sample_sheet(tmp_path):
+    return write_synthetic_sheet(str(tmp_path / "sample.csv"), n_abilities = 60, seed = 3)
+
+
+@pytest.fixture
+def sample_character(sample_sheet):
+    action_character = Character(**synthetic_character)
+    action_character.add_abilities_from_csv(sample_sheet, use_compiled = False)
+    return action_character
+
+
+@pytest.fixture
+def sample_target():
+    return Character(**synthetic_target)
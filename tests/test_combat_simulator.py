@@ -0,0 +1,32 @@
+import numpy as np
+
+from benchmark import synthetic_character
+from character import Character
+from combat_simulator import EncounterPlan, simulate_encounter_chunk, simulate_encounters
+
+
+def test_character_without_spell_slots(sample_sheet, sample_target):
+    action_character = Character(**dict(synthetic_character, spell_slots = {}))
+    action_character.add_abilities_from_csv(sample_sheet, use_compiled = False)
+    action_character.abilities = {k: v for k, v in action_character.abilities.items()
+                                  if getattr(v, "spell_level", 0) == 0}
+
+    result = simulate_encounters(action_character, sample_target, 200, max_rounds = 5, seed = 0)
+    assert len(result) == 200
+    assert (result.slots_spent == 0).all()
+    assert result.ability_counts.sum() > 0
+
+
+def test_nan_economy_scores_do_not_stop_acting(sample_character, sample_target):
+    plan = EncounterPlan(sample_character, sample_target, max_rounds = 3)
+    # A negative expected hit makes its economy score log(<0) = NaN
+    nan_idx = int(np.flatnonzero(plan.castable & (plan.action_time == "A"))[0])
+    plan.expected_hit = plan.expected_hit.copy()
+    plan.expected_hit[nan_idx] = -100
+    plan.utility = np.zeros_like(plan.utility)
+    assert np.isnan(plan.economy_scores(plan.initial_slots[None, :])[0, nan_idx])
+
+    _, round_damage, ability_counts, _ = simulate_encounter_chunk(plan, 100,
+                                                                  np.random.SeedSequence(0))
+    assert ability_counts[nan_idx] == 0
+    assert ability_counts.sum() > 0
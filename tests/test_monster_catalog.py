@@ -0,0 +1,33 @@
+import json
+import os
+
+from benchmark import synthetic_target
+from monster_catalog import MonsterCatalog, catalog_index_path, compile_catalog_index
+
+
+def write_catalog(catalog_path: str):
+    with open(catalog_path, "w") as f:
+        for i, cr in enumerate(["1/2", 3, 10]):
+            f.write(json.dumps(dict(synthetic_target, name = "monster %s" % i, cr = cr)) + "\n")
+    return catalog_path
+
+
+def test_compile_leaves_no_temporary_files(tmp_path):
+    catalog_path = write_catalog(str(tmp_path / "catalog.jsonl"))
+    compile_catalog_index(catalog_path)
+    assert sorted(os.listdir(tmp_path)) == ["catalog.index.npz", "catalog.jsonl"]
+
+
+def test_corrupt_index_is_recompiled(tmp_path):
+    catalog_path = write_catalog(str(tmp_path / "catalog.jsonl"))
+    index_path = compile_catalog_index(catalog_path)
+    with open(index_path, "rb") as f:
+        index_bytes = f.read()
+    with open(index_path, "wb") as f:
+        f.write(index_bytes[:len(index_bytes) // 2])
+
+    catalog = MonsterCatalog(catalog_path)
+    assert len(catalog) == 3
+    assert catalog.lookup("Monster 2") == 2
+    assert list(catalog.cr) == [0.5, 3, 10]
+    assert os.path.getsize(catalog_index_path(catalog_path)) == len(index_bytes)
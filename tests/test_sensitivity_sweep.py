@@ -0,0 +1,22 @@
+import pytest
+
+from sensitivity_sweep import sensitivity_sweep, swept_target
+
+
+def test_swept_resistance_clears_target_vulnerability(sample_character, sample_target):
+    assert sample_target.vulnerablities["Radiant"]
+    target = swept_target(sample_target, {"resistances": ["Radiant", "Necrotic"]})
+    assert target.resistances["Radiant"] and target.resistances["Necrotic"]
+    assert not target.vulnerablities["Radiant"] and not target.immunities["Necrotic"]
+    # The original target keeps its own RVI
+    assert sample_target.vulnerablities["Radiant"] and sample_target.immunities["Necrotic"]
+
+    result = sensitivity_sweep(sample_target, sample_character, "ehit",
+                               {"resistances": [["Radiant", "Necrotic"], []]})
+    assert result.values.shape == (2, len(sample_character.abilities))
+
+
+def test_conflicting_swept_rvi_is_rejected(sample_character, sample_target):
+    with pytest.raises(ValueError, match = "Fire"):
+        sensitivity_sweep(sample_target, sample_character, "ehit",
+                          {"resistances": [["Fire"]], "vulnerabilities": [["Fire"]]})
@@ -0,0 +1,24 @@
+import os
+
+from sheet_compiler import compile_action_sheet, compiled_sheet_path, compiled_sheet_rows, \
+    load_compiled_sheet_columns
+
+
+def test_compile_leaves_no_temporary_files(sample_sheet):
+    compile_action_sheet(sample_sheet)
+    assert sorted(os.listdir(os.path.dirname(sample_sheet))) == \
+        sorted([os.path.basename(sample_sheet), os.path.basename(compiled_sheet_path(sample_sheet))])
+
+
+def test_corrupt_compiled_sheet_is_recompiled(sample_sheet):
+    expected = load_compiled_sheet_columns(sample_sheet)
+    compiled_path = compiled_sheet_path(sample_sheet)
+    with open(compiled_path, "rb") as f:
+        compiled_bytes = f.read()
+    # Truncated after the header, as a crash mid-write would leave it
+    with open(compiled_path, "wb") as f:
+        f.write(compiled_bytes[:len(compiled_bytes) // 2])
+    os.utime(compiled_path)
+
+    sheet_columns = load_compiled_sheet_columns(sample_sheet)
+    assert list(compiled_sheet_rows(sheet_columns)) == list(compiled_sheet_rows(expected))
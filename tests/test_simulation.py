@@ -0,0 +1,20 @@
+import numpy as np
+
+from combat_simulator import simulate_encounters
+from simulation import simulate_abilities
+
+
+def test_simulate_abilities_accepts_seed_sequence(sample_character, sample_target):
+    ability_map = dict(list(sample_character.abilities.items())[:3])
+    by_int = simulate_abilities(ability_map, sample_target, 100, seed = 7)
+    by_sequence = simulate_abilities(ability_map, sample_target, 100,
+                                     seed = np.random.SeedSequence(7))
+    assert list(by_int) == list(ability_map)
+    assert all((by_int[x].samples == by_sequence[x].samples).all() for x in ability_map)
+
+
+def test_simulate_encounters_accepts_seed_sequence(sample_character, sample_target):
+    by_int = simulate_encounters(sample_character, sample_target, 50, seed = 7)
+    by_sequence = simulate_encounters(sample_character, sample_target, 50,
+                                      seed = np.random.SeedSequence(7))
+    assert (by_int.round_damage == by_sequence.round_damage).all()
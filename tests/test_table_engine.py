@@ -0,0 +1,29 @@
+import warnings
+
+import numpy as np
+import pytest
+
+from hit_calculations import build_hit_stat_table
+from table_engine import IncrementalStatTables, accepted_stats
+
+
+@pytest.mark.parametrize("stat", accepted_stats)
+def test_vectorized_tables_match_scalar(sample_character, sample_target, stat):
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        scalar = build_hit_stat_table(sample_target, sample_character, stat, vectorized = False)
+        vectorized = build_hit_stat_table(sample_target, sample_character, stat)
+
+    assert vectorized.ability_names == scalar.ability_names
+    assert (vectorized.check_values == scalar.check_values).all()
+    np.testing.assert_allclose(vectorized.values, scalar.values, equal_nan = True)
+
+
+def test_incremental_tables_match_scalar(sample_character, sample_target):
+    builder = IncrementalStatTables()
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        builder.update(target = sample_target, action_character = sample_character)
+        for stat in accepted_stats:
+            scalar = build_hit_stat_table(sample_target, sample_character, stat, vectorized = False)
+            np.testing.assert_allclose(builder.arrays[stat], scalar.values, equal_nan = True)
@@ -0,0 +1,162 @@
+from character import Character
+from combat_simulator import turn_budgets
+import heapq
+import itertools
+import numpy as np
+from table_engine import build_target_stat_row, character_columns
+
+accepted_plan_stats = ['ehit', 'econ']
+
+
+def top_k_sums(value_lists: list[np.ndarray], k: int):
+    # k largest sums picking one entry from each descending-sorted list.
+    # Best-first search over index tuples, so only O(k * n_lists) candidates
+    # are ever generated instead of the full product.
+    if any([len(x) == 0 for x in value_lists]) or k <= 0:
+        return []
+
+    start = (0,) * len(value_lists)
+    frontier = [(-sum([x[0] for x in value_lists]), start)]
+    seen = {start}
+    best_sums = []
+    while frontier and len(best_sums) < k:
+        neg_sum, idx = heapq.heappop(frontier)
+        best_sums.append((-neg_sum, idx))
+        for list_idx in range(len(value_lists)):
+            if idx[list_idx] + 1 >= len(value_lists[list_idx]):
+                continue
+            next_idx = idx[:list_idx] + (idx[list_idx] + 1,) + idx[list_idx + 1:]
+            if next_idx in seen:
+                continue
+            seen.add(next_idx)
+            next_sum = -neg_sum - value_lists[list_idx][idx[list_idx]] + \
+                value_lists[list_idx][idx[list_idx] + 1]
+            heapq.heappush(frontier, (-next_sum, next_idx))
+
+    return best_sums
+
+
+def sorted_options(values: np.ndarray, ability_idx: np.ndarray, k: int,
+                   include_empty: bool = False):
+    # Top k abilities of one group, best first. An empty choice is worth 0.
+    option_values = list(values[ability_idx])
+    option_idx = list(ability_idx)
+    if include_empty:
+        option_values.append(0)
+        option_idx.append(-1)
+
+    order = np.argsort(option_values, kind = "stable")[::-1][:k]
+    return np.array(option_values, dtype = float)[order], np.array(option_idx, dtype = int)[order]
+
+
+def plan_inputs(action_character: Character,
+                target: Character,
+                stat: str,
+                scarcity_coeff: float = 0.45):
+    # Per ability: stat value, action time, whether it spends a slot and
+    # whether it can be used this turn
+    columns = character_columns(action_character)
+    values = build_target_stat_row(target, action_character, stat,
+                                   scarcity_coeff = scarcity_coeff,
+                                   columns = columns)
+
+    action_time = np.array([x.action_time for x in columns.actions])
+    has_uses = np.array([x.n_uses is None or x.n_uses > 0 for x in columns.actions], dtype = bool)
+    slots_left = {level: x.n_remaining() for level, x in action_character.spellslots.items()}
+    leveled = columns.spell_level > 0
+    castable = np.array([x == 0 or slots_left.get(x, 0) > 0 for x in columns.spell_level])
+    usable = has_uses & castable & np.isfinite(values)
+    return columns, values, action_time, leveled, usable
+
+
+def plan_turns(action_character: Character,
+               target: Character,
+               stat: str = "ehit",
+               k: int = 5,
+               scarcity_coeff: float = 0.45):
+    # Best full turns of one Action, one Bonus Action and one Reaction (any of
+    # which may go unused), scored by the sum of the per-ability stat. At most
+    # one ability that spends a spell slot is allowed, and only if a slot of
+    # its level is left, so the search splits into "no slotted spell" plus one
+    # case per budget holding the slotted spell, each a top-k sum over that
+    # budget's sorted options.
+    if stat not in accepted_plan_stats:
+        raise ValueError("stat must be one of %s." % accepted_plan_stats)
+
+    columns, values, action_time, leveled, usable = plan_inputs(action_character, target, stat,
+                                                                scarcity_coeff)
+
+    # An unused budget is worth 0. econ values are log((ehit + utility) / cost),
+    # so for econ plans skipping a budget scores as a ratio of 1: an ability
+    # whose ratio is below 1 (econ < 0) ranks below leaving its budget unused,
+    # so it only shows up in plans after every plan that skips it instead.
+    free_options = {}
+    leveled_options = {}
+    for budget in turn_budgets:
+        budget_mask = usable & (action_time == budget)
+        free_options[budget] = sorted_options(values, np.flatnonzero(budget_mask & ~leveled),
+                                              k, include_empty = True)
+        leveled_options[budget] = sorted_options(values, np.flatnonzero(budget_mask & leveled), k)
+
+    candidate_plans = []
+    cases = [None] + turn_budgets
+    for leveled_budget in cases:
+        case_options = [leveled_options[x] if x == leveled_budget else free_options[x]
+                        for x in turn_budgets]
+        for plan_value, option_idx in top_k_sums([x[0] for x in case_options], k):
+            plan_abilities = tuple(int(case_options[i][1][j]) for i, j in enumerate(option_idx))
+            candidate_plans.append((plan_value, plan_abilities))
+
+    candidate_plans.sort(key = lambda x: -x[0])
+    return [dict({"value": plan_value},
+                 **{budget: None if ability_idx < 0 else columns.names[ability_idx]
+                    for budget, ability_idx in zip(turn_budgets, plan_abilities)})
+            for plan_value, plan_abilities in candidate_plans[:k]]
+
+
+def brute_force_plan_values(action_character: Character,
+                            target: Character,
+                            stat: str = "ehit",
+                            k: int = 5,
+                            scarcity_coeff: float = 0.45):
+    # Values of the k best turns by trying every combination, with the same
+    # rules as plan_turns. Only meant for checking plan_turns on small sheets.
+    if stat not in accepted_plan_stats:
+        raise ValueError("stat must be one of %s." % accepted_plan_stats)
+
+    _, values, action_time, leveled, usable = plan_inputs(action_character, target, stat,
+                                                          scarcity_coeff)
+    budget_choices = []
+    for budget in turn_budgets:
+        budget_choices.append(list(np.flatnonzero(usable & (action_time == budget))) + [-1])
+
+    plan_values = [sum([values[x] for x in plan if x >= 0])
+                   for plan in itertools.product(*budget_choices)
+                   if sum([leveled[x] for x in plan if x >= 0]) <= 1]
+    return sorted(plan_values, reverse = True)[:k]
+
+
+if __name__ == "__main__":
+    import argparse
+    from party_evaluator import load_party, load_targets
+    import warnings
+
+    parser = argparse.ArgumentParser(description = "Check plan_turns against trying every turn.")
+    parser.add_argument("targets", help = "JSON file with one target stat block or a list.")
+    parser.add_argument("--characters", nargs = "+",
+                        help = "Character sheet names, default every available sheet.")
+    parser.add_argument("-k", type = int, default = 5)
+    args = parser.parse_args()
+
+    warnings.simplefilter("ignore", RuntimeWarning)
+    n_mismatches = 0
+    for character_name, action_character in load_party(args.characters).items():
+        for target in load_targets(args.targets):
+            for stat in accepted_plan_stats:
+                planned = [x["value"] for x in plan_turns(action_character, target, stat, args.k)]
+                expected = brute_force_plan_values(action_character, target, stat, args.k)
+                if len(planned) != len(expected) or not np.allclose(planned, expected):
+                    n_mismatches += 1
+                    print("%s vs %s, %s: planned %s, expected %s" %
+                          (character_name, target.name, stat, planned, expected))
+    print("%s mismatches." % n_mismatches)